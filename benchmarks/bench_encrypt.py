@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Crypto throughput benchmarks for crpt.core.encrypt.
+
+Times key derivation and every registered encryption mode over a range of
+file sizes, reporting MB/s, per-call latency and peak RSS. Each mode/size
+case runs in a fresh process so its peak RSS is not polluted by earlier
+cases. Results are written as JSON for comparison between releases.
+
+Usage:
+    python benchmarks/bench_encrypt.py [--max-size 1G] [--modes file,stream]
+                                       [--data random|text]
+                                       [--output bench_encrypt.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from crpt.core import encrypt
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SIZES = [
+    ("1K", 1024),
+    ("64K", 64 * 1024),
+    ("1M", 1024 * 1024),
+    ("16M", 16 * 1024 * 1024),
+    ("256M", 256 * 1024 * 1024),
+    ("1G", 1024 * 1024 * 1024),
+]
+OBJECT_ID = "0" * 40
+WRITE_CHUNK = 4 * 1024 * 1024
+# Repeat small cases until roughly this many bytes have been processed
+TARGET_BYTES = 32 * 1024 * 1024
+MAX_CALLS = 1000
+
+
+def bench_legacy(path, master_key):
+    """Per-blob PBKDF2 + AES-CBC, as objects were written before format v1."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    salt = os.urandom(encrypt.SALT_SIZE)
+    key = encrypt.derive_key(OBJECT_ID, salt)
+    encrypted_data, iv = encrypt.encrypt_data(content, key)
+    blob = salt + iv + encrypted_data
+    yield "encrypt"
+    encrypt.decrypt_file_content(blob, OBJECT_ID)
+    yield "decrypt"
+
+
+def bench_file(path, master_key):
+    """Whole-buffer encrypt_file_content/decrypt_file_content with a cached master key."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    blob = encrypt.encrypt_file_content(content, OBJECT_ID, master_key)
+    yield "encrypt"
+    encrypt.decrypt_file_content(blob, OBJECT_ID, master_key)
+    yield "decrypt"
+
+
+def bench_stream(path, master_key):
+    """File-to-file encrypt_stream/decrypt_stream with bounded memory."""
+    fd, object_path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        with open(path, 'rb') as src, open(object_path, 'wb') as dst:
+            encrypt.encrypt_stream(src, dst, OBJECT_ID, master_key)
+        yield "encrypt"
+        with open(object_path, 'rb') as src, open(os.devnull, 'wb') as dst:
+            encrypt.decrypt_stream(src, dst, OBJECT_ID, master_key)
+        yield "decrypt"
+    finally:
+        os.remove(object_path)
+
+
+def bench_zlib(path, master_key):
+    """File-to-file streaming with zlib compression before encryption."""
+    fd, object_path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        with open(path, 'rb') as src, open(object_path, 'wb') as dst:
+            encrypt.encrypt_stream(src, dst, OBJECT_ID, master_key, compression="zlib")
+        yield "encrypt"
+        with open(object_path, 'rb') as src, open(os.devnull, 'wb') as dst:
+            encrypt.decrypt_stream(src, dst, OBJECT_ID, master_key)
+        yield "decrypt"
+    finally:
+        os.remove(object_path)
+
+
+# Mode name -> generator that yields after each timed operation
+MODES = {
+    "legacy": bench_legacy,
+    "file": bench_file,
+    "stream": bench_stream,
+    "zlib": bench_zlib,
+}
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_case(mode, path, size, master_key):
+    """Run one mode over one input file; executed in a child process."""
+    calls = max(1, min(MAX_CALLS, TARGET_BYTES // size))
+    if mode == "legacy":
+        # Each call pays a full PBKDF2 run; a handful is enough
+        calls = min(calls, 5)
+
+    totals = {}
+    for _ in range(calls):
+        start = time.perf_counter()
+        for operation in MODES[mode](path, master_key):
+            now = time.perf_counter()
+            totals[operation] = totals.get(operation, 0.0) + (now - start)
+            start = now
+
+    results = []
+    for operation, seconds in totals.items():
+        per_call = seconds / calls
+        results.append({
+            "mode": mode,
+            "operation": operation,
+            "size": size,
+            "calls": calls,
+            "seconds_per_call": per_call,
+            "mb_per_s": (size / (1024 * 1024)) / per_call if per_call else None,
+        })
+    rss = peak_rss_kb()
+    for result in results:
+        result["peak_rss_kb"] = rss
+    return results
+
+
+def _case_worker(queue, mode, path, size, master_key):
+    queue.put(run_case(mode, path, size, master_key))
+
+
+def run_isolated(mode, path, size, master_key):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_case_worker, args=(queue, mode, path, size, master_key))
+    process.start()
+    results = queue.get()
+    process.join()
+    return results
+
+
+def bench_kdf(calls=20):
+    salt = os.urandom(encrypt.SALT_SIZE)
+    master_key = os.urandom(encrypt.KEY_SIZE)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        encrypt.derive_key(OBJECT_ID, salt)
+    pbkdf2 = (time.perf_counter() - start) / calls
+
+    hkdf_calls = calls * 1000
+    start = time.perf_counter()
+    for _ in range(hkdf_calls):
+        encrypt.derive_object_key(master_key, salt, OBJECT_ID)
+    hkdf = (time.perf_counter() - start) / hkdf_calls
+
+    return [
+        {"function": "derive_key", "calls": calls, "seconds_per_call": pbkdf2},
+        {"function": "derive_object_key", "calls": hkdf_calls, "seconds_per_call": hkdf},
+    ]
+
+
+def text_block(size):
+    """Compressible, source-like filler."""
+    line = b"    value_%08d = compute(value_%08d, offset=%d)\n"
+    out = bytearray()
+    i = 0
+    while len(out) < size:
+        out += line % (i, i * 7 % 100000, i % 4096)
+        i += 1
+    return bytes(out[:size])
+
+
+def write_input(size, data="random"):
+    fd, path = tempfile.mkstemp(prefix="crpt-bench-")
+    with os.fdopen(fd, 'wb') as f:
+        remaining = size
+        while remaining:
+            n = min(WRITE_CHUNK, remaining)
+            chunk = os.urandom(n) if data == "random" else text_block(n)
+            f.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    if text and text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crpt encryption throughput")
+    parser.add_argument('--max-size', default="1G", help="Largest input size to run (default: 1G)")
+    parser.add_argument('--modes', default=",".join(MODES), help=f"Comma-separated modes (available: {', '.join(MODES)})")
+    parser.add_argument('--data', choices=["random", "text"], default="random",
+                        help="Input content: incompressible random bytes or compressible text")
+    parser.add_argument('--output', default="bench_encrypt.json", help="JSON results file")
+    args = parser.parse_args()
+
+    max_size = parse_size(args.max_size)
+    modes = [m for m in args.modes.split(",") if m]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode '{mode}'")
+
+    master_key = os.urandom(encrypt.KEY_SIZE)
+    report = {
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "data": args.data,
+        "kdf": bench_kdf(),
+        "results": [],
+    }
+    for entry in report["kdf"]:
+        print(f"{entry['function']:<20} {entry['seconds_per_call'] * 1e6:12.1f} us/call")
+
+    print(f"\n{'mode':<10} {'op':<8} {'size':>6} {'MB/s':>10} {'ms/call':>10} {'peak RSS MB':>12}")
+    for label, size in SIZES:
+        if size > max_size:
+            continue
+        path = write_input(size, args.data)
+        try:
+            for mode in modes:
+                for result in run_isolated(mode, path, size, master_key):
+                    report["results"].append(result)
+                    rss = result["peak_rss_kb"]
+                    print(f"{mode:<10} {result['operation']:<8} {label:>6} "
+                          f"{result['mb_per_s']:10.1f} {result['seconds_per_call'] * 1000:10.2f} "
+                          f"{(rss / 1024 if rss is not None else float('nan')):12.1f}")
+        finally:
+            os.remove(path)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,55 @@
 import os
-
-REFS_DIR = ".crpt/refs/heads"
-
-def ensure_refs_dir():
-    os.makedirs(REFS_DIR, exist_ok=True)
+import sys
+from . import refs
 
 def get_current_branch():
-    if not os.path.exists('.crpt/HEAD'):
-        return None
-    with open('.crpt/HEAD', 'r') as f:
-        ref = f.read().strip()
-    if ref.startswith("refs/heads/"):
-        return ref[len("refs/heads/"):]
-    return ref
+    return refs.current_branch() or refs.head_ref()
 
 def list_branches():
-    ensure_refs_dir()
-    branches = os.listdir(REFS_DIR)
     current = get_current_branch()
-    for b in branches:
+    lines = []
+    for ref in refs.list_refs(refs.HEADS):
+        b = ref[len(refs.HEADS):]
         prefix = "*" if b == current else " "
-        print(f"{prefix} {b}")
+        lines.append(f"{prefix} {b}\n")
+    sys.stdout.write("".join(lines))
 
 def create_branch(branch_name):
-    ensure_refs_dir()
+    if not os.path.exists(refs.HEAD_FILE):
+        print("Repository not initialized.")
+        return
 
-    # Get current HEAD commit
-    current = get_current_branch()
-    head_path = f"{REFS_DIR}/{branch_name}"
+    if not refs.valid_branch_name(branch_name):
+        print(f"❌ '{branch_name}' is not a valid branch name.")
+        return
 
-    if os.path.exists(head_path):
+    ref = f"{refs.HEADS}{branch_name}"
+    if refs.ref_exists(ref):
         print(f"Branch '{branch_name}' already exists.")
         return
-
-    if not os.path.exists('.crpt/HEAD'):
-        print("Repository not initialized.")
+    conflict = refs.conflicting_ref(ref)
+    if conflict:
+        print(f"❌ Cannot create branch '{branch_name}': branch '{conflict[len(refs.HEADS):]}' exists.")
         return
 
-    with open('.crpt/HEAD', 'r') as f:
-        current_ref = f.read().strip()
+    # Get current HEAD commit
+    current_commit = refs.resolve_head()
+    refs.update_ref(ref, current_commit)
+
+    # Thousands of loose refs make listing slow, so fold them into packed-refs
+    if refs.loose_count() > refs.LOOSE_REFS_LIMIT:
+        refs.pack_refs()
 
-    current_commit = None
-    if current_ref.startswith("refs/heads/"):
-        ref_path = f".crpt/{current_ref}"
-        if os.path.exists(ref_path):
-            with open(ref_path, 'r') as rf:
-                current_commit = rf.read().strip()
-    else:
-        current_commit = current_ref
+    print(f"Created branch '{branch_name}'")
 
-    with open(head_path, 'w') as f:
-        if current_commit:
-            f.write(current_commit)
+def delete_branch(branch_name):
+    ref = f"{refs.HEADS}{branch_name}"
+    if not refs.ref_exists(ref):
+        print(f"Branch '{branch_name}' does not exist.")
+        return
+    if branch_name == refs.current_branch():
+        print(f"❌ Cannot delete the current branch '{branch_name}'.")
+        return
 
-    print(f"Created branch '{branch_name}'")
\ No newline at end of file
+    refs.delete_ref(ref)
+    print(f"Deleted branch '{branch_name}'")
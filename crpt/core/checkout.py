@@ -1,39 +1,118 @@
 import os
-import shutil
-import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from . import fetch, index, refs, utils, worktree
+from .encrypt import get_or_create_encryption_key
+from .ignore import load_sparse
 
-REFS_DIR = ".crpt/refs/heads"
+def _disk_hash(path, entries):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return path, None
+    return path, entries.cached_hash(path, st) or utils.hash_file(path)
 
-def hash_file(file_path):
-    with open(file_path, 'rb') as f:
-        return hashlib.sha1(f.read()).hexdigest()
+def _local_changes(changes, entries, jobs):
+    """Paths whose working copy matches neither the current nor the target commit."""
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        on_disk = dict(pool.map(lambda path: _disk_hash(path, entries), [path for path, _, _ in changes]))
 
-def checkout_branch(branch_name):
-    branch_path = f"{REFS_DIR}/{branch_name}"
-    if not os.path.exists(branch_path):
-        print(f"Branch '{branch_name}' does not exist.")
-        return
+    conflicts = []
+    for path, old_hash, new_hash in changes:
+        disk_hash = on_disk[path]
+        if disk_hash is None or disk_hash in (old_hash, new_hash):
+            continue
+        conflicts.append(path)
+    return conflicts
+
+def _wrong_key():
+    print("❌ Could not decrypt the commit's files: this repository has a different encryption key.")
+    print("Run 'crpt key export' in a clone that can read them and 'crpt key import <key>' here.")
 
-    with open(branch_path, 'r') as f:
-        commit_id = f.read().strip()
+def checkout_branch(branch_name, jobs=None):
+    commit_id = refs.read_ref(f"refs/heads/{branch_name}")
+    if commit_id is None:
+        if refs.ref_exists(f"refs/heads/{branch_name}"):
+            print(f"Branch '{branch_name}' has no commits yet.")
+        else:
+            print(f"Branch '{branch_name}' does not exist.")
+        return
 
     # Load commit data
-    commit_meta = f".crpt/commits/{commit_id}/meta.txt"
-    if not os.path.exists(commit_meta):
+    meta = utils.read_commit_meta(commit_id)
+    if meta is None:
         print(f"Commit data for {commit_id[:7]} is missing.")
         return
 
-    # Clear working directory (simplified: just overwrite files)
-    with open(commit_meta, 'r') as meta:
-        for line in meta:
-            if ":" in line and not line.startswith("Message"):
-                file_path, file_hash = line.strip().split(":")
-                blob = f".crpt/objects/{file_hash}"
-                if os.path.exists(blob):
-                    shutil.copy2(blob, file_path)
+    entries = index.read_index()
+    if entries is None:
+        print("Repository not initialized.")
+        return
+
+    result = update_working_tree(utils.resolve_head(), commit_id, entries, jobs)
+    if result is None:
+        return
+    updated, removed = result
 
     # Update HEAD
-    with open('.crpt/HEAD', 'w') as f:
-        f.write(f"refs/heads/{branch_name}")
+    refs.set_head(f"refs/heads/{branch_name}")
+
+    print(f"Switched to branch '{branch_name}' ({updated} updated, {removed} removed)")
+
+def update_working_tree(old_commit, new_commit, entries, jobs=None, allow_deletes=True):
+    """
+    Bring the working tree from old_commit to new_commit, touching only the
+    files that differ and, with a .crpt/sparse file, only the paths it
+    selects. Missing objects of a partial clone are fetched in one batch.
+
+    Returns (files written, files removed), or None if local changes would
+    be overwritten, missing objects could not be fetched, or the objects
+    cannot be decrypted with this repository's key. The index stat cache is updated for the written files.
+    """
+    # Only files that differ between the current and the target commit are touched
+    jobs = jobs or worktree.default_jobs()
+    try:
+        changes = utils.diff_commits(old_commit, new_commit)
+    except (FileNotFoundError, RuntimeError, requests.RequestException) as e:
+        print("❌ Could not read the commit's files:", e)
+        return None
+    except InvalidTag:
+        _wrong_key()
+        return None
+    sparse = load_sparse()
+    if sparse is not None:
+        changes = [change for change in changes if sparse.match_with_parents(change[0])]
+    if not allow_deletes:
+        changes = [change for change in changes if change[2]]
+
+    conflicts = _local_changes(changes, entries, jobs)
+    staged = {entry.path for entry in entries.staged()}
+    conflicts += [path for path, _, _ in changes if path in staged and path not in conflicts]
+    if conflicts:
+        print("❌ Your local changes to the following files would be overwritten:")
+        for path in sorted(conflicts):
+            print(f"  {path}")
+        print("Commit them or remove them first.")
+        return None
+
+    encryption_key = get_or_create_encryption_key()
+    writes = {path: new_hash for path, old_hash, new_hash in changes if new_hash}
+    deletes = [path for path, old_hash, new_hash in changes if not new_hash]
+    try:
+        fetch.ensure_contents(writes.values(), encryption_key)
+        written = worktree.materialize(writes, deletes, encryption_key, jobs)
+    except (FileNotFoundError, RuntimeError, requests.RequestException) as e:
+        print("❌ Could not fetch the commit's files:", e)
+        return None
+    except InvalidTag:
+        _wrong_key()
+        return None
 
-    print(f"Switched to branch '{branch_name}'")
\ No newline at end of file
+    # The freshly written files are clean, so record them in the stat cache
+    for path in deletes:
+        entries.pop(path, None)
+    for path, st in written.items():
+        entries[path] = index.make_entry(path, st, writes[path])
+    index.write_index(entries)
+    return len(writes), len(deletes)
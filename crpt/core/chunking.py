@@ -0,0 +1,167 @@
+"""
+Content-defined chunking for large files.
+
+Files at or above core.chunkThreshold bytes are split at content-defined
+cut points, with FastCDC-style normalized chunk sizes, into chunks that
+are stored as their own objects, keyed by the SHA-1 of the chunk. The
+file's object is then a manifest listing its chunks. Cut points depend
+only on nearby content, so an edit only changes the chunks around it and
+every other chunk is reused from earlier versions or other files.
+"""
+
+import io
+import os
+import hashlib
+from . import config, objects
+from .compress import CODEC_NONE, choose_codec, resolve_codec
+from .encrypt import encrypt_stream, decrypt_stream, object_flags, FLAG_MANIFEST, HEADER_SIZE
+
+DEFAULT_CHUNK_THRESHOLD = 1024 * 1024
+MIN_SIZE = 16 * 1024
+AVG_SIZE = 64 * 1024
+MAX_SIZE = 256 * 1024
+READ_SIZE = 4 * MAX_SIZE
+
+# Each cut-point bit is hashed from the last 4 bytes: every byte goes
+# through a fixed pseudo-random permutation and the bit is the XOR of bit
+# 7 - k of the value k bytes back, for k = 0..3
+HISTORY = 3
+
+def _byte_table():
+    # Fixed so chunk boundaries are stable across runs
+    return bytes(sorted(range(256), key=lambda i: hashlib.sha256(bytes([i])).digest()))
+
+TABLE = _byte_table()
+TOP_BIT = bytes(i >> 7 for i in range(256))
+# Normalized chunking: a longer run of 1 bits is needed to cut before
+# AVG_SIZE, a shorter one after it
+RUN_S = b"\x01" * 17
+RUN_L = b"\x01" * 13
+
+def chunk_threshold():
+    return config.get_int("core", "chunkThreshold", DEFAULT_CHUNK_THRESHOLD)
+
+def _window_bits(data, history):
+    """
+    Map every byte of data to a 0 or 1 byte hashed from it and the HISTORY
+    bytes before it, which history holds.
+
+    The buffer is handled as one big integer, so the work is a translate,
+    two shifts and two XORs, all at C speed. Shifting by 7 * k bits lines
+    up bit 7 - k of the value k bytes back with bit 7 of the current one.
+    """
+    mixed = int.from_bytes((history + data).translate(TABLE), "big")
+    mixed ^= mixed >> 7
+    mixed ^= mixed >> 14
+    return mixed.to_bytes(HISTORY + len(data), "big")[HISTORY:].translate(TOP_BIT)
+
+def _cut_point(bits, start, end):
+    """
+    Return the end of the chunk starting at start, given the window bits of
+    the buffer.
+
+    A chunk ends after the first run of len(RUN_S) 1 bits before AVG_SIZE,
+    or of len(RUN_L) after it. Both searches are bytes.find calls.
+    """
+    if end - start <= MIN_SIZE:
+        return end
+    normal = min(start + AVG_SIZE, end)
+    limit = min(start + MAX_SIZE, end)
+    i = bits.find(RUN_S, start + MIN_SIZE - len(RUN_S) + 1, normal)
+    if i >= 0:
+        return i + len(RUN_S)
+    i = bits.find(RUN_L, normal - len(RUN_L) + 1, limit)
+    if i >= 0:
+        return i + len(RUN_L)
+    return limit
+
+def iter_chunks(reader):
+    buf = b""
+    bits = b""
+    history = bytes(HISTORY)
+    pos = 0
+    eof = False
+    while True:
+        if not eof and len(buf) - pos < MAX_SIZE:
+            data = reader.read(READ_SIZE)
+            if data:
+                buf = buf[pos:] + data
+                bits = bits[pos:] + _window_bits(data, history)
+                history = buf[-HISTORY:].rjust(HISTORY, b"\0")
+                pos = 0
+                continue
+            eof = True
+        if pos >= len(buf):
+            return
+        cut = _cut_point(bits, pos, len(buf))
+        yield buf[pos:cut]
+        pos = cut
+
+def _write_object(object_hash, content, encryption_key, compression=None):
+    fd, tmp_path = objects.new_temp()
+    try:
+        with os.fdopen(fd, 'wb') as dst:
+            encrypt_stream(io.BytesIO(content), dst, object_hash, encryption_key, compression=compression)
+        objects.publish(tmp_path, object_hash)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def store_chunks(file_path, encryption_key, compression=None):
+    """
+    Chunk a file, storing chunks that are not already present.
+
+    Returns the file's content hash and the plaintext manifest for it.
+    """
+    file_sha = hashlib.sha1()
+    lines = []
+    probed = False
+    with open(file_path, 'rb') as src:
+        for chunk in iter_chunks(src):
+            file_sha.update(chunk)
+            chunk_hash = hashlib.sha1(chunk).hexdigest()
+            lines.append(f"{chunk_hash} {len(chunk)}\n")
+            if not objects.has_object(chunk_hash):
+                if not probed:
+                    # Probe once per file rather than once per chunk: the chunks
+                    # of media and archives are all incompressible
+                    probed = True
+                    if choose_codec(chunk, resolve_codec(compression)) == CODEC_NONE:
+                        compression = "none"
+                _write_object(chunk_hash, chunk, encryption_key, compression)
+    return file_sha.hexdigest(), "".join(lines).encode()
+
+def is_manifest(object_hash):
+    # Only whole-file objects are ever stored as pack deltas
+    if objects.is_delta(object_hash):
+        return False
+    with objects.open_object(object_hash) as f:
+        return bool(object_flags(f.read(HEADER_SIZE + 1)) & FLAG_MANIFEST)
+
+def read_manifest(object_hash, encryption_key):
+    out = io.BytesIO()
+    with objects.open_object(object_hash) as f:
+        decrypt_stream(f, out, object_hash, encryption_key)
+    entries = []
+    for line in out.getvalue().decode().splitlines():
+        chunk_hash, size = line.split()
+        entries.append((chunk_hash, int(size)))
+    return entries
+
+def restore_object(object_hash, writer, encryption_key):
+    """Decrypt an object into writer, reassembling it if it is chunked."""
+    if objects.is_delta(object_hash):
+        content = objects.read_plaintext(object_hash, encryption_key)
+        writer.write(content)
+        return len(content)
+
+    if not is_manifest(object_hash):
+        with objects.open_object(object_hash) as f:
+            return decrypt_stream(f, writer, object_hash, encryption_key)
+
+    total = 0
+    for chunk_hash, _ in read_manifest(object_hash, encryption_key):
+        with objects.open_object(chunk_hash) as f:
+            total += decrypt_stream(f, writer, chunk_hash, encryption_key)
+    return total
@@ -0,0 +1,108 @@
+"""
+Shared HTTP client for talking to the remote.
+
+Every request goes through one keep-alive requests.Session per process,
+so push, pull and object fetches reuse connections instead of opening
+one per call. Independent requests (object batches, upload chunks) run
+in parallel through map(), at most remote.concurrency at a time.
+Connection errors, timeouts and 502/503/504 answers are retried with
+exponential backoff unless the request body cannot be sent twice.
+
+Settings are read from .crpt/config:
+
+    [remote]
+    url = http://127.0.0.1:8000/
+    repo = default
+    timeout = 30        ; seconds to wait for the server to answer
+    retries = 3
+    concurrency = 8
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from . import config
+
+DEFAULT_URL = "http://127.0.0.1:8000/"
+DEFAULT_REPO = "default"
+DEFAULT_TIMEOUT = 30
+CONNECT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_CONCURRENCY = 8
+BACKOFF = 0.5
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def base_url():
+    return config.get("remote", "url", DEFAULT_URL)
+
+def repo_name():
+    return config.get("remote", "repo", DEFAULT_REPO)
+
+def url(path):
+    return base_url().rstrip("/") + "/" + path.lstrip("/")
+
+def timeout():
+    read_timeout = config.get_int("remote", "timeout", DEFAULT_TIMEOUT)
+    return (min(CONNECT_TIMEOUT, read_timeout), read_timeout)
+
+def retries():
+    return max(0, config.get_int("remote", "retries", DEFAULT_RETRIES))
+
+def concurrency():
+    return max(1, config.get_int("remote", "concurrency", DEFAULT_CONCURRENCY))
+
+def session():
+    """The process-wide session, with a connection pool as large as the concurrency limit."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency())
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def request(method, path, retry=True, **kwargs):
+    """
+    Send a request to path on the remote and return the response.
+
+    With retry, connection errors, timeouts and RETRY_STATUSES are retried
+    up to remote.retries times; pass retry=False for bodies that are
+    generators and cannot be replayed.
+    """
+    kwargs.setdefault("timeout", timeout())
+    attempts = retries() + 1 if retry else 1
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            response = session().request(method, url(path), **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if last:
+                raise
+        else:
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+            response.close()
+        time.sleep(BACKOFF * 2 ** attempt)
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+def put(path, **kwargs):
+    return request("PUT", path, **kwargs)
+
+def map_parallel(function, items):
+    """Call function on every item, at most remote.concurrency at a time; returns the results in order."""
+    items = list(items)
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency(), len(items))) as pool:
+        return list(pool.map(function, items))
@@ -1,88 +1,221 @@
 import os
+import io
 import hashlib
 import time
 import shutil
-from .encrypt import encrypt_file_content, get_or_create_encryption_key
-
-def hash_file(file_path):
-    with open(file_path, 'rb') as f:
-        return hashlib.sha1(f.read()).hexdigest()
-
-def create_commit(message):
-    if not os.path.exists('.crpt/index'):
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from . import config, chunking, commit_graph, durable, objects, refs, utils, index, tree
+from .compress import DEFAULT_CODEC_NAME
+from .encrypt import encrypt_stream, get_or_create_encryption_key, FLAG_MANIFEST
+from .utils import HashingReader
+
+def resolve_jobs(jobs=None):
+    if jobs is None:
+        jobs = config.get_int("core", "jobs", os.cpu_count() or 1)
+    return max(1, jobs)
+
+def store_file(file, file_hash, encryption_key, threshold, compression):
+    """
+    Encrypt one file into a temporary object, reading it only once; runs in a worker.
+
+    When the hash is not known yet, the file is hashed while it is encrypted
+    and the object is named once the last byte has been read.
+    """
+    # Content we already have is never re-encrypted
+    if file_hash is not None and objects.has_object(file_hash):
+        return file, file_hash, None
+
+    manifest = None
+    if os.path.getsize(file) >= threshold:
+        # Large files become a manifest of deduplicated chunk objects; the
+        # chunker hashes the whole file as it goes
+        file_hash, manifest = chunking.store_chunks(file, encryption_key, compression)
+        if objects.has_object(file_hash):
+            return file, file_hash, None
+
+    fd, tmp_path = objects.new_temp()
+    try:
+        # Stream the file through the segmented encryptor into the object,
+        # with a per-object key derived from the repository key
+        with os.fdopen(fd, 'wb') as dst:
+            if manifest is not None:
+                encrypt_stream(io.BytesIO(manifest), dst, file_hash, encryption_key,
+                               flags=FLAG_MANIFEST, compression=compression)
+            elif file_hash is not None:
+                with open(file, 'rb') as src:
+                    encrypt_stream(src, dst, file_hash, encryption_key, compression=compression)
+            else:
+                with open(file, 'rb') as src:
+                    reader = HashingReader(src)
+                    encrypt_stream(reader, dst, None, encryption_key, compression=compression,
+                                   object_id=reader.hexdigest)
+                file_hash = reader.hexdigest()
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if objects.has_object(file_hash):
+        # Same content as an existing object after all
+        os.remove(tmp_path)
+        return file, file_hash, None
+    return file, file_hash, tmp_path
+
+def _store_file_task(*args):
+    # Chunk objects are published inside the worker; report them so the
+    # parent can sync them with everything else
+    return store_file(*args), objects.take_published()
+
+def store_files(files, encryption_key, jobs):
+    """
+    Store (path, known hash or None) pairs; returns (path, hash, tmp_path)
+    in the same order, plus the object paths workers already published.
+    """
+    threshold = chunking.chunk_threshold()
+    compression = config.get("core", "compression", DEFAULT_CODEC_NAME)
+    paths = [file for file, _ in files]
+    hashes = [file_hash for _, file_hash in files]
+    if jobs == 1 or len(files) < 2:
+        return [store_file(file, file_hash, encryption_key, threshold, compression) for file, file_hash in files], []
+
+    # Hashing and PBKDF2/AES hold the GIL in places, so use processes.
+    # map() yields results in submission order regardless of completion order.
+    stored = []
+    published = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as pool:
+        n = len(files)
+        for result, paths_published in pool.map(_store_file_task, paths, hashes, [encryption_key] * n,
+                                                [threshold] * n, [compression] * n):
+            stored.append(result)
+            published.extend(paths_published)
+    return stored, published
+
+def create_commit(message, jobs=None):
+    """
+    Commit the staged files as one transaction.
+
+    Objects and the commit directory are written under temporary names and
+    renamed into place, then made durable with a single sync. Only after
+    that is the branch ref replaced atomically, so a crash at any point
+    leaves the ref on a complete commit. Leftovers of earlier crashes are
+    cleaned up first.
+    """
+    if index.read_index() is None:
         print("Repository not initialized.")
         return
 
-    with open('.crpt/index', 'r') as f:
-        staged_files = f.read().splitlines()
-
-    if not staged_files:
+    if not durable.acquire_lock():
+        print(f"❌ Another crpt process is committing (remove {durable.LOCK_FILE} if it crashed).")
+        return
+    try:
+        durable.recover()
+        _create_commit(message, jobs)
+    finally:
+        durable.release_lock()
+
+def _create_commit(message, jobs):
+    entries = index.read_index()
+    staged_entries = entries.staged()
+    if not staged_entries:
         print("No files staged.")
         return
 
     # Get encryption key or create one
     encryption_key = get_or_create_encryption_key()
 
+    # Make sure objects directory exists and uses the current layout
+    os.makedirs(objects.OBJECTS_DIR, exist_ok=True)
+    objects.ensure_layout()
+
+    # Trust index entries whose stat data still matches: the file is not
+    # read at all if its object already exists
+    stats = {}
+    stored = []
+    pending = []
+    removed = []
+    for entry in staged_entries:
+        if entry.flags & index.FLAG_REMOVED:
+            removed.append(entry.path)
+            continue
+        try:
+            st = os.stat(entry.path)
+        except FileNotFoundError:
+            # Deleted after it was staged: commit the deletion
+            removed.append(entry.path)
+            continue
+        stats[entry.path] = st
+        known = entries.cached_hash(entry.path, st)
+        if known and objects.has_object(known):
+            stored.append((entry.path, known, None))
+        else:
+            pending.append((entry.path, known))
+    results, published = store_files(pending, encryption_key, resolve_jobs(jobs))
+    stored.extend(results)
+    stored.sort()
+
+    # Publish objects in path order once every worker has finished
+    for file, file_hash, tmp_path in stored:
+        if tmp_path:
+            objects.publish(tmp_path, file_hash)
+
+    # Rebuild only the directories that contain staged files; the rest of
+    # the parent's tree is shared
+    parent_commit = utils.resolve_head()
+    changes = {file: file_hash for file, file_hash, _ in stored}
+    changes.update(dict.fromkeys(removed))
+    base_tree = utils.commit_tree(parent_commit)
+    if parent_commit and base_tree is None:
+        # Parent predates trees: start from its full snapshot
+        changes = {**utils.commit_snapshot(parent_commit), **changes}
+    root_tree = tree.update_tree(base_tree, changes, encryption_key)
+
     timestamp = str(int(time.time()))
-    commit_id = hashlib.sha1((message + timestamp).encode()).hexdigest()
-    commit_dir = f".crpt/commits/{commit_id}"
-    os.makedirs(commit_dir)
-
-    # Store parent commit if exists
-    if os.path.exists('.crpt/HEAD'):
-        with open('.crpt/HEAD', 'r') as head:
-            parent_commit = head.read().strip()
-            if parent_commit:
-                with open(f"{commit_dir}/meta.txt", 'w') as meta:
-                    meta.write(f"Parent: {parent_commit}\n")
-
-    # Copy and encrypt files to objects and store file hashes
-    with open(f"{commit_dir}/meta.txt", 'a') as meta:
-        meta.write(f"Message: {message}\nTime: {timestamp}\n")
+    # Parent and tree are part of the id so two commits with the same message
+    # in the same second still get distinct ids
+    commit_id = hashlib.sha1(f"{parent_commit or ''}\n{root_tree}\n{message}{timestamp}".encode()).hexdigest()
+    commit_dir = f"{utils.COMMITS_DIR}/{commit_id}"
+    if os.path.exists(commit_dir):
+        print(f"❌ Commit {commit_id[:7]} already exists.")
+        return
 
-        # Make sure objects directory exists
-        os.makedirs(".crpt/objects", exist_ok=True)
-        
-        for file in staged_files:
-            if not os.path.exists(file): continue
-            file_hash = hash_file(file)
+    # The commit directory appears under its real name only once complete
+    os.makedirs(utils.COMMITS_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=utils.COMMITS_DIR)
+    with open(f"{tmp_dir}/meta.txt", 'w') as meta:
+        # Store parent commit if exists
+        if parent_commit:
+            meta.write(f"Parent: {parent_commit}\n")
+        meta.write(f"Tree: {root_tree}\n")
+        meta.write(f"Message: {message}\nTime: {timestamp}\n")
+        for file, file_hash, _ in stored:
             meta.write(f"{file}:{file_hash}\n")
 
-            # Read file content and encrypt it
-            with open(file, 'rb') as f:
-                content = f.read()
-                
-            # Encrypt the content - we use file_hash as the password for extra security
-            encrypted_content = encrypt_file_content(content, file_hash)
-                
-            # Save encrypted content
-            with open(f".crpt/objects/{file_hash}", 'wb') as f:
-                f.write(encrypted_content)
-
     # Record commit message separately for easier access
-    with open(f"{commit_dir}/message.txt", 'w') as f:
+    with open(f"{tmp_dir}/message.txt", 'w') as f:
         f.write(message)
+    os.rename(tmp_dir, commit_dir)
+
+    # One sync for every object and the commit itself before any ref moves
+    published.extend(objects.take_published())
+    durable.sync(published + [f"{commit_dir}/meta.txt", f"{commit_dir}/message.txt", commit_dir])
+
+    commit_graph.append_commit(commit_id, parent_commit, timestamp)
 
     # Get current branch
-    current_branch = 'main'  # Default branch
-    if os.path.exists('.crpt/HEAD'):
-        with open('.crpt/HEAD', 'r') as f:
-            head_content = f.read().strip()
-            if head_content.startswith('ref:'):
-                current_branch = head_content.split('/')[-1]
-
-    # Ensure refs/heads directory exists
-    os.makedirs(".crpt/refs/heads", exist_ok=True)
-
-    # Update branch reference
-    with open(f".crpt/refs/heads/{current_branch}", 'w') as f:
-        f.write(commit_id)
-
-    # Update HEAD to point to the branch reference
-    with open('.crpt/HEAD', 'w') as head:
-        head.write(f"ref: refs/heads/{current_branch}")
-
-    # Clear staging area
-    open('.crpt/index', 'w').close()
+    current_branch = refs.current_branch() or 'main'  # Default branch
+
+    # Update branch reference and HEAD, each replaced atomically
+    written = [refs.update_ref(f"refs/heads/{current_branch}", commit_id)]
+    head_path = refs.set_head(f"refs/heads/{current_branch}")
+    if head_path:
+        written.append(head_path)
+    durable.sync(written)
+
+    # Clear staging area, keeping the entries as the stat cache
+    for file, file_hash, _ in stored:
+        entries[file] = index.make_entry(file, stats[file], file_hash)
+    for file in removed:
+        entries.pop(file, None)
+    index.write_index(entries)
 
     print(f"✅ Committed as {commit_id[:7]} on branch {current_branch}")
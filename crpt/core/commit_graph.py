@@ -0,0 +1,252 @@
+"""
+Commit-graph cache.
+
+.crpt/commit-graph holds one fixed-size record per commit: commit id,
+position of the parent record, position of a skip ancestor, commit time
+and generation number (1 for a root commit, parent's generation + 1
+otherwise). Parents always come before their children, so a new commit is
+appended without rewriting the file. The file is memory-mapped; history
+walks and ancestry checks follow record positions without opening any
+meta.txt.
+
+The skip ancestor of a commit at generation g is its ancestor at
+generation g & (g - 1). Following skips where they do not overshoot
+reaches any ancestor in O(log^2 n) steps, so ancestry and merge-base
+queries stay in the millisecond range on very long histories.
+
+The graph is only a cache of what meta.txt already records. If a commit
+is missing (for example one fetched by pull) the file is rebuilt.
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+from . import utils
+
+GRAPH_FILE = ".crpt/commit-graph"
+GRAPH_MAGIC = b"CGPH"
+GRAPH_VERSION = 1
+
+HEADER = struct.Struct(">4sII")        # magic, version, commit count
+ENTRY = struct.Struct(">20sIIqI")      # commit id, parent position, skip position, time, generation
+
+NO_PARENT = 0xFFFFFFFF
+
+_graph = None
+
+class CommitGraph:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != GRAPH_MAGIC or version != GRAPH_VERSION:
+            self._map.close()
+            raise ValueError(f"Unsupported commit-graph in {path}")
+
+    def __len__(self):
+        return self.count
+
+    def position(self, commit_id):
+        """Return the record position of commit_id, or None."""
+        if not utils.is_commit_id(commit_id):
+            return None
+        needle = bytes.fromhex(commit_id)
+        end = HEADER.size + self.count * ENTRY.size
+        start = HEADER.size
+        while True:
+            found = self._map.find(needle, start, end)
+            if found < 0:
+                return None
+            # Only a match at the start of a record is a commit id
+            if (found - HEADER.size) % ENTRY.size == 0:
+                return (found - HEADER.size) // ENTRY.size
+            start = found + 1
+
+    def entry(self, pos):
+        """Return (commit id, parent position or None, time, generation)."""
+        sha, parent, _, timestamp, generation = ENTRY.unpack_from(self._map, HEADER.size + pos * ENTRY.size)
+        return sha.hex(), None if parent == NO_PARENT else parent, timestamp, generation
+
+    def parent(self, pos):
+        parent = ENTRY.unpack_from(self._map, HEADER.size + pos * ENTRY.size)[1]
+        return None if parent == NO_PARENT else parent
+
+    def skip(self, pos):
+        skip = ENTRY.unpack_from(self._map, HEADER.size + pos * ENTRY.size)[2]
+        return None if skip == NO_PARENT else skip
+
+    def generation(self, pos):
+        return ENTRY.unpack_from(self._map, HEADER.size + pos * ENTRY.size)[4]
+
+    def ancestor_at(self, pos, generation):
+        """Return the ancestor of pos at the given generation, or None."""
+        while pos is not None and self.generation(pos) > generation:
+            skip = self.skip(pos)
+            if skip is not None and self.generation(skip) >= generation:
+                pos = skip
+            else:
+                pos = self.parent(pos)
+        return pos
+
+    def close(self):
+        self._map.close()
+
+def reload_graph():
+    global _graph
+    if _graph is not None:
+        _graph.close()
+    _graph = None
+
+def load_graph():
+    """Return the commit graph, building it if it does not exist yet."""
+    global _graph
+    if _graph is None:
+        if not os.path.exists(GRAPH_FILE):
+            write_graph()
+        _graph = CommitGraph(GRAPH_FILE)
+    return _graph
+
+def _skip_target(parent_pos, generation, parents, skips, generation_of):
+    """Position of the ancestor at generation & (generation - 1), found from the parent."""
+    target = generation & (generation - 1)
+    pos = parent_pos
+    if target == 0:
+        return NO_PARENT
+    while pos != NO_PARENT and generation_of(pos) > target:
+        skip = skips[pos]
+        pos = skip if skip != NO_PARENT and generation_of(skip) >= target else parents[pos]
+    return pos
+
+def write_graph():
+    """Rebuild the commit-graph from every commit's meta.txt."""
+    commits = {}
+    for commit_id in utils.list_commits():
+        meta = utils.read_commit_meta(commit_id)
+        commits[commit_id] = (meta["parent"], meta["time"] or 0)
+
+    # Generation numbers, computed without recursion for long histories
+    generations = {}
+    for commit_id in commits:
+        chain = []
+        current = commit_id
+        while current in commits and current not in generations:
+            chain.append(current)
+            current = commits[current][0]
+        base = generations.get(current, 0)
+        for i, pending in enumerate(reversed(chain)):
+            generations[pending] = base + i + 1
+
+    order = sorted(commits, key=lambda c: (generations[c], c))
+    index = {commit_id: pos for pos, commit_id in enumerate(order)}
+    parents = []
+    skips = []
+    parts = [HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, len(order))]
+    for commit_id in order:
+        parent, timestamp = commits[commit_id]
+        parent_pos = index.get(parent, NO_PARENT)
+        generation = generations[commit_id]
+        skip_pos = _skip_target(parent_pos, generation, parents, skips, lambda p: generations[order[p]])
+        parents.append(parent_pos)
+        skips.append(skip_pos)
+        parts.append(ENTRY.pack(bytes.fromhex(commit_id), parent_pos, skip_pos, timestamp, generation))
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".commit-graph-", dir=os.path.dirname(GRAPH_FILE))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b"".join(parts))
+        # An open mapping would keep Windows from replacing the file
+        reload_graph()
+        os.replace(tmp_path, GRAPH_FILE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def append_commit(commit_id, parent_id, timestamp):
+    """Record a new commit; its parent must already be in the graph."""
+    if not os.path.exists(GRAPH_FILE):
+        write_graph()
+        return
+    graph = load_graph()
+    parent_pos = NO_PARENT
+    skip_pos = NO_PARENT
+    generation = 1
+    if parent_id:
+        pos = graph.position(parent_id)
+        if pos is None:
+            write_graph()
+            return
+        parent_pos = pos
+        generation = graph.generation(pos) + 1
+        skip = graph.ancestor_at(pos, generation & (generation - 1))
+        skip_pos = NO_PARENT if skip is None else skip
+    count = graph.count
+    reload_graph()
+
+    with open(GRAPH_FILE, 'r+b') as f:
+        # The record goes in before the count, so a reader never sees a
+        # count that covers a half-written record
+        f.seek(HEADER.size + count * ENTRY.size)
+        f.write(ENTRY.pack(bytes.fromhex(commit_id), parent_pos, skip_pos, int(timestamp), generation))
+        f.truncate()
+        f.flush()
+        f.seek(0)
+        f.write(HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, count + 1))
+
+def positions(*commit_ids):
+    """
+    Graph positions of commit_ids (None for unknown ids). The graph is
+    rebuilt once if a commit that exists on disk is missing from it.
+    """
+    graph = load_graph()
+    found = [graph.position(commit_id) for commit_id in commit_ids]
+    stale = any(pos is None and commit_id and utils.read_commit_meta(commit_id) is not None
+                for commit_id, pos in zip(commit_ids, found))
+    if stale:
+        write_graph()
+        graph = load_graph()
+        found = [graph.position(commit_id) for commit_id in commit_ids]
+    return found
+
+def iter_history(commit_id):
+    """Yield commit ids from commit_id back to the root, newest first."""
+    pos, = positions(commit_id)
+    graph = load_graph()
+    while pos is not None:
+        yield graph.entry(pos)[0]
+        pos = graph.parent(pos)
+
+def is_ancestor(ancestor_id, commit_id):
+    """True if ancestor_id is commit_id or one of its ancestors."""
+    target, pos = positions(ancestor_id, commit_id)
+    if target is None or pos is None:
+        return False
+    graph = load_graph()
+    return graph.ancestor_at(pos, graph.generation(target)) == target
+
+def merge_base(a_id, b_id):
+    """Return the nearest common ancestor of two commits, or None."""
+    a, b = positions(a_id, b_id)
+    if a is None or b is None:
+        return None
+    graph = load_graph()
+    # Bring both to the same generation, then binary search for the deepest
+    # generation at which their ancestors are the same commit
+    low = min(graph.generation(a), graph.generation(b))
+    a = graph.ancestor_at(a, low)
+    b = graph.ancestor_at(b, low)
+    if a == b:
+        return graph.entry(a)[0]
+    high, low = low, 0
+    base = None
+    while high - low > 1:
+        mid = (low + high) // 2
+        a_mid = graph.ancestor_at(a, mid)
+        if a_mid is not None and a_mid == graph.ancestor_at(b, mid):
+            low, base = mid, a_mid
+        else:
+            high = mid
+    if base is None:
+        return None
+    return graph.entry(base)[0]
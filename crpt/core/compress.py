@@ -0,0 +1,155 @@
+"""
+Compression codecs applied to object plaintext before encryption.
+
+zlib from the standard library is always available; zstd is used when the
+optional zstandard package is installed. The codec of each object is
+recorded in its header, so readers never need to be told which one a
+writer used.
+"""
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+DEFAULT_CODEC_NAME = "zlib"
+
+CODECS = {
+    "none": CODEC_NONE,
+    "zlib": CODEC_ZLIB,
+    "zstd": CODEC_ZSTD,
+}
+
+READ_SIZE = 64 * 1024
+PROBE_SIZE = 64 * 1024
+# Skip compression unless a fast probe saves at least this fraction
+MIN_SAVINGS = 0.1
+
+
+def resolve_codec(name):
+    """Map a codec name to its id, falling back to zlib if zstd is missing."""
+    codec = CODECS.get((name or "none").lower(), CODEC_NONE)
+    if codec == CODEC_ZSTD and zstandard is None:
+        return CODEC_ZLIB
+    return codec
+
+
+def choose_codec(sample, codec):
+    """Return codec if compressing sample looks worthwhile, else CODEC_NONE."""
+    if codec == CODEC_NONE or not sample:
+        return CODEC_NONE
+    # Already-compressed data (archives, media) barely shrinks at level 1
+    probe = zlib.compress(sample[:PROBE_SIZE], 1)
+    if len(probe) > len(sample[:PROBE_SIZE]) * (1 - MIN_SAVINGS):
+        return CODEC_NONE
+    return codec
+
+
+def _compressor(codec):
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(6)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def _decompressor(codec, writer):
+    """A decompressor writing its output to writer, at most READ_SIZE bytes at a time."""
+    if codec == CODEC_ZLIB:
+        return _ZlibDecompressor(writer)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Object is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().stream_writer(writer, write_size=READ_SIZE, closefd=False)
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+class _ZlibDecompressor:
+    """Streaming zlib decompression whose output per call is bounded by max_length."""
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._decompressor = zlib.decompressobj()
+
+    def write(self, data):
+        while True:
+            out = self._decompressor.decompress(data, READ_SIZE)
+            if out:
+                self._writer.write(out)
+            data = self._decompressor.unconsumed_tail
+            # A full buffer may leave output pending even with no input left
+            if not data and len(out) < READ_SIZE:
+                return
+
+    def flush(self):
+        out = self._decompressor.flush()
+        if out:
+            self._writer.write(out)
+
+
+class CompressingReader:
+    """File-like reader yielding the compressed form of another reader."""
+
+    def __init__(self, reader, codec, prefix=b""):
+        self._reader = reader
+        self._prefix = prefix
+        self._compressor = _compressor(codec)
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self._prefix or self._reader.read(READ_SIZE)
+            self._prefix = b""
+            if data:
+                self._buffer += self._compressor.compress(data)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _CountingWriter:
+    def __init__(self, writer):
+        self._writer = writer
+        self.written = 0
+
+    def write(self, data):
+        self._writer.write(data)
+        self.written += len(data)
+        return len(data)
+
+
+class DecompressingWriter:
+    """
+    File-like writer that decompresses into another writer.
+
+    Output is passed on at most READ_SIZE bytes at a time, so a small
+    compressed write cannot expand into an unbounded buffer.
+    """
+
+    def __init__(self, writer, codec):
+        self._output = _CountingWriter(writer)
+        self._decompressor = _decompressor(codec, self._output)
+
+    @property
+    def written(self):
+        return self._output.written
+
+    def write(self, data):
+        self._decompressor.write(data)
+        return len(data)
+
+    def finish(self):
+        self._decompressor.flush()
+        return self.written
@@ -0,0 +1,31 @@
+import os
+import configparser
+
+CONFIG_FILE = ".crpt/config"
+
+def load_config():
+    parser = configparser.ConfigParser()
+    if os.path.exists(CONFIG_FILE):
+        parser.read(CONFIG_FILE)
+    return parser
+
+def get(section, key, default=None):
+    return load_config().get(section, key, fallback=default)
+
+def get_int(section, key, default=None):
+    value = get(section, key)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Ignoring invalid {section}.{key} value '{value}' in {CONFIG_FILE}")
+        return default
+
+def set_value(section, key, value):
+    parser = load_config()
+    if not parser.has_section(section):
+        parser.add_section(section)
+    parser.set(section, key, str(value))
+    with open(CONFIG_FILE, 'w') as f:
+        parser.write(f)
@@ -0,0 +1,64 @@
+"""
+Binary deltas between object versions.
+
+A delta is the target size followed by COPY (offset, length into the base)
+and INSERT (literal bytes) instructions. Deltas are computed over lines,
+which suits the text-like files (config dumps, generated sources) that
+change a little between commits.
+"""
+
+import struct
+from difflib import SequenceMatcher
+
+DELTA_HEADER = struct.Struct(">Q")  # target size
+OP_COPY = b"C"
+OP_INSERT = b"I"
+COPY_ARGS = struct.Struct(">QQ")    # base offset, length
+INSERT_ARGS = struct.Struct(">Q")   # length
+
+
+def create_delta(base, target):
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+
+    base_offsets = [0]
+    for line in base_lines:
+        base_offsets.append(base_offsets[-1] + len(line))
+    target_offsets = [0]
+    for line in target_lines:
+        target_offsets.append(target_offsets[-1] + len(line))
+
+    out = [DELTA_HEADER.pack(len(target))]
+    matcher = SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            start = base_offsets[i1]
+            out.append(OP_COPY + COPY_ARGS.pack(start, base_offsets[i2] - start))
+        elif tag in ("replace", "insert"):
+            data = target[target_offsets[j1]:target_offsets[j2]]
+            out.append(OP_INSERT + INSERT_ARGS.pack(len(data)) + data)
+    return b"".join(out)
+
+
+def apply_delta(base, delta):
+    (size,) = DELTA_HEADER.unpack_from(delta, 0)
+    pos = DELTA_HEADER.size
+    out = []
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        pos += 1
+        if op == OP_COPY:
+            offset, length = COPY_ARGS.unpack_from(delta, pos)
+            pos += COPY_ARGS.size
+            out.append(base[offset:offset + length])
+        elif op == OP_INSERT:
+            (length,) = INSERT_ARGS.unpack_from(delta, pos)
+            pos += INSERT_ARGS.size
+            out.append(delta[pos:pos + length])
+            pos += length
+        else:
+            raise ValueError(f"Corrupt delta instruction {op!r}")
+    result = b"".join(out)
+    if len(result) != size:
+        raise ValueError("Delta produced the wrong size")
+    return result
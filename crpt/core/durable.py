@@ -0,0 +1,158 @@
+"""
+Crash-safe writes.
+
+Files are written under temporary names and renamed into place, so a
+reader never sees a half-written file. Nothing is fsynced as it is
+written. Instead, callers collect the paths they published and make them
+durable with one sync() before writing a ref that points at them. On
+Linux that is a single syncfs() of the repository's filesystem; elsewhere
+each file and then each directory is fsynced once, at the end.
+
+Temporary files left behind by a crash are removed by recover().
+"""
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import tempfile
+from . import config
+
+REPO_DIR = ".crpt"
+LOCK_FILE = f"{REPO_DIR}/lock"
+
+# Temporary files older than this are assumed to belong to a dead process
+STALE_AGE = 10 * 60
+
+# Directories and name prefixes of the temporary files crpt creates
+TEMP_LOCATIONS = [
+    (REPO_DIR, (".tmp-", ".index-", ".commit-graph-")),
+    (f"{REPO_DIR}/objects", (".tmp-",)),
+    (f"{REPO_DIR}/objects/pack", (".tmp-",)),
+    (f"{REPO_DIR}/commits", (".tmp-",)),
+]
+
+_libc = None
+
+def enabled():
+    return config.get("core", "fsync", "true").lower() not in ("false", "0", "no", "off")
+
+def _syncfs(path):
+    """Flush the whole filesystem holding path with one syscall; False if unavailable."""
+    global _libc
+    if not sys.platform.startswith("linux"):
+        return False
+    if _libc is None:
+        name = ctypes.util.find_library("c")
+        if name is None:
+            return False
+        _libc = ctypes.CDLL(name, use_errno=True)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return _libc.syncfs(fd) == 0
+    finally:
+        os.close(fd)
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on Windows; renames there are
+        # journaled by NTFS anyway
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync(paths):
+    """Make the given files, and the directory entries naming them, durable."""
+    if not enabled():
+        return
+    if _syncfs(REPO_DIR):
+        return
+    directories = set()
+    for path in paths:
+        _fsync_path(path)
+        directories.add(os.path.dirname(path) or ".")
+    for directory in sorted(directories):
+        _fsync_path(directory)
+
+def write_atomic(path, data):
+    """Replace path with data via a temporary file in .crpt; returns path."""
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=REPO_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def _lock_is_stale():
+    try:
+        with open(LOCK_FILE, 'r') as f:
+            pid = int(f.read().strip() or 0)
+        age = time.time() - os.path.getmtime(LOCK_FILE)
+    except (FileNotFoundError, ValueError):
+        return True
+    if os.name == "nt" or not pid:
+        return age > STALE_AGE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def acquire_lock():
+    """Take the repository write lock; returns False if another process holds it."""
+    for _ in range(2):
+        try:
+            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _lock_is_stale():
+                return False
+            # Left by a process that died mid-commit
+            os.remove(LOCK_FILE)
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+def release_lock():
+    try:
+        os.remove(LOCK_FILE)
+    except FileNotFoundError:
+        pass
+
+def recover():
+    """Remove temporary files and directories abandoned by crashed commands."""
+    cutoff = time.time() - STALE_AGE
+    removed = 0
+    for directory, prefixes in TEMP_LOCATIONS:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.name.startswith(prefixes):
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    for name in os.listdir(entry.path):
+                        os.remove(os.path.join(entry.path, name))
+                    os.rmdir(entry.path)
+                else:
+                    os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
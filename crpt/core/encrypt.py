@@ -4,11 +4,16 @@ This module provides functions for encrypting and decrypting repository data.
 """
 
 import os
+import io
 import base64
+import struct
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
+from .compress import CODEC_NONE, CompressingReader, DecompressingWriter, choose_codec, resolve_codec
 
 # Default values
 DEFAULT_KEY_FILE = ".crpt/encryption_key"
@@ -16,6 +21,34 @@ SALT_SIZE = 16
 IV_SIZE = 16
 KEY_SIZE = 32  # 256 bits for AES-256
 
+# Object header: magic + format version. Objects written before the header
+# existed start directly with their random salt and are read as FORMAT_LEGACY.
+OBJECT_MAGIC = b"CRPT"
+FORMAT_LEGACY = 0
+FORMAT_V1 = 1
+FORMAT_V2 = 2
+HEADER_SIZE = len(OBJECT_MAGIC) + 1
+
+# Format v2: AES-256-GCM over fixed-size plaintext segments. The header is
+# magic + version + flags + segment size + salt and is authenticated as the
+# associated data of every segment.
+SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+V2_HEADER = struct.Struct(">4sBBI")
+V2_HEADER_SIZE = V2_HEADER.size + SALT_SIZE
+
+# v2 header flags byte: the low nibble holds flags, the high nibble the
+# compression codec applied to the plaintext before encryption
+FLAG_MANIFEST = 0x01  # plaintext is a chunk manifest, not file content
+# The object hash was not known when encryption started: the key is derived
+# without it and the hash is authenticated with the final segment instead
+FLAG_LATE_BOUND = 0x02
+FLAGS_MASK = 0x0F
+CODEC_SHIFT = 4
+
+# Master keys already loaded or derived by this process, keyed by key file
+_master_keys = {}
+
 
 def derive_key(password, salt, iterations=100000):
     """
@@ -39,6 +72,73 @@ def derive_key(password, salt, iterations=100000):
     return kdf.derive(password.encode())
 
 
+def derive_object_key(master_key, salt, object_id):
+    """
+    Derive a per-object key from the repository master key using HKDF.
+    
+    Args:
+        master_key (bytes): Repository master key
+        salt (bytes): Random per-object salt
+        object_id (str): Object hash the key is bound to
+        
+    Returns:
+        bytes: Derived object key
+    """
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=KEY_SIZE,
+        salt=salt,
+        info=b"crpt-object:" + object_id.encode(),
+        backend=default_backend()
+    )
+    return hkdf.derive(master_key)
+
+
+def object_format(encrypted_content):
+    """
+    Detect the format version of an encrypted object.
+    
+    Args:
+        encrypted_content (bytes): Encrypted object, or at least its header
+        
+    Returns:
+        int: Format version, FORMAT_LEGACY for headerless objects
+    """
+    if encrypted_content[:len(OBJECT_MAGIC)] != OBJECT_MAGIC:
+        return FORMAT_LEGACY
+    return encrypted_content[len(OBJECT_MAGIC)]
+
+
+def object_flags(encrypted_content):
+    """
+    Read the header flags of an encrypted object.
+    
+    Args:
+        encrypted_content (bytes): Encrypted object, or at least its header
+        
+    Returns:
+        int: Flags byte for v2 objects, 0 for older formats
+    """
+    if object_format(encrypted_content) != FORMAT_V2:
+        return 0
+    return encrypted_content[HEADER_SIZE] & FLAGS_MASK
+
+
+def object_codec(encrypted_content):
+    """
+    Read the compression codec of an encrypted object.
+    
+    Args:
+        encrypted_content (bytes): Encrypted object, or at least its header
+        
+    Returns:
+        int: Codec id, CODEC_NONE for uncompressed and pre-v2 objects
+    """
+    if object_format(encrypted_content) != FORMAT_V2:
+        return CODEC_NONE
+    return encrypted_content[HEADER_SIZE] >> CODEC_SHIFT
+
+
 def encrypt_data(data, key):
     """
     Encrypt data using AES-256-CBC.
@@ -84,49 +184,313 @@ def decrypt_data(encrypted_data, key, iv):
     return padded_data[:-padding_length]
 
 
-def encrypt_file_content(content, password):
+def _read_full(reader, size):
+    """Read exactly size bytes from reader unless EOF comes first."""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = reader.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _segment_nonce(index, final):
+    """Nonce for segment index; the last byte marks the final segment."""
+    return index.to_bytes(11, "big") + (b"\x01" if final else b"\x00")
+
+
+def _read_v2_header(reader, password, master_key, prefix=b""):
+    """Read a v2 header from reader and return (header, segment_size, aead)."""
+    header = prefix + _read_full(reader, V2_HEADER_SIZE - len(prefix))
+    if len(header) != V2_HEADER_SIZE:
+        raise ValueError("Truncated object header")
+    _, _, _, segment_size = V2_HEADER.unpack(header[:V2_HEADER.size])
+    salt = header[V2_HEADER.size:]
+    if master_key is None:
+        master_key = get_or_create_encryption_key()
+    key_id = "" if object_flags(header) & FLAG_LATE_BOUND else password
+    aead = AESGCM(derive_object_key(master_key, salt, key_id))
+    return header, segment_size, aead
+
+
+def _segment_aad(header, password, final):
+    """Associated data for one segment: the header, plus the object hash on
+    the final segment of late-bound objects."""
+    if final and object_flags(header) & FLAG_LATE_BOUND:
+        return header + password.encode()
+    return header
+
+
+class _PrefixReader:
+    """Reader that replays already-consumed bytes before the rest of a stream."""
+
+    def __init__(self, prefix, reader):
+        self._prefix = prefix
+        self._reader = reader
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._reader.read(size)
+        if size < 0:
+            data, self._prefix = self._prefix + self._reader.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+
+class _RangeWriter:
+    """Writer that keeps only the bytes in [offset, offset + length)."""
+
+    def __init__(self, offset, length):
+        self.start = offset
+        self.end = offset + length
+        self.position = 0
+        self.parts = []
+
+    def write(self, data):
+        lo = max(self.start - self.position, 0)
+        hi = min(self.end - self.position, len(data))
+        if lo < hi:
+            self.parts.append(data[lo:hi])
+        self.position += len(data)
+        return len(data)
+
+
+def encrypt_stream(reader, writer, password, master_key=None, segment_size=SEGMENT_SIZE, flags=0,
+                   compression=None, object_id=None):
     """
-    Encrypt file content using a password.
+    Encrypt a stream into the segmented v2 object format.
+    
+    Only one segment and its lookahead are held in memory at a time. When a
+    compression codec is requested, the first segment is probed and content
+    that does not compress (already-compressed media, archives) is stored raw.
+    
+    If the object hash is only known once the input has been read (the
+    reader hashes what it returns), pass password=None and an object_id
+    callable; it is called before the final segment is sealed.
     
     Args:
-        content (bytes): File content to encrypt
-        password (str): Password for encryption
+        reader: Binary file-like object to read plaintext from
+        writer: Binary file-like object to write the object to
+        password (str): Object hash the per-object key is bound to
+        master_key (bytes, optional): Repository master key, loaded if omitted
+        segment_size (int, optional): Plaintext bytes per segment
+        flags (int, optional): Header flags such as FLAG_MANIFEST
+        compression (str, optional): Codec name ("zlib", "zstd" or "none")
+        object_id (callable, optional): Returns the object hash when password is None
         
     Returns:
-        bytes: Encrypted content with salt and IV prepended
+        int: Number of bytes encrypted (compressed size if compressed)
     """
+    if master_key is None:
+        master_key = get_or_create_encryption_key()
+    
+    codec = resolve_codec(compression)
+    if codec != CODEC_NONE:
+        sample = _read_full(reader, segment_size)
+        codec = choose_codec(sample, codec)
+        reader = CompressingReader(reader, codec, sample) if codec != CODEC_NONE else _PrefixReader(sample, reader)
+    
+    if password is None:
+        flags |= FLAG_LATE_BOUND
     salt = os.urandom(SALT_SIZE)
-    key = derive_key(password, salt)
+    header_flags = (flags & FLAGS_MASK) | (codec << CODEC_SHIFT)
+    header = V2_HEADER.pack(OBJECT_MAGIC, FORMAT_V2, header_flags, segment_size) + salt
+    aead = AESGCM(derive_object_key(master_key, salt, password if password is not None else ""))
+    writer.write(header)
+    
+    total = 0
+    index = 0
+    segment = _read_full(reader, segment_size)
+    while True:
+        # A short segment is always the last one; a full one needs a lookahead
+        next_segment = _read_full(reader, segment_size) if len(segment) == segment_size else b""
+        final = not next_segment
+        aad = header
+        if final and password is None:
+            aad = _segment_aad(header, object_id(), final)
+        writer.write(aead.encrypt(_segment_nonce(index, final), segment, aad))
+        total += len(segment)
+        if final:
+            return total
+        segment = next_segment
+        index += 1
+
+
+def decrypt_stream(reader, writer, password, master_key=None):
+    """
+    Decrypt an object from reader into writer.
+    
+    Segmented v2 objects are decrypted one segment at a time and
+    decompressed on the fly; older formats are read whole and decrypted
+    with decrypt_file_content.
+    
+    Args:
+        reader: Binary file-like object positioned at the object start
+        writer: Binary file-like object to write plaintext to
+        password (str): Object hash the per-object key is bound to
+        master_key (bytes, optional): Repository master key, loaded if omitted
+        
+    Returns:
+        int: Number of plaintext bytes written
+    """
+    prefix = _read_full(reader, HEADER_SIZE)
+    if object_format(prefix) != FORMAT_V2:
+        content = decrypt_file_content(prefix + reader.read(), password, master_key)
+        writer.write(content)
+        return len(content)
+    
+    header, segment_size, aead = _read_v2_header(reader, password, master_key, prefix)
+    codec = object_codec(header)
+    if codec != CODEC_NONE:
+        writer = DecompressingWriter(writer, codec)
+    
+    total = 0
+    index = 0
+    record_size = segment_size + TAG_SIZE
+    record = _read_full(reader, record_size)
+    while True:
+        next_record = _read_full(reader, record_size) if len(record) == record_size else b""
+        final = not next_record
+        segment = aead.decrypt(_segment_nonce(index, final), record, _segment_aad(header, password, final))
+        writer.write(segment)
+        total += len(segment)
+        if final:
+            break
+        record = next_record
+        index += 1
     
-    encrypted_data, iv = encrypt_data(content, key)
+    if codec != CODEC_NONE:
+        return writer.finish()
+    return total
+
+
+def decrypt_range(reader, offset, length, password, master_key=None):
+    """
+    Decrypt length bytes starting at plaintext offset.
+    
+    For uncompressed v2 objects only the segments covering the range are
+    read and authenticated. Compressed objects are streamed from the start,
+    keeping only the requested bytes; older formats are decrypted whole and
+    sliced.
     
-    # Format: salt + iv + encrypted_data
-    return salt + iv + encrypted_data
+    Args:
+        reader: Seekable binary file-like object holding the object
+        offset (int): Plaintext offset to start at
+        length (int): Number of plaintext bytes to return
+        password (str): Object hash the per-object key is bound to
+        master_key (bytes, optional): Repository master key, loaded if omitted
+        
+    Returns:
+        bytes: Decrypted range, shorter than length if it runs past the end
+    """
+    reader.seek(0)
+    prefix = _read_full(reader, HEADER_SIZE)
+    if object_format(prefix) != FORMAT_V2:
+        content = decrypt_file_content(prefix + reader.read(), password, master_key)
+        return content[offset:offset+length]
+    
+    reader.seek(0)
+    header, segment_size, aead = _read_v2_header(reader, password, master_key)
+    if object_codec(header) != CODEC_NONE:
+        reader.seek(0)
+        writer = _RangeWriter(offset, max(length, 0))
+        decrypt_stream(reader, writer, password, master_key)
+        return b"".join(writer.parts)
+    record_size = segment_size + TAG_SIZE
+    
+    body_size = reader.seek(0, io.SEEK_END) - V2_HEADER_SIZE
+    segment_count = max(1, -(-body_size // record_size))
+    plaintext_size = body_size - segment_count * TAG_SIZE
+    
+    end = min(offset + length, plaintext_size)
+    if length <= 0 or offset >= end:
+        return b""
+    
+    first = offset // segment_size
+    last = (end - 1) // segment_size
+    reader.seek(V2_HEADER_SIZE + first * record_size)
+    
+    parts = []
+    for index in range(first, last + 1):
+        record = _read_full(reader, record_size)
+        final = index == segment_count - 1
+        parts.append(aead.decrypt(_segment_nonce(index, final), record, _segment_aad(header, password, final)))
+    
+    start = offset - first * segment_size
+    return b"".join(parts)[start:start + (end - offset)]
 
 
-def decrypt_file_content(encrypted_content, password):
+def encrypt_file_content(content, password, master_key=None, compression=None):
     """
-    Decrypt file content using a password.
+    Encrypt file content with a key derived from the repository master key.
+    
+    Args:
+        content (bytes): File content to encrypt
+        password (str): Object hash the per-object key is bound to
+        master_key (bytes, optional): Repository master key, loaded if omitted
+        compression (str, optional): Codec name ("zlib", "zstd" or "none")
+        
+    Returns:
+        bytes: Encrypted object in the segmented v2 format
+    """
+    writer = io.BytesIO()
+    encrypt_stream(io.BytesIO(content), writer, password, master_key, compression=compression)
+    return writer.getvalue()
+
+
+def decrypt_file_content(encrypted_content, password, master_key=None):
+    """
+    Decrypt file content in any supported object format.
     
     Args:
         encrypted_content (bytes): Encrypted file content
-        password (str): Password for decryption
+        password (str): Object hash (the PBKDF2 password for legacy objects)
+        master_key (bytes, optional): Repository master key, loaded if omitted
         
     Returns:
         bytes: Decrypted file content
     """
-    salt = encrypted_content[:SALT_SIZE]
-    iv = encrypted_content[SALT_SIZE:SALT_SIZE+IV_SIZE]
-    encrypted_data = encrypted_content[SALT_SIZE+IV_SIZE:]
+    version = object_format(encrypted_content)
     
-    key = derive_key(password, salt)
+    if version == FORMAT_LEGACY:
+        # Format: salt + iv + encrypted_data, keyed by PBKDF2 of the password
+        salt = encrypted_content[:SALT_SIZE]
+        iv = encrypted_content[SALT_SIZE:SALT_SIZE+IV_SIZE]
+        encrypted_data = encrypted_content[SALT_SIZE+IV_SIZE:]
+        
+        key = derive_key(password, salt)
+        return decrypt_data(encrypted_data, key, iv)
+    
+    if version == FORMAT_V2:
+        writer = io.BytesIO()
+        decrypt_stream(io.BytesIO(encrypted_content), writer, password, master_key)
+        return writer.getvalue()
+    
+    if version != FORMAT_V1:
+        raise ValueError(f"Unsupported object format version {version}")
     
+    if master_key is None:
+        master_key = get_or_create_encryption_key()
+    
+    offset = HEADER_SIZE
+    salt = encrypted_content[offset:offset+SALT_SIZE]
+    iv = encrypted_content[offset+SALT_SIZE:offset+SALT_SIZE+IV_SIZE]
+    encrypted_data = encrypted_content[offset+SALT_SIZE+IV_SIZE:]
+    
+    key = derive_object_key(master_key, salt, password)
     return decrypt_data(encrypted_data, key, iv)
 
 
 def get_or_create_encryption_key(password=None, key_file=DEFAULT_KEY_FILE):
     """
-    Get or create an encryption key for the repository.
+    Get or create the master encryption key for the repository.
+    
+    The expensive PBKDF2 derivation runs at most once per repository: the
+    result is stored in the key file and cached for the rest of the process.
     
     Args:
         password (str, optional): Password for encryption
@@ -139,27 +503,71 @@ def get_or_create_encryption_key(password=None, key_file=DEFAULT_KEY_FILE):
     if not password:
         password = os.environ.get("CRPT_PASSWORD", "")
     
+    cache_key = (os.path.abspath(key_file), password)
+    if cache_key in _master_keys:
+        return _master_keys[cache_key]
+    
     # If still no password, check if key file exists
     if not password and os.path.exists(key_file):
         with open(key_file, "rb") as f:
             encoded_key = f.read()
-            return base64.b64decode(encoded_key)
+            key = base64.b64decode(encoded_key)
+        _master_keys[cache_key] = key
+        return key
     
     # Otherwise generate and store a new key
     if not password:
         # Generate a random password if not provided
         password = base64.b64encode(os.urandom(16)).decode('utf-8')
     
-    salt = os.urandom(SALT_SIZE)
-    key = derive_key(password, salt)
-    
     # Ensure directory exists
     key_dir = os.path.dirname(key_file)
     os.makedirs(key_dir, exist_ok=True)
     
+    # Keep the salt so the same password always yields the same key
+    salt_file = key_file + ".salt"
+    if os.path.exists(salt_file):
+        with open(salt_file, "rb") as f:
+            salt = base64.b64decode(f.read())
+    else:
+        salt = os.urandom(SALT_SIZE)
+        with open(salt_file, "wb") as f:
+            f.write(base64.b64encode(salt))
+    
+    key = derive_key(password, salt)
+    
     # Store encoded key
     with open(key_file, "wb") as f:
         encoded_key = base64.b64encode(key)
         f.write(encoded_key)
     
-    return key
\ No newline at end of file
+    _master_keys[cache_key] = key
+    return key
+
+
+def read_key_files(key_file=DEFAULT_KEY_FILE):
+    """Return the stored (master key, salt), either None if its file is missing."""
+    found = []
+    for path in (key_file, key_file + ".salt"):
+        try:
+            with open(path, "rb") as f:
+                found.append(base64.b64decode(f.read()))
+        except FileNotFoundError:
+            found.append(None)
+    return tuple(found)
+
+
+def write_key_files(key, salt, key_file=DEFAULT_KEY_FILE):
+    """
+    Store a master key, and the salt a password derives it with, as
+    copied from another clone of the repository.
+    """
+    if len(key) != KEY_SIZE:
+        raise ValueError(f"A master key is {KEY_SIZE} bytes, not {len(key)}")
+    os.makedirs(os.path.dirname(key_file), exist_ok=True)
+    with open(key_file, "wb") as f:
+        f.write(base64.b64encode(key))
+    if salt:
+        with open(key_file + ".salt", "wb") as f:
+            f.write(base64.b64encode(salt))
+    _master_keys.clear()
@@ -0,0 +1,70 @@
+"""
+On-demand object fetching for partial clones.
+
+A partial pull downloads commits and file lists but no file contents.
+Objects are fetched from the remote's /objects/stream/ endpoint the first
+time something needs them, in batches sent as binary frames, and kept in
+the local object store so each is downloaded once. Any command that reads a missing object after a
+pull goes through ensure().
+
+The remote is remembered in .crpt/config:
+
+    [remote]
+    url = http://127.0.0.1:8000/
+    repo = default
+    partial = true
+"""
+
+import requests
+from . import chunking, client, config, objects, transport
+
+BATCH_SIZE = 256
+
+def is_partial():
+    return config.get("remote", "partial", "false").lower() == "true"
+
+def remember_remote(base_url, repo_name, partial):
+    config.set_value("remote", "url", base_url)
+    config.set_value("remote", "repo", repo_name)
+    if partial:
+        config.set_value("remote", "partial", "true")
+
+def _fetch_batch(batch):
+    response = client.post("objects/stream/", json={"repo": client.repo_name(), "hashes": batch}, stream=True)
+    if response.status_code != 200:
+        raise RuntimeError(f"Fetching objects failed: {response.text}")
+    # Each object is written to the store as its frames arrive
+    try:
+        _, received = transport.receive(response.iter_content(transport.FRAME_SIZE))
+    except (ValueError, requests.RequestException) as e:
+        raise RuntimeError(f"Fetching objects failed: {e}")
+    received = set(received)
+    return [h for h in batch if h not in received]
+
+def fetch_objects(hashes):
+    """Download objects from the remote in parallel batches; returns the hashes it could not find."""
+    # Only a repository that has talked to a remote knows where to fetch from
+    if not config.get("remote", "url"):
+        return list(hashes)
+    hashes = list(hashes)
+    batches = [hashes[start:start + BATCH_SIZE] for start in range(0, len(hashes), BATCH_SIZE)]
+    return [h for missing in client.map_parallel(_fetch_batch, batches) for h in missing]
+
+def ensure(hashes):
+    """Make sure objects are present locally, fetching the missing ones in one batch."""
+    missing = [h for h in dict.fromkeys(hashes) if h and not objects.has_object(h)]
+    if not missing:
+        return
+    unfound = fetch_objects(missing)
+    if unfound:
+        raise FileNotFoundError(f"{len(unfound)} objects are missing locally and on the remote")
+
+def ensure_contents(hashes, encryption_key):
+    """Like ensure(), also fetching the chunks of large files."""
+    hashes = list(dict.fromkeys(hashes))
+    ensure(hashes)
+    chunks = []
+    for object_hash in hashes:
+        if chunking.is_manifest(object_hash):
+            chunks.extend(chunk_hash for chunk_hash, _ in chunking.read_manifest(object_hash, encryption_key))
+    ensure(chunks)
@@ -0,0 +1,135 @@
+"""
+.crptignore handling.
+
+Patterns follow .gitignore rules: blank lines and '#' comments are
+skipped, '!' re-includes, a trailing '/' matches directories only, and a
+pattern containing '/' is anchored at the repository root, otherwise it
+matches at any depth. '*', '?', '[...]' and '**' glob as in git.
+
+The same syntax is used by .crpt/sparse, which lists the paths checkout
+and pull materialize in the working tree (see load_sparse()).
+
+All patterns are compiled once. Without negations they are joined into a
+single regular expression, so each path costs one match call.
+"""
+
+import os
+import re
+
+IGNORE_FILE = ".crptignore"
+# Patterns of the paths checkout and pull write; everything if missing
+SPARSE_FILE = ".crpt/sparse"
+ALWAYS_IGNORED = [".crpt/"]
+
+
+def _translate(glob):
+    """Translate a gitignore glob (without anchoring) into a regex body."""
+    out = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("/**", i) and i + 3 == len(glob):
+            out.append("/.*")
+            i += 3
+        elif glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = glob[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+        elif c == "\\" and i + 1 < len(glob):
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def compile_pattern(line):
+    """Return (regex, negated, dir_only) for one pattern line, or None to skip it."""
+    line = line.rstrip("\n")
+    if not line.strip() or line.startswith("#"):
+        return None
+    line = line.rstrip(" ")
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    if "/" in line:
+        body = "^" + _translate(line.lstrip("/"))
+    else:
+        body = "(?:^|/)" + _translate(line)
+    return body + "$", negated, dir_only
+
+
+class IgnoreMatcher:
+    def __init__(self, lines=()):
+        rules = [compile_pattern(line) for line in list(ALWAYS_IGNORED) + list(lines)]
+        self._rules = [(re.compile(body), negated, dir_only) for body, negated, dir_only in filter(None, rules)]
+        self._fast = None
+        if not any(negated for _, negated, _ in self._rules):
+            any_type = [r.pattern for r, _, dir_only in self._rules if not dir_only]
+            dirs = [r.pattern for r, _, dir_only in self._rules]
+            self._fast = (
+                re.compile("|".join(f"(?:{p})" for p in any_type)) if any_type else None,
+                re.compile("|".join(f"(?:{p})" for p in dirs)) if dirs else None,
+            )
+
+    def match(self, path, is_dir=False):
+        """True if path (repository-relative, '/'-separated) is ignored."""
+        if self._fast is not None:
+            regex = self._fast[1] if is_dir else self._fast[0]
+            return bool(regex and regex.search(path))
+        ignored = False
+        for regex, negated, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.search(path):
+                ignored = not negated
+        return ignored
+
+    def match_with_parents(self, path, is_dir=False):
+        """Like match(), but also true if any parent directory is ignored."""
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            if self.match("/".join(parts[:i]), True):
+                return True
+        return self.match(path, is_dir)
+
+
+def load_ignore(root="."):
+    path = os.path.join(root, IGNORE_FILE)
+    if not os.path.exists(path):
+        return IgnoreMatcher()
+    with open(path, 'r') as f:
+        return IgnoreMatcher(f.readlines())
+
+
+def load_sparse():
+    """Return a matcher for the sparse patterns, or None if every path is wanted."""
+    if not os.path.exists(SPARSE_FILE):
+        return None
+    with open(SPARSE_FILE, 'r') as f:
+        return IgnoreMatcher(f.readlines())
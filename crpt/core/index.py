@@ -1,10 +1,286 @@
+"""
+Binary staging index with a stat cache.
+
+The index holds one entry per path, sorted and deduplicated: size,
+mtime_ns, inode, content hash and flags. An entry whose stat data still
+matches the file on disk is trusted, so the file is not read or hashed
+again. Entries stay in the index after a commit (without FLAG_STAGED) to
+serve as the stat cache for later commands. A tracked file deleted from
+the working tree is staged as an entry with FLAG_REMOVED and no hash.
+
+Layout: header (magic, version, entry count), then per entry a fixed
+struct followed by the UTF-8 path.
+"""
+
 import os
+import glob
+import struct
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from . import utils, worktree, watch
+from .ignore import IGNORE_FILE, load_ignore, load_sparse
 
-def stage_file(file_path):
-    if not os.path.exists('.crpt/index'):
+INDEX_FILE = ".crpt/index"
+INDEX_MAGIC = b"CIDX"
+INDEX_VERSION = 1
+
+HEADER = struct.Struct(">4sII")        # magic, version, entry count
+ENTRY = struct.Struct(">QqQ20sBH")     # size, mtime_ns, inode, sha1, flags, path length
+
+FLAG_STAGED = 0x01
+FLAG_REMOVED = 0x02
+
+NO_HASH = b"\0" * 20
+
+IndexEntry = namedtuple("IndexEntry", ["path", "size", "mtime_ns", "inode", "hash", "flags"])
+
+class Index(dict):
+    """Mapping of path -> IndexEntry, remembering when the index was written."""
+
+    def __init__(self, entries=(), mtime_ns=0):
+        super().__init__((entry.path, entry) for entry in entries)
+        self.mtime_ns = mtime_ns
+
+    def staged(self):
+        return [self[path] for path in sorted(self) if self[path].flags & FLAG_STAGED]
+
+    def cached_hash(self, path, st):
+        """Return the recorded hash if st still matches the entry, else None."""
+        entry = self.get(path)
+        if entry is None or not entry.hash:
+            return None
+        if entry.size != st.st_size or entry.mtime_ns != st.st_mtime_ns:
+            return None
+        # os.scandir() reports inode 0 on Windows; only compare real inodes
+        if st.st_ino and entry.inode and entry.inode != st.st_ino:
+            return None
+        # A file modified in the same clock tick the index was written could
+        # change again without its mtime moving, so it is not trusted
+        if entry.mtime_ns >= self.mtime_ns:
+            return None
+        return entry.hash
+
+def make_entry(path, st, file_hash, flags=0):
+    return IndexEntry(path, st.st_size, st.st_mtime_ns, st.st_ino, file_hash, flags)
+
+def make_removal(path):
+    return IndexEntry(path, 0, 0, 0, "", FLAG_STAGED | FLAG_REMOVED)
+
+def _below(path, prefix):
+    return prefix == "." or path == prefix or path.startswith(prefix + "/")
+
+def _read_legacy(data):
+    # The old index was a list of staged paths, one per line, with repeats
+    paths = dict.fromkeys(utils.normalize_path(line) for line in data.decode().splitlines() if line.strip())
+    return [IndexEntry(path, 0, 0, 0, "", FLAG_STAGED) for path in paths]
+
+def read_index():
+    """Load the index, or return None if the repository is not initialized."""
+    if not os.path.exists(INDEX_FILE):
+        return None
+    with open(INDEX_FILE, 'rb') as f:
+        data = f.read()
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+
+    if not data.startswith(INDEX_MAGIC):
+        return Index(_read_legacy(data), mtime_ns)
+
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if version != INDEX_VERSION:
+        raise ValueError(f"Unsupported index version {version}")
+
+    entries = []
+    pos = HEADER.size
+    for _ in range(count):
+        size, entry_mtime, inode, sha, flags, path_len = ENTRY.unpack_from(data, pos)
+        pos += ENTRY.size
+        path = data[pos:pos + path_len].decode()
+        pos += path_len
+        file_hash = sha.hex() if sha != NO_HASH else ""
+        entries.append(IndexEntry(path, size, entry_mtime, inode, file_hash, flags))
+    return Index(entries, mtime_ns)
+
+def write_index(entries):
+    """Write all entries sorted by path in one atomic replace."""
+    parts = [HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(entries))]
+    for path in sorted(entries):
+        entry = entries[path]
+        encoded = path.encode()
+        sha = bytes.fromhex(entry.hash) if entry.hash else NO_HASH
+        parts.append(ENTRY.pack(entry.size, entry.mtime_ns, entry.inode, sha, entry.flags, len(encoded)))
+        parts.append(encoded)
+
+    index_dir = os.path.dirname(INDEX_FILE)
+    fd, tmp_path = tempfile.mkstemp(prefix=".index-", dir=index_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b"".join(parts))
+        os.replace(tmp_path, INDEX_FILE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _expand(pattern, ignore, jobs):
+    """
+    Resolve one `crpt add` argument to (explicit, walked, scanned): files
+    named directly, {path: stat} for files found under directories, and
+    the directories searched, each with the paths the watcher reported
+    below it (None when the directory was walked in full).
+    """
+    if glob.has_magic(pattern):
+        matches = glob.glob(pattern, recursive=True)
+    else:
+        matches = [pattern] if os.path.exists(pattern) else []
+
+    explicit = []
+    walked = {}
+    scanned = []
+    for match in matches:
+        path = utils.normalize_path(match)
+        if path == worktree.REPO_DIR or path.startswith(worktree.REPO_DIR + "/"):
+            continue
+        if os.path.isdir(match):
+            if path != "." and ignore.match_with_parents(path, True):
+                continue
+            if path == ".":
+                # The watcher already knows which files can have changed
+                candidates = watch.changed_paths()
+                if candidates is not None:
+                    on_disk = worktree.stat_paths(candidates)
+                    walked.update((p, st) for p, st in on_disk.items() if not ignore.match_with_parents(p))
+                    scanned.append((path, candidates))
+                    continue
+            walked.update(worktree.walk_files(match, jobs=jobs, ignore=ignore))
+            scanned.append((path, None))
+        elif os.path.isfile(match):
+            if glob.has_magic(pattern) and ignore.match_with_parents(path):
+                continue
+            explicit.append(path)
+    return explicit, walked, scanned
+
+def stage_paths(patterns, jobs=None):
+    """
+    Stage files, directories (recursively) and glob patterns in one pass.
+
+    Files found by walking a directory or expanding a glob are filtered
+    through .crptignore and staged only if they differ from HEAD; files
+    named explicitly are always staged. Tracked files that are gone, named
+    directly or missing below a walked directory, are staged as removed.
+    All entries are written with a single index write.
+    """
+    entries = read_index()
+    if entries is None:
         print("Repository not initialized.")
         return
 
-    with open('.crpt/index', 'a') as index_file:
-        index_file.write(f"{file_path}\n")
-    print(f"Staged {file_path}")
+    ignore = load_ignore()
+    jobs = jobs or worktree.default_jobs()
+
+    sparse = load_sparse()
+    head_files = None
+    tracked = set()
+
+    def load_tracked():
+        nonlocal head_files
+        if head_files is None:
+            head_files = utils.commit_snapshot(utils.resolve_head())
+            tracked.update(head_files)
+            tracked.update(entry.path for entry in entries.staged() if not entry.flags & FLAG_REMOVED)
+        return tracked
+
+    targets = {}
+    explicit = set()
+    searched = []
+    removed = set()
+    unmatched = []
+    for pattern in patterns:
+        files, walked, scanned = _expand(pattern, ignore, jobs)
+        searched.extend(scanned)
+        if not os.path.exists(pattern) and not glob.has_magic(pattern):
+            path = utils.normalize_path(pattern)
+            gone = [p for p in load_tracked() if _below(p, path)]
+            if gone:
+                removed.update(gone)
+                continue
+        if not files and not walked:
+            # Reported once the removals below the searched directories are known
+            unmatched.append((pattern, [prefix for prefix, _ in scanned]))
+            continue
+        for path in files:
+            if ignore.match_with_parents(path):
+                print(f"Ignoring {path} (matched {IGNORE_FILE})")
+                continue
+            explicit.add(path)
+            targets[path] = os.stat(path)
+        targets.update(walked)
+
+    # Tracked files a walk did not find were deleted, unless they are only
+    # ignored; with the watcher, only the paths it reported can be gone
+    for prefix, candidates in searched:
+        paths = load_tracked() if candidates is None else load_tracked() & set(candidates)
+        removed.update(path for path in paths
+                       if _below(path, prefix) and path not in targets and not os.path.exists(path))
+    if sparse is not None:
+        # Files outside the sparse patterns are absent on purpose
+        removed = {path for path in removed if sparse.match_with_parents(path)}
+
+    for pattern, prefixes in unmatched:
+        if any(_below(path, prefix) for prefix in prefixes for path in removed):
+            continue
+        if not os.path.exists(pattern) and not glob.has_magic(pattern):
+            print(f"File {pattern} does not exist.")
+        elif os.path.exists(pattern) and ignore.match_with_parents(utils.normalize_path(pattern), os.path.isdir(pattern)):
+            print(f"Ignoring {pattern} (matched {IGNORE_FILE})")
+        else:
+            print(f"No files match {pattern}.")
+
+    if not targets and not removed:
+        return
+
+    # Only walked files are compared with HEAD, so skip reading it otherwise
+    walked_only = [path for path in targets if path not in explicit]
+    if walked_only or removed:
+        load_tracked()
+    head_files = head_files or {}
+    hashes = {}
+    to_hash = []
+    for path, st in targets.items():
+        cached = entries.cached_hash(path, st)
+        if cached is not None:
+            hashes[path] = cached
+        else:
+            to_hash.append(path)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        hashes.update(zip(to_hash, pool.map(utils.hash_file, to_hash)))
+
+    staged = []
+    for path in sorted(targets):
+        file_hash = hashes[path]
+        entry = entries.get(path)
+        already = entry is not None and entry.flags & FLAG_STAGED
+        if path in explicit or already or head_files.get(path) != file_hash:
+            entries[path] = make_entry(path, targets[path], file_hash, FLAG_STAGED)
+            staged.append(path)
+        else:
+            # Unchanged since HEAD; still refresh the stat cache
+            entries[path] = make_entry(path, targets[path], file_hash, entry.flags if entry else 0)
+    for path in sorted(removed):
+        entry = entries.get(path)
+        if path not in head_files:
+            # Staged but never committed: there is nothing left to remove
+            entries.pop(path, None)
+        elif entry is None or not entry.flags & FLAG_REMOVED:
+            entries[path] = make_removal(path)
+            staged.append(path)
+    write_index(entries)
+
+    if len(staged) <= 10:
+        for path in staged:
+            print(f"Staged removal of {path}" if path in removed else f"Staged {path}")
+    else:
+        print(f"Staged {len(staged)} files")
+
+def stage_file(file_path):
+    stage_paths([file_path])
@@ -0,0 +1,54 @@
+"""
+Sharing the repository key between clones.
+
+Every clone derives its master key with its own random salt, so a second
+clone of a repository cannot read the first one's objects until it has
+the same key. 'crpt key export' prints the key and salt as one line, and
+'crpt key import <line>' stores them in another clone; with CRPT_PASSWORD
+set, the imported salt makes the same password yield the same key.
+"""
+
+import os
+import base64
+import binascii
+from . import refs
+from .encrypt import get_or_create_encryption_key, read_key_files, write_key_files
+
+EXPORT_PREFIX = "crpt-key-v1:"
+
+
+def export_key():
+    if not os.path.exists('.crpt'):
+        print("Repository not initialized.")
+        return
+    key = get_or_create_encryption_key()
+    _, salt = read_key_files()
+    print(EXPORT_PREFIX + base64.b64encode(key).decode() + ":" + base64.b64encode(salt or b"").decode())
+
+
+def import_key(exported):
+    if not os.path.exists('.crpt'):
+        print("Repository not initialized.")
+        return
+    try:
+        if not exported.startswith(EXPORT_PREFIX):
+            raise ValueError("missing prefix")
+        encoded_key, encoded_salt = exported[len(EXPORT_PREFIX):].split(":")
+        key = base64.b64decode(encoded_key, validate=True)
+        salt = base64.b64decode(encoded_salt, validate=True)
+    except (ValueError, binascii.Error):
+        print("❌ Not an exported crpt key (expected the output of 'crpt key export').")
+        return
+
+    current, _ = read_key_files()
+    # Commits a branch already points at would become unreadable; commits
+    # fetched by a pull that could not decrypt them do not count
+    if current not in (None, key) and any(commit_id for commit_id in refs.list_refs().values()):
+        print("❌ This repository already has commits encrypted with another key.")
+        return
+    try:
+        write_key_files(key, salt)
+    except ValueError as e:
+        print("❌", e)
+        return
+    print("✅ Imported the repository key.")
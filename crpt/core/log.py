@@ -0,0 +1,56 @@
+import time
+from . import commit_graph, tree, utils
+
+def _path_entry(meta, path):
+    if meta["tree"]:
+        return tree.lookup(meta["tree"], path)
+    return None
+
+def _touches(meta, parent_meta, paths):
+    """True if the commit changed anything at or below one of paths."""
+    if meta["tree"] and (parent_meta is None or parent_meta["tree"]):
+        # Compare the entry at each path; whole subtrees compare by hash
+        return any(_path_entry(meta, path) != (_path_entry(parent_meta, path) if parent_meta else None)
+                   for path in paths)
+    # Commits made before trees only list the files they changed
+    return any(file == path or file.startswith(path + "/") for file, _ in meta["files"] for path in paths)
+
+def _message(commit_id, meta):
+    try:
+        with open(f"{utils.COMMITS_DIR}/{commit_id}/message.txt", 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return meta["message"]
+
+def show_log(max_count=None, oneline=False, paths=()):
+    head = utils.resolve_head()
+    if not head:
+        print("No commits yet.")
+        return
+
+    paths = [utils.normalize_path(path) for path in paths]
+    shown = 0
+    for commit_id in commit_graph.iter_history(head):
+        if max_count is not None and shown >= max_count:
+            break
+        meta = utils.read_commit_meta(commit_id)
+        if meta is None:
+            break
+        if paths:
+            parent_meta = utils.read_commit_meta(meta["parent"]) if meta["parent"] else None
+            if not _touches(meta, parent_meta, paths):
+                continue
+
+        message = _message(commit_id, meta)
+        if oneline:
+            print(f"{commit_id[:7]} {message.splitlines()[0] if message else ''}")
+        else:
+            if shown:
+                print()
+            print(f"commit {commit_id}")
+            if meta["time"] is not None:
+                print(f"Date:   {time.strftime('%a %b %d %H:%M:%S %Y %z', time.localtime(meta['time']))}")
+            print()
+            for line in message.splitlines():
+                print(f"    {line}")
+        shown += 1
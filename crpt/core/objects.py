@@ -0,0 +1,167 @@
+"""
+Local object store.
+
+Loose objects live under .crpt/objects/<first two hex digits>/<remaining
+digits> so no single directory grows past a few thousand entries.
+Repositories created with the old flat layout are migrated the first time
+the store is used. Objects can also be packed (see pack.py); reads look in
+packs first and loose objects second. Every command looks objects up
+through this module rather than building paths itself.
+"""
+
+import io
+import os
+import re
+import tempfile
+from . import config, pack
+from .compress import DEFAULT_CODEC_NAME
+from .delta import apply_delta
+from .encrypt import decrypt_stream, encrypt_file_content, get_or_create_encryption_key
+
+OBJECTS_DIR = ".crpt/objects"
+PACK_DIR = f"{OBJECTS_DIR}/pack"
+LAYOUT_FANOUT = "fanout"
+
+_OBJECT_NAME = re.compile(r"^[0-9a-f]{40}$")
+_layout_checked = False
+_packs = None
+# Objects this process has moved into place, awaiting durable.sync()
+_published = []
+
+def ensure_layout():
+    """Migrate a flat objects directory to the fan-out layout, once per process."""
+    global _layout_checked
+    if _layout_checked or not os.path.isdir(OBJECTS_DIR):
+        return
+    _layout_checked = True
+    if config.get("core", "objectLayout") == LAYOUT_FANOUT:
+        return
+    migrated = migrate_flat_objects()
+    config.set_value("core", "objectLayout", LAYOUT_FANOUT)
+    if migrated:
+        print(f"Migrated {migrated} objects to the fan-out layout")
+
+def migrate_flat_objects():
+    moved = 0
+    with os.scandir(OBJECTS_DIR) as entries:
+        names = [e.name for e in entries if e.is_file() and _OBJECT_NAME.match(e.name)]
+    for name in names:
+        shard = f"{OBJECTS_DIR}/{name[:2]}"
+        os.makedirs(shard, exist_ok=True)
+        os.replace(f"{OBJECTS_DIR}/{name}", f"{shard}/{name[2:]}")
+        moved += 1
+    return moved
+
+def object_path(object_hash):
+    ensure_layout()
+    return f"{OBJECTS_DIR}/{object_hash[:2]}/{object_hash[2:]}"
+
+def packs():
+    global _packs
+    if _packs is None:
+        _packs = pack.load_packs(PACK_DIR)
+    return _packs
+
+def reload_packs():
+    global _packs
+    for p in _packs or []:
+        p.close()
+    _packs = None
+
+def has_object(object_hash):
+    return any(object_hash in p for p in packs()) or os.path.exists(object_path(object_hash))
+
+def _find_packed(object_hash):
+    for p in packs():
+        found = p.entry(object_hash)
+        if found is not None:
+            return p, found[0]
+    return None, None
+
+def is_delta(object_hash):
+    _, entry_type = _find_packed(object_hash)
+    return entry_type == pack.ENTRY_DELTA
+
+def open_object(object_hash):
+    p, entry_type = _find_packed(object_hash)
+    if entry_type == pack.ENTRY_DELTA:
+        # Rebuild the full object from its delta chain and re-encrypt it
+        content = read_plaintext(object_hash)
+        compression = config.get("core", "compression", DEFAULT_CODEC_NAME)
+        encrypted = encrypt_file_content(content, object_hash, get_or_create_encryption_key(), compression)
+        return io.BytesIO(encrypted)
+    if p is not None:
+        return p.open(object_hash)
+    return open(object_path(object_hash), 'rb')
+
+def object_size(object_hash):
+    """Size in bytes of a stored (encrypted) object."""
+    with open_object(object_hash) as f:
+        return f.seek(0, io.SEEK_END)
+
+def read_object(object_hash):
+    with open_object(object_hash) as f:
+        return f.read()
+
+def read_plaintext(object_hash, encryption_key=None):
+    """Decrypt one stored object, resolving pack deltas (not chunk manifests)."""
+    if encryption_key is None:
+        encryption_key = get_or_create_encryption_key()
+    out = io.BytesIO()
+    p, entry_type = _find_packed(object_hash)
+    if entry_type == pack.ENTRY_DELTA:
+        base_hash, reader = p.open_delta(object_hash)
+        decrypt_stream(reader, out, object_hash, encryption_key)
+        return apply_delta(read_plaintext(base_hash, encryption_key), out.getvalue())
+    with open_object(object_hash) as f:
+        decrypt_stream(f, out, object_hash, encryption_key)
+    return out.getvalue()
+
+def iter_loose_objects():
+    ensure_layout()
+    if not os.path.isdir(OBJECTS_DIR):
+        return
+    with os.scandir(OBJECTS_DIR) as shards:
+        shard_names = [e.name for e in shards if e.is_dir() and len(e.name) == 2]
+    for shard in sorted(shard_names):
+        with os.scandir(f"{OBJECTS_DIR}/{shard}") as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    yield shard + entry.name
+
+def remove_loose_object(object_hash):
+    path = object_path(object_hash)
+    os.remove(path)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+def new_temp():
+    """Create a temporary file in the store; returns (fd, path)."""
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    return tempfile.mkstemp(prefix=".tmp-", dir=OBJECTS_DIR)
+
+def publish(tmp_path, object_hash):
+    """Move a finished temporary file into place as object_hash."""
+    path = object_path(object_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    _published.append(path)
+
+def take_published():
+    """Return and forget the paths published since the last call."""
+    paths = list(_published)
+    del _published[:]
+    return paths
+
+def write_object(object_hash, data):
+    fd, tmp_path = new_temp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        publish(tmp_path, object_hash)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,247 @@
+"""
+Pack files: many objects stored in one file.
+
+A pack (pack-<name>.pack) is a header followed by entries, each a type
+byte and either the stored object bytes or, for a delta entry, the base
+object's binary hash and an encrypted delta against that base. Its index (pack-<name>.idx) holds a
+256-entry fan-out table and fixed-width records sorted by object hash,
+so a lookup is an mmap plus a binary search within one fan-out bucket.
+"""
+
+import io
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+
+PACK_MAGIC = b"CPCK"
+INDEX_MAGIC = b"CPIX"
+PACK_VERSION = 1
+
+PACK_HEADER = struct.Struct(">4sII")    # magic, version, object count
+INDEX_HEADER = struct.Struct(">4sII")   # magic, version, object count
+FANOUT = struct.Struct(">256I")         # cumulative count per first byte
+INDEX_ENTRY = struct.Struct(">20sQQ")   # binary hash, entry offset, payload length
+
+ENTRY_FULL = 1   # payload is the stored object as-is
+ENTRY_DELTA = 2  # payload is a 20-byte base hash and an encrypted delta object
+
+COPY_SIZE = 1024 * 1024
+
+
+class SectionReader:
+    """Read-only file-like view of a byte range of a memory map."""
+
+    def __init__(self, data, start, length):
+        self._data = data
+        self._start = start
+        self._length = length
+        self._pos = 0
+
+    def read(self, size=-1):
+        remaining = self._length - self._pos
+        if size < 0 or size > remaining:
+            size = remaining
+        begin = self._start + self._pos
+        self._pos += size
+        return self._data[begin:begin + size]
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._pos = max(0, min(offset, self._length))
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PackIndex:
+    def __init__(self, path):
+        self.path = path
+        self._map = _map_file(path)
+        magic, version, count = INDEX_HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"{path} is not a supported pack index")
+        self.count = count
+        self._fanout = FANOUT.unpack_from(self._map, INDEX_HEADER.size)
+        self._entries = INDEX_HEADER.size + FANOUT.size
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self._map, self._entries + i * INDEX_ENTRY.size)
+
+    def find(self, object_hash):
+        """Return (offset, length) for object_hash, or None."""
+        key = bytes.fromhex(object_hash)
+        lo = self._fanout[key[0] - 1] if key[0] else 0
+        hi = self._fanout[key[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._entries + mid * INDEX_ENTRY.size
+            name = self._map[start:start + 20]
+            if name == key:
+                _, offset, length = self._entry(mid)
+                return offset, length
+            if name < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __iter__(self):
+        for i in range(self.count):
+            name, offset, length = self._entry(i)
+            yield name.hex(), offset, length
+
+    def close(self):
+        self._map.close()
+
+
+class Pack:
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self.index_path = pack_path[:-len(".pack")] + ".idx"
+        self.name = os.path.basename(pack_path)[:-len(".pack")]
+        self.index = PackIndex(self.index_path)
+        self._map = _map_file(pack_path)
+        magic, version, _ = PACK_HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"{pack_path} is not a supported pack")
+
+    def __contains__(self, object_hash):
+        return self.index.find(object_hash) is not None
+
+    def entry(self, object_hash):
+        """Return (entry type, payload offset, payload length), or None."""
+        found = self.index.find(object_hash)
+        if found is None:
+            return None
+        offset, length = found
+        return self._map[offset], offset + 1, length
+
+    def open(self, object_hash):
+        """
+        Return a reader for a full entry's object bytes, or None if absent.
+
+        Delta entries raise ValueError; they are resolved by the object store.
+        """
+        found = self.entry(object_hash)
+        if found is None:
+            return None
+        entry_type, offset, length = found
+        if entry_type != ENTRY_FULL:
+            raise ValueError(f"Unsupported pack entry type {entry_type} in {self.name}")
+        return SectionReader(self._map, offset, length)
+
+    def open_delta(self, object_hash):
+        """Return (base hash, reader for the encrypted delta) for a delta entry."""
+        entry_type, offset, length = self.entry(object_hash)
+        if entry_type != ENTRY_DELTA:
+            raise ValueError(f"{object_hash} is not a delta in {self.name}")
+        base_hash = self._map[offset:offset + 20].hex()
+        return base_hash, SectionReader(self._map, offset + 20, length - 20)
+
+    def __iter__(self):
+        for object_hash, _, _ in self.index:
+            yield object_hash
+
+    def close(self):
+        self._map.close()
+        self.index.close()
+
+
+def load_packs(pack_dir):
+    """Open every pack in pack_dir, newest first."""
+    if not os.path.isdir(pack_dir):
+        return []
+    paths = [os.path.join(pack_dir, name) for name in os.listdir(pack_dir)
+             if name.startswith("pack-") and name.endswith(".pack")]
+    paths = [p for p in paths if os.path.exists(p[:-len(".pack")] + ".idx")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return [Pack(p) for p in paths]
+
+
+def write_pack(entries, pack_dir):
+    """
+    Write (object_hash, reader, base_hash) entries as a new pack.
+
+    Entries with a base_hash are stored as deltas and their reader yields
+    the encrypted delta; the others are stored in full.
+
+    Returns (pack name, object count, pack size in bytes).
+    """
+    os.makedirs(pack_dir, exist_ok=True)
+    fd, tmp_pack = tempfile.mkstemp(prefix=".tmp-", suffix=".pack", dir=pack_dir)
+    records = []
+    name_sha = hashlib.sha1()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0))
+            for object_hash, reader, base_hash in entries:
+                offset = out.tell()
+                if base_hash:
+                    out.write(bytes([ENTRY_DELTA]) + bytes.fromhex(base_hash))
+                    length = 20
+                else:
+                    out.write(bytes([ENTRY_FULL]))
+                    length = 0
+                for block in iter(lambda: reader.read(COPY_SIZE), b""):
+                    out.write(block)
+                    length += len(block)
+                records.append((bytes.fromhex(object_hash), offset, length))
+                name_sha.update(object_hash.encode())
+            size = out.tell()
+            out.seek(0)
+            out.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(records)))
+            out.flush()
+            os.fsync(out.fileno())
+
+        records.sort()
+        fanout = [0] * 256
+        for name, _, _ in records:
+            fanout[name[0]] += 1
+        for i in range(1, 256):
+            fanout[i] += fanout[i - 1]
+
+        name = f"pack-{name_sha.hexdigest()}"
+        tmp_index = tmp_pack[:-len(".pack")] + ".idx"
+        with open(tmp_index, 'wb') as out:
+            out.write(INDEX_HEADER.pack(INDEX_MAGIC, PACK_VERSION, len(records)))
+            out.write(FANOUT.pack(*fanout))
+            for record in records:
+                out.write(INDEX_ENTRY.pack(*record))
+            out.flush()
+            os.fsync(out.fileno())
+
+        # The pack goes first: readers only load packs that have an index
+        os.replace(tmp_pack, os.path.join(pack_dir, f"{name}.pack"))
+        os.replace(tmp_index, os.path.join(pack_dir, f"{name}.idx"))
+    except BaseException:
+        for path in (tmp_pack, tmp_pack[:-len(".pack")] + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return name, len(records), size
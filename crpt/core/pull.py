@@ -1,56 +1,106 @@
 import os
-import base64
 import requests
+from . import checkout, client, commit_graph, fetch, index, refs, transport, utils
 
-def pull(repo_name="default", remote_url="http://127.0.0.1:8000/pull/"):
+def _write_commit(data):
+    """Record a pulled commit locally, unless it is already there."""
+    commit_id = data.get("id") or data["commit_id"]
+    commit_dir = f".crpt/commits/{commit_id}"
+    if os.path.exists(f"{commit_dir}/meta.txt"):
+        return commit_id
+    os.makedirs(commit_dir, exist_ok=True)
+
+    # write message
+    with open(f"{commit_dir}/message.txt", "w") as f:
+        f.write(data["message"])
+
+    # write meta
+    with open(f"{commit_dir}/meta.txt", "w") as f:
+        if data.get("parent"):
+            f.write(f"Parent: {data['parent']}\n")
+        if data.get("tree"):
+            f.write(f"Tree: {data['tree']}\n")
+        f.write(f"Message: {data['message']}\n")
+        if data.get("time") is not None:
+            f.write(f"Time: {data['time']}\n")
+        for blob in data["blobs"]:
+            # Blobs without a path are chunks of large files and trees
+            if blob["path"]:
+                f.write(f"{blob['path']}:{blob['hash']}\n")
+
+    commit_graph.append_commit(commit_id, data.get("parent"), data.get("time") or 0)
+    return commit_id
+
+def pull(repo_name=None, partial=False, jobs=None):
     if not os.path.exists('.crpt/HEAD'):
         print("No repo found.")
         return
+    repo_name = repo_name or client.repo_name()
 
-    # get current branch
-    with open('.crpt/HEAD', 'r') as f:
-        ref = f.read().strip()
-    branch = ref.split("/")[-1]
+    # get current branch and the commit it is at
+    branch = refs.current_branch() or "main"
+    previous = utils.resolve_head()
 
+    # A partial clone keeps fetching lazily once it has been set up
+    partial = partial or fetch.is_partial()
     payload = {
         "repo": repo_name,
-        "branch": branch
+        "branch": branch,
+        "partial": partial,
+        # The server answers 304 if the branch has not moved, and otherwise
+        # sends only the commits, and their objects, after this one
+        "have": previous
     }
 
-    response = requests.post(remote_url, json=payload)
+    # The commits come as a binary stream: a header, then their objects,
+    # each stored as it arrives
+    try:
+        response = client.post("pull/stream/", json=payload, stream=True)
+    except requests.RequestException as e:
+        print("❌ Pull failed:", e)
+        return
+    if response.status_code == 304:
+        print("Already up to date.")
+        return
     if response.status_code != 200:
         print("❌ Pull failed:", response.text)
         return
 
-    data = response.json()["commit"]
-    commit_id = data["id"]
-    commit_dir = f".crpt/commits/{commit_id}"
-    os.makedirs(commit_dir, exist_ok=True)
-
-    # write message
-    with open(f"{commit_dir}/message.txt", "w") as f:
-        f.write(data["message"])
+    # Missing objects (unchanged trees, or every file of a partial clone)
+    # are fetched from the same server on demand
+    fetch.remember_remote(client.base_url(), repo_name, partial)
 
-    # write meta
-    with open(f"{commit_dir}/meta.txt", "w") as f:
-        f.write(f"Parent: {data.get('parent')}\n")
-        f.write(f"Message: {data['message']}\n")
-        for blob in data["blobs"]:
-            f.write(f"{blob['path']}:{blob['hash']}\n")
+    try:
+        header, _ = transport.receive(response.iter_content(transport.FRAME_SIZE))
+    except (ValueError, requests.RequestException) as e:
+        print("❌ Pull failed:", e)
+        return
+    for data in header.get("commits") or [header["commit"]]:
+        commit_id = _write_commit(data)
 
-    # write blobs
-    for blob in data["blobs"]:
-        blob_path = f".crpt/objects/{blob['hash']}"
-        os.makedirs(".crpt/objects", exist_ok=True)
-        with open(blob_path, "wb") as f:
-            f.write(base64.b64decode(blob["content"]))
+    # Never move the branch backwards: a local branch with commits the
+    # remote lacks is either ahead of it or has diverged from it
+    if previous and previous != commit_id:
+        if commit_graph.is_ancestor(commit_id, previous):
+            print(f"Already up to date; '{branch}' is ahead of the remote. Run 'crpt push' to send the new commits.")
+            return
+        if not header.get("fast_forward") and not commit_graph.is_ancestor(previous, commit_id):
+            print(f"❌ Pull failed: '{branch}' and the remote have diverged "
+                  f"(local {previous[:7]}, remote {commit_id[:7]}); the local commits were kept.")
+            return
 
-        # write to working directory
-        with open(blob["path"], "wb") as f:
-            f.write(base64.b64decode(blob["content"]))
+    entries = index.read_index()
+    if entries is None:
+        entries = index.Index()
+    # Without a tree the commit only lists its own files, so nothing can be
+    # known to be deleted
+    result = checkout.update_working_tree(previous, commit_id, entries, jobs,
+                                          allow_deletes=bool(data.get("tree")))
+    if result is None:
+        return
 
     # update HEAD reference
-    with open(f".crpt/refs/heads/{branch}", "w") as f:
-        f.write(commit_id)
+    refs.update_ref(f"refs/heads/{branch}", commit_id)
 
-    print(f"✅ Pulled latest commit: {commit_id[:7]}")
+    updated, removed = result
+    print(f"✅ Pulled latest commit: {commit_id[:7]} ({updated} updated, {removed} removed)")
@@ -1,68 +1,159 @@
 import os
-import json
-import base64
 import requests
+from . import chunking, client, refs, transport, tree, upload, utils
+from .encrypt import get_or_create_encryption_key
 
-def push(repo_name="default", remote_url="http://127.0.0.1:8000/push/"):
+# Most hashes sent in one /negotiate/ request
+NEGOTIATE_BATCH_SIZE = 10000
+# Commits asked about at a time while looking for the remote's tip
+COMMIT_BATCH_SIZE = 256
+
+def missing_on_remote(repo_name, hashes):
+    """Ask the remote which of the given objects it lacks; returns them as a set."""
+    hashes = list(dict.fromkeys(hashes))
+
+    def negotiate(batch):
+        response = client.post("negotiate/", json={"repo": repo_name, "hashes": batch})
+        if response.status_code != 200:
+            raise RuntimeError(f"Negotiation failed: {response.text}")
+        return response.json().get("missing", [])
+
+    batches = [hashes[start:start + NEGOTIATE_BATCH_SIZE] for start in range(0, len(hashes), NEGOTIATE_BATCH_SIZE)]
+    return {h for missing in client.map_parallel(negotiate, batches) for h in missing}
+
+def unpushed_commits(repo_name, commit_id):
+    """
+    Walk back from commit_id to the first commit the remote already has.
+
+    Returns the commits the remote lacks, oldest first, as (id, meta) pairs.
+    """
+    unpushed = []
+    while commit_id:
+        batch = []
+        while commit_id and len(batch) < COMMIT_BATCH_SIZE:
+            meta = utils.read_commit_meta(commit_id)
+            if meta is None:
+                raise RuntimeError(f"Commit data for {commit_id[:7]} is missing")
+            batch.append((commit_id, meta))
+            commit_id = meta["parent"]
+
+        response = client.post("negotiate/", json={"repo": repo_name, "commits": [c for c, _ in batch]})
+        if response.status_code != 200:
+            raise RuntimeError(f"Negotiation failed: {response.text}")
+        missing = set(response.json().get("missing_commits", []))
+        for pair in batch:
+            if pair[0] not in missing:
+                return unpushed[::-1]
+            unpushed.append(pair)
+    return unpushed[::-1]
+
+def _commit_objects(meta, encryption_key):
+    """The objects a commit refers to: (its files, chunks of its large files, trees new since its parent)."""
+    chunk_hashes = []
+    for path, blob_hash in meta["files"]:
+        if chunking.is_manifest(blob_hash):
+            manifest = chunking.read_manifest(blob_hash, encryption_key)
+            chunk_hashes.extend(chunk_hash for chunk_hash, _ in manifest)
+
+    # Directory trees that changed since the parent commit
+    tree_hashes = tree.new_trees(utils.commit_tree(meta["parent"]), meta["tree"])
+    return [blob_hash for _, blob_hash in meta["files"]], chunk_hashes, tree_hashes
+
+def push(repo_name=None):
     if not os.path.exists('.crpt/HEAD'):
         print("No repo found.")
         return
+    repo_name = repo_name or client.repo_name()
 
-    # get current branch
-    with open('.crpt/HEAD', 'r') as f:
-        ref = f.read().strip()
-    branch = ref.split("/")[-1]
-
-    # get latest commit
-    head_ref_path = f".crpt/{ref}"
-    if not os.path.exists(head_ref_path):
+    # get current branch and its latest commit
+    branch = refs.current_branch() or "main"
+    commit_id = utils.resolve_head()
+    if not commit_id:
         print("Nothing to push.")
         return
 
-    with open(head_ref_path, 'r') as f:
-        commit_id = f.read().strip()
-
-    commit_dir = f".crpt/commits/{commit_id}"
-    if not os.path.exists(commit_dir):
+    if not os.path.exists(f".crpt/commits/{commit_id}"):
         print("Commit not found.")
         return
 
-    # parse commit metadata
-    with open(f"{commit_dir}/meta.txt") as f:
-        lines = f.readlines()
-
-    blobs = []
-    parent_id = None
-    for line in lines:
-        if line.startswith("Parent:"):
-            parent_id = line.split(":", 1)[1].strip()
-        elif ":" in line and not line.startswith("Message"):
-            path, blob_hash = line.strip().split(":")
-            blob_path = f".crpt/objects/{blob_hash}"
-            with open(blob_path, "rb") as bf:
-                encoded = base64.b64encode(bf.read()).decode()
-            blobs.append({
-                "path": path,
-                "hash": blob_hash,
-                "content": encoded
-            })
-
-    with open(f"{commit_dir}/message.txt") as f:
-        message = f.read().strip()
+    # Every commit between the remote's tip and HEAD is sent, oldest first
+    try:
+        commits = unpushed_commits(repo_name, commit_id)
+    except (RuntimeError, requests.RequestException) as e:
+        print("❌ Push failed:", e)
+        return
+    if not commits:
+        # The remote has the commit already; only the branch has to point at it
+        commits = [(commit_id, utils.read_commit_meta(commit_id))]
+
+    encryption_key = get_or_create_encryption_key()
+    commit_objects = [_commit_objects(meta, encryption_key) for _, meta in commits]
 
-    payload = {
-        "repo": repo_name,
-        "commit": {
-            "id": commit_id,
+    # Only objects the remote does not already have are uploaded
+    candidates = [object_hash for groups in commit_objects for group in groups for object_hash in group]
+    try:
+        missing = missing_on_remote(repo_name, candidates)
+    except (RuntimeError, requests.RequestException) as e:
+        print("❌ Push failed:", e)
+        return
+
+    # Every file is listed so its commit records it; chunks of large files
+    # and trees are listed without a path, and only by the first commit that
+    # uploads them
+    uploads = [object_hash for object_hash in dict.fromkeys(candidates) if object_hash in missing]
+    listed = set()
+    payload_commits = []
+    for (pushed_id, meta), (_, chunk_hashes, tree_hashes) in zip(commits, commit_objects):
+        blobs = [{"path": path, "hash": blob_hash} for path, blob_hash in meta["files"]]
+        for object_hash in dict.fromkeys(chunk_hashes + tree_hashes):
+            if object_hash in missing and object_hash not in listed:
+                blobs.append({"path": "", "hash": object_hash})
+                listed.add(object_hash)
+
+        with open(f".crpt/commits/{pushed_id}/message.txt") as f:
+            message = f.read().strip()
+        payload_commits.append({
+            "id": pushed_id,
             "message": message,
             "branch": branch,
-            "parent": parent_id,
+            "parent": meta["parent"],
+            "tree": meta["tree"],
+            "time": meta["time"],
             "blobs": blobs
-        }
+        })
+
+    # Large objects go first, through resumable upload sessions; a delta-packed
+    # object is rebuilt once, and sized, uploaded or streamed from that copy
+    large = [object_hash for object_hash in uploads if upload.source_size(object_hash) >= upload.UPLOAD_THRESHOLD]
+    try:
+        for object_hash in large:
+            upload.upload_object(repo_name, object_hash)
+    except (RuntimeError, requests.RequestException) as e:
+        print("❌ Push failed:", e)
+        print("Run 'crpt push' again to resume the upload.")
+        return
+    streamed = [object_hash for object_hash in uploads if object_hash not in large]
+
+    payload = {
+        "repo": repo_name,
+        "commit": payload_commits[-1],
+        "commits": payload_commits
     }
 
-    response = requests.post(remote_url, json=payload)
+    # Objects are streamed in binary frames (chunked transfer encoding),
+    # read from the store one frame at a time; a generator cannot be resent,
+    # and a failed push is resumed by running it again
+    try:
+        response = client.post("push/stream/", data=transport.encode(payload, streamed, upload.open_source),
+                               headers={"Content-Type": transport.CONTENT_TYPE}, retry=False)
+    except requests.RequestException as e:
+        print("❌ Push failed:", e)
+        return
+    finally:
+        for object_hash in streamed:
+            upload.remove_spool(object_hash)
     if response.status_code == 200:
-        print("✅ Push successful.")
+        print(f"✅ Push successful ({len(payload_commits)} commits, "
+              f"{len(uploads)} of {len(set(candidates))} objects uploaded).")
     else:
         print("❌ Push failed:", response.text)
@@ -0,0 +1,220 @@
+"""
+Reference database.
+
+A branch is either a loose file .crpt/refs/heads/<name> holding a commit
+id, or a "<commit id> <ref name>" line in .crpt/packed-refs. A loose ref
+overrides a packed one of the same name. Packing keeps the number of files
+small when there are thousands of branches: `crpt repack` packs every
+loose ref, and creating a branch packs them once more than
+LOOSE_REFS_LIMIT have piled up.
+
+HEAD, packed-refs and every ref looked up are read at most once per
+process. All writes go through this module so the cache stays current.
+"""
+
+import os
+import re
+from . import durable
+
+REPO_DIR = ".crpt"
+HEAD_FILE = f"{REPO_DIR}/HEAD"
+PACKED_REFS_FILE = f"{REPO_DIR}/packed-refs"
+HEADS = "refs/heads/"
+
+LOOSE_REFS_LIMIT = 1000
+
+_COMMIT_ID = re.compile(r"^[0-9a-f]{40}$")
+_MISSING = object()
+
+_head = _MISSING
+_packed = None
+_loose = {}
+
+def _ref_path(name):
+    return f"{REPO_DIR}/{name}"
+
+def valid_branch_name(name):
+    parts = name.split("/")
+    return (bool(name) and not name.startswith("-") and ".." not in name
+            and not any(c.isspace() or c in "~^:?*[\\" for c in name)
+            and all(part and not part.startswith(".") and not part.endswith(".lock") for part in parts))
+
+def read_head():
+    """Return the raw contents of HEAD, or None if the repository has none."""
+    global _head
+    if _head is _MISSING:
+        try:
+            with open(HEAD_FILE, 'r') as f:
+                _head = f.read().strip()
+        except FileNotFoundError:
+            _head = None
+    return _head
+
+def head_ref():
+    """Return the ref HEAD points at (e.g. refs/heads/main), or None if detached."""
+    head = read_head()
+    if head is None:
+        return None
+    # HEAD has been written both as 'refs/heads/x' and 'ref: refs/heads/x'
+    if head.startswith("ref:"):
+        head = head[len("ref:"):].strip()
+    return head if head.startswith("refs/") else None
+
+def current_branch():
+    ref = head_ref()
+    if ref and ref.startswith(HEADS):
+        return ref[len(HEADS):]
+    return None
+
+def set_head(ref):
+    """Point HEAD at ref; returns the HEAD path if it had to be rewritten, else None."""
+    global _head
+    content = f"ref: {ref}"
+    if read_head() == content:
+        return None
+    durable.write_atomic(HEAD_FILE, content)
+    _head = content
+    return HEAD_FILE
+
+def _packed_refs():
+    global _packed
+    if _packed is None:
+        _packed = {}
+        try:
+            with open(PACKED_REFS_FILE, 'r') as f:
+                for line in f:
+                    if line.startswith("#") or not line.strip():
+                        continue
+                    commit_id, name = line.rstrip("\n").split(" ", 1)
+                    _packed[name] = commit_id
+        except FileNotFoundError:
+            pass
+    return _packed
+
+def read_ref(name):
+    """Return the commit id a ref points at, or None."""
+    value = _loose.get(name, _MISSING)
+    if value is _MISSING:
+        try:
+            with open(_ref_path(name), 'r') as f:
+                value = f.read().strip() or None
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            value = None
+        _loose[name] = value
+    if value is not None:
+        return value
+    return _packed_refs().get(name)
+
+def ref_exists(name):
+    # Branches created before the first commit are empty loose files
+    return read_ref(name) is not None or os.path.isfile(_ref_path(name))
+
+def conflicting_ref(name):
+    """
+    Return an existing ref that name cannot be created next to, or None.
+
+    A ref is a file, so refs/heads/a and refs/heads/a/b cannot both exist,
+    whether either one is loose or packed.
+    """
+    parts = name.split("/")
+    for i in range(len(parts) - 1, 2, -1):
+        parent = "/".join(parts[:i])
+        if ref_exists(parent):
+            return parent
+    packed = next((other for other in _packed_refs() if other.startswith(name + "/")), None)
+    if packed:
+        return packed
+    if os.path.isdir(_ref_path(name)):
+        loose = _scan_loose(name + "/")
+        if loose:
+            return min(loose)
+    return None
+
+def resolve_head():
+    """Return the commit id HEAD points at, or None before the first commit."""
+    head = read_head()
+    if head is None:
+        return None
+    ref = head_ref()
+    if ref is None:
+        return head if _COMMIT_ID.match(head) else None
+    return read_ref(ref)
+
+def update_ref(name, commit_id):
+    """Point a ref at commit_id with an atomic replace; returns the file written."""
+    path = _ref_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    durable.write_atomic(path, commit_id or "")
+    _loose[name] = commit_id or None
+    return path
+
+def delete_ref(name):
+    try:
+        os.remove(_ref_path(name))
+    except FileNotFoundError:
+        pass
+    _loose[name] = None
+    if name in _packed_refs():
+        packed = dict(_packed_refs())
+        del packed[name]
+        _write_packed(packed)
+
+def _scan_loose(prefix):
+    """Return {name: commit id} for the loose refs under prefix."""
+    found = {}
+    root = _ref_path(prefix.rstrip("/"))
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, REPO_DIR).replace(os.sep, "/")
+            with open(path, 'r') as f:
+                value = f.read().strip() or None
+            _loose[name] = value
+            found[name] = value
+    return found
+
+def list_refs(prefix=HEADS):
+    """Return {name: commit id or None} for every ref under prefix, sorted by name."""
+    refs = {name: commit_id for name, commit_id in _packed_refs().items() if name.startswith(prefix)}
+    refs.update(_scan_loose(prefix))
+    return dict(sorted(refs.items()))
+
+def loose_count(prefix=HEADS):
+    count = 0
+    for _, _, files in os.walk(_ref_path(prefix.rstrip("/"))):
+        count += len(files)
+    return count
+
+def _write_packed(refs):
+    global _packed
+    lines = ["# crpt packed-refs\n"]
+    lines.extend(f"{commit_id} {name}\n" for name, commit_id in sorted(refs.items()))
+    durable.write_atomic(PACKED_REFS_FILE, "".join(lines))
+    _packed = dict(refs)
+
+def pack_refs():
+    """Move every loose ref into packed-refs; returns the number of refs packed."""
+    loose = _scan_loose(HEADS)
+    if not loose:
+        return 0
+    refs = dict(_packed_refs())
+    # Branches created before their first commit have no id and stay loose
+    refs.update((name, commit_id) for name, commit_id in loose.items() if commit_id)
+    _write_packed(refs)
+    for name, commit_id in loose.items():
+        if not commit_id:
+            continue
+        path = _ref_path(name)
+        os.remove(path)
+        _loose[name] = None
+        # Drop directories of nested branch names once empty
+        directory = os.path.dirname(path)
+        while directory != _ref_path(HEADS.rstrip("/")):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+    return sum(1 for commit_id in loose.values() if commit_id)
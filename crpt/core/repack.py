@@ -0,0 +1,134 @@
+import io
+import os
+from . import config, objects, pack, refs, utils, chunking
+from .compress import DEFAULT_CODEC_NAME
+from .delta import create_delta
+from .encrypt import encrypt_file_content, get_or_create_encryption_key
+
+MAX_DELTA_DEPTH = 10
+# Larger objects are always stored in full
+MAX_DELTA_SIZE = 16 * 1024 * 1024
+# A delta is only kept if it is at most this fraction of the full object
+MAX_DELTA_RATIO = 0.5
+
+def delta_candidates():
+    """
+    Map each file version to the previous version of the same path.
+
+    Commits are walked from the roots along their Parent: links, carrying
+    the latest hash seen for every path, so bases come before their targets.
+    """
+    commits = {commit_id: utils.read_commit_meta(commit_id) for commit_id in utils.list_commits()}
+    children = {}
+    roots = []
+    for commit_id in sorted(commits):
+        parent = commits[commit_id]["parent"]
+        if parent in commits:
+            children.setdefault(parent, []).append(commit_id)
+        else:
+            roots.append(commit_id)
+
+    candidates = {}
+    stack = [(root, {}) for root in roots]
+    while stack:
+        commit_id, latest = stack.pop()
+        files = commits[commit_id]["files"]
+        for path, file_hash in files:
+            base = latest.get(path)
+            if base and base != file_hash and file_hash not in candidates:
+                candidates[file_hash] = base
+        for path, file_hash in files:
+            latest[path] = file_hash
+        kids = children.get(commit_id, [])
+        for i, kid in enumerate(kids):
+            # The last child inherits the map; the others get copies
+            stack.append((kid, latest if i == len(kids) - 1 else dict(latest)))
+    return candidates
+
+def _stored_size(object_hash):
+    with objects.open_object(object_hash) as reader:
+        return reader.seek(0, io.SEEK_END)
+
+def plan_deltas(names, encryption_key, compression):
+    """Return {target: (base, encrypted delta)} and the bytes saved."""
+    chosen = {}
+    depth = {}
+    saved = 0
+    for target, base in delta_candidates().items():
+        if target not in names or base not in names:
+            continue
+        if chunking.is_manifest(target) or chunking.is_manifest(base):
+            continue
+
+        # Never create a cycle, and keep chains short so reads stay fast
+        node = base
+        while node in chosen and node != target:
+            node = chosen[node][0]
+        if node == target or depth.get(base, 0) + 1 > MAX_DELTA_DEPTH:
+            continue
+
+        target_content = objects.read_plaintext(target, encryption_key)
+        if len(target_content) > MAX_DELTA_SIZE:
+            continue
+        base_content = objects.read_plaintext(base, encryption_key)
+        if len(base_content) > MAX_DELTA_SIZE:
+            continue
+
+        delta = create_delta(base_content, target_content)
+        encrypted = encrypt_file_content(delta, target, encryption_key, compression)
+        full_size = _stored_size(target)
+        if len(encrypted) + 20 > full_size * MAX_DELTA_RATIO:
+            continue
+
+        chosen[target] = (base, encrypted)
+        depth[target] = depth.get(base, 0) + 1
+        saved += full_size - len(encrypted) - 20
+    return chosen, saved
+
+def repack():
+    if not os.path.exists('.crpt'):
+        print("Repository not initialized.")
+        return
+
+    packed_refs = refs.pack_refs()
+    if packed_refs:
+        print(f"✅ Packed {packed_refs} refs into {refs.PACKED_REFS_FILE}")
+
+    loose = list(objects.iter_loose_objects())
+    old_packs = objects.packs()
+    if not loose and len(old_packs) <= 1:
+        print("Nothing to repack.")
+        return
+
+    # One pack holding every object, loose and already packed
+    names = set(loose)
+    for p in old_packs:
+        names.update(p)
+
+    encryption_key = get_or_create_encryption_key()
+    compression = config.get("core", "compression", DEFAULT_CODEC_NAME)
+    deltas, saved = plan_deltas(names, encryption_key, compression)
+
+    def entries():
+        for object_hash in sorted(names):
+            if object_hash in deltas:
+                base, encrypted = deltas[object_hash]
+                yield object_hash, io.BytesIO(encrypted), base
+            else:
+                with objects.open_object(object_hash) as reader:
+                    yield object_hash, reader, None
+
+    name, count, size = pack.write_pack(entries(), objects.PACK_DIR)
+
+    old_files = [(p.name, p.pack_path, p.index_path) for p in old_packs]
+    objects.reload_packs()
+    for old_name, pack_path, index_path in old_files:
+        if old_name != name:
+            os.remove(index_path)
+            os.remove(pack_path)
+    for object_hash in loose:
+        objects.remove_loose_object(object_hash)
+
+    print(f"✅ Packed {count} objects into {name} ({size} bytes), removed {len(loose)} loose objects")
+    if deltas:
+        print(f"Stored {len(deltas)} objects as deltas, saving {saved} bytes")
@@ -1,4 +1,6 @@
 import os
+from . import config, index, refs
+from .objects import LAYOUT_FANOUT
 
 def init_repo():
     if os.path.exists('.crpt'):
@@ -7,9 +9,8 @@ def init_repo():
 
     os.makedirs('.crpt/objects')
     os.makedirs('.crpt/commits')
-    with open('.crpt/HEAD', 'w') as f:
-        f.write("refs/heads/main")
-    with open('.crpt/index', 'w') as f:
-        f.write("")
+    refs.set_head("refs/heads/main")
+    index.write_index({})
+    config.set_value("core", "objectLayout", LAYOUT_FANOUT)
 
     print("Initialized empty CRPT repository in .crpt/")
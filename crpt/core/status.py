@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+from . import index, utils, worktree, watch
+from .ignore import load_ignore, load_sparse
+
+def _classify(paths_on_disk, candidates, head_files, entries, jobs):
+    """
+    Compare working tree files against the index and HEAD.
+
+    Returns (staged, unstaged, untracked, refreshed) where staged and
+    unstaged are lists of (kind, path) and refreshed is the number of
+    index entries whose stat data was brought up to date.
+    """
+    staged = []
+    for entry in entries.staged():
+        if entry.path not in candidates:
+            continue
+        head_hash = head_files.get(entry.path)
+        if entry.flags & index.FLAG_REMOVED:
+            staged.append(("deleted", entry.path))
+        elif head_hash is None:
+            staged.append(("new file", entry.path))
+        elif head_hash != entry.hash:
+            staged.append(("modified", entry.path))
+
+    # The content each file is compared against: the staged version if any,
+    # else the committed one
+    expected = {}
+    untracked = []
+    for path in paths_on_disk:
+        entry = entries.get(path)
+        if entry is not None and entry.flags & index.FLAG_REMOVED:
+            # Recreated after its removal was staged
+            untracked.append(path)
+        elif entry is not None and entry.flags & index.FLAG_STAGED:
+            expected[path] = entry.hash
+        elif path in head_files:
+            expected[path] = head_files[path]
+        else:
+            untracked.append(path)
+
+    unstaged = []
+    to_hash = []
+    for path, want in expected.items():
+        st = paths_on_disk[path]
+        cached = entries.cached_hash(path, st)
+        if cached is not None:
+            if cached != want:
+                unstaged.append(("modified", path))
+            continue
+        entry = entries.get(path)
+        if entry is not None and entry.hash == want and entry.size != st.st_size:
+            # Size alone proves the content changed
+            unstaged.append(("modified", path))
+            continue
+        to_hash.append(path)
+
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for path, file_hash in zip(to_hash, pool.map(utils.hash_file, to_hash)):
+            if file_hash != expected[path]:
+                unstaged.append(("modified", path))
+                continue
+            # Unchanged after all: refresh the stat cache so the next run skips it
+            entry = entries.get(path)
+            flags = entry.flags if entry is not None else 0
+            entries[path] = index.make_entry(path, paths_on_disk[path], file_hash, flags)
+            refreshed += 1
+
+    for path in sorted(candidates):
+        if path in paths_on_disk:
+            continue
+        entry = entries.get(path)
+        if entry is not None and entry.flags & index.FLAG_REMOVED:
+            continue
+        if path in head_files or (entry is not None and entry.flags & index.FLAG_STAGED):
+            unstaged.append(("deleted", path))
+
+    return sorted(staged, key=lambda c: c[1]), sorted(unstaged, key=lambda c: c[1]), sorted(untracked), refreshed
+
+def status(jobs=None):
+    entries = index.read_index()
+    if entries is None:
+        print("Repository not initialized.")
+        return
+
+    jobs = jobs or worktree.default_jobs()
+    ignore = load_ignore()
+    head_files = utils.commit_snapshot(utils.resolve_head())
+    tracked = set(head_files) | {entry.path for entry in entries.staged()}
+
+    # Taken first so events that arrive while we work are re-read next time
+    offset = watch.dirty_offset()
+    candidates = watch.changed_paths()
+    if candidates is None:
+        paths_on_disk = worktree.walk_files(jobs=jobs, ignore=ignore)
+        # Tracked files stay tracked even if an ignore rule matches them
+        paths_on_disk.update(worktree.stat_paths(tracked - set(paths_on_disk)))
+        candidates = tracked | set(paths_on_disk)
+    else:
+        # The watcher vouches for every path it has not reported
+        candidates |= {entry.path for entry in entries.staged()}
+        paths_on_disk = worktree.stat_paths(candidates)
+
+    staged, unstaged, untracked, refreshed = _classify(paths_on_disk, candidates, head_files, entries, jobs)
+    untracked = [path for path in untracked if not ignore.match_with_parents(path)]
+    sparse = load_sparse()
+    if sparse is not None:
+        # Files outside the sparse patterns are absent on purpose
+        unstaged = [(kind, path) for kind, path in unstaged
+                    if kind != "deleted" or sparse.match_with_parents(path)]
+    if refreshed:
+        index.write_index(entries)
+    if watch.is_running():
+        interesting = [path for _, path in staged + unstaged] + untracked
+        watch.save_baseline(offset, interesting)
+
+    ref = utils.head_ref()
+    if ref and ref.startswith("refs/heads/"):
+        print(f"On branch {ref[len('refs/heads/'):]}")
+
+    if staged:
+        print("Changes to be committed:")
+        for kind, path in staged:
+            print(f"  {kind + ':':<12}{path}")
+    if unstaged:
+        print("Changes not staged for commit:")
+        for kind, path in unstaged:
+            print(f"  {kind + ':':<12}{path}")
+    if untracked:
+        print("Untracked files:")
+        for path in untracked:
+            print(f"  {path}")
+    if not (staged or unstaged or untracked):
+        print("nothing to commit, working tree clean")
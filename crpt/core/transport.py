@@ -0,0 +1,124 @@
+"""
+Binary wire format for push and pull.
+
+A stream starts with MAGIC and is a sequence of frames, each a one-byte
+type and a four-byte big-endian payload length followed by the payload:
+
+    H  JSON header (commit metadata, file list)
+    O  start of an object: its 20-byte hash
+    D  up to FRAME_SIZE bytes of the current object
+    E  end of stream, empty
+
+Objects are sent as raw encrypted bytes, read and written one frame at a
+time, so neither side ever holds a whole commit in memory. Requests are
+sent with chunked transfer encoding. The server side of this format is
+remote/stream.py.
+"""
+
+import os
+import json
+import struct
+from . import objects
+
+MAGIC = b"CRPS\x01"
+CONTENT_TYPE = "application/x-crpt-stream"
+FRAME_SIZE = 1024 * 1024
+
+HEADER = b"H"
+OBJECT = b"O"
+DATA = b"D"
+END = b"E"
+
+_FRAME = struct.Struct(">cI")
+
+def _frame(frame_type, payload=b""):
+    return _FRAME.pack(frame_type, len(payload)) + payload
+
+def encode(header, object_hashes, open_object=objects.open_object):
+    """Yield the stream for header followed by the stored objects, frame by frame."""
+    yield MAGIC + _frame(HEADER, json.dumps(header).encode())
+    for object_hash in object_hashes:
+        yield _frame(OBJECT, bytes.fromhex(object_hash))
+        with open_object(object_hash) as f:
+            while True:
+                data = f.read(FRAME_SIZE)
+                if not data:
+                    break
+                yield _frame(DATA, data)
+    yield _frame(END)
+
+class _Reader:
+    """Exact-size reads over a chunk iterator such as Response.iter_content()."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise ValueError("Stream ended early")
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+def iter_frames(chunks):
+    """Yield (type, payload) for each frame; raises ValueError on a malformed stream."""
+    reader = _Reader(chunks)
+    if reader.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a crpt stream")
+    while True:
+        frame_type, length = _FRAME.unpack(reader.read(_FRAME.size))
+        if length > FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes exceeds the limit")
+        yield frame_type, reader.read(length)
+        if frame_type == END:
+            return
+
+def receive(chunks):
+    """
+    Store every object in a stream as it arrives; returns (header, hashes received).
+
+    Each object goes to a temporary file in the object store and is only
+    published once it is complete.
+    """
+    header = None
+    received = []
+    current = None
+
+    def finish():
+        if current is not None:
+            f, tmp_path, object_hash = current
+            f.close()
+            objects.publish(tmp_path, object_hash)
+            received.append(object_hash)
+
+    try:
+        for frame_type, payload in iter_frames(chunks):
+            if frame_type == HEADER:
+                header = json.loads(payload)
+            elif frame_type == OBJECT:
+                finish()
+                current = None
+                fd, tmp_path = objects.new_temp()
+                current = (os.fdopen(fd, 'wb'), tmp_path, payload.hex())
+            elif frame_type == DATA:
+                if current is None:
+                    raise ValueError("Object data before an object frame")
+                current[0].write(payload)
+            elif frame_type == END:
+                finish()
+                current = None
+            else:
+                raise ValueError(f"Unknown frame type {frame_type!r}")
+    finally:
+        if current is not None:
+            current[0].close()
+            if os.path.exists(current[1]):
+                os.remove(current[1])
+
+    if header is None:
+        raise ValueError("Stream has no header")
+    return header, received
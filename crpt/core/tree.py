@@ -0,0 +1,164 @@
+"""
+Tree objects.
+
+A tree describes one directory: one line per child, sorted by name, of
+the form "<kind> <hash> <name>" where kind is "blob" or "tree". Trees are
+stored encrypted in the object store like file contents and named by the
+SHA-1 of their plaintext, so a directory that did not change between two
+commits is the same object in both. Each commit records its root tree.
+
+Comparisons walk two trees together and never descend into a subtree
+whose hash is the same on both sides.
+"""
+
+import hashlib
+from . import config, fetch, objects
+from .compress import DEFAULT_CODEC_NAME
+from .encrypt import encrypt_file_content, get_or_create_encryption_key
+
+BLOB = "blob"
+TREE = "tree"
+
+# Trees are immutable, so parsed ones are kept for the whole process
+_trees = {}
+
+def parse_tree(content):
+    entries = {}
+    for line in content.decode().splitlines():
+        kind, object_hash, name = line.split(" ", 2)
+        entries[name] = (kind, object_hash)
+    return entries
+
+def serialize_tree(entries):
+    return "".join(f"{kind} {object_hash} {name}\n" for name, (kind, object_hash) in sorted(entries.items())).encode()
+
+def read_tree(tree_hash, encryption_key=None):
+    """Return {name: (kind, hash)} for a stored tree."""
+    entries = _trees.get(tree_hash)
+    if entries is None:
+        lazy = not objects.has_object(tree_hash)
+        if lazy:
+            fetch.ensure([tree_hash])
+        entries = parse_tree(objects.read_plaintext(tree_hash, encryption_key))
+        _trees[tree_hash] = entries
+        if lazy:
+            # In a partial clone, fetch a directory's subtrees in one batch
+            fetch.ensure([child for kind, child in entries.values() if kind == TREE])
+    return entries
+
+def write_tree(entries, encryption_key=None, compression=None):
+    """Store a tree unless an identical one exists; returns its hash."""
+    content = serialize_tree(entries)
+    tree_hash = hashlib.sha1(content).hexdigest()
+    if not objects.has_object(tree_hash):
+        if encryption_key is None:
+            encryption_key = get_or_create_encryption_key()
+        if compression is None:
+            compression = config.get("core", "compression", DEFAULT_CODEC_NAME)
+        objects.write_object(tree_hash, encrypt_file_content(content, tree_hash, encryption_key, compression))
+    _trees[tree_hash] = dict(entries)
+    return tree_hash
+
+def _update(base_hash, changes, encryption_key, compression):
+    entries = dict(read_tree(base_hash, encryption_key)) if base_hash else {}
+    subdirs = {}
+    for path, file_hash in changes.items():
+        name, sep, rest = path.partition("/")
+        if sep:
+            subdirs.setdefault(name, {})[rest] = file_hash
+        elif file_hash is None:
+            entries.pop(name, None)
+        else:
+            entries[name] = (BLOB, file_hash)
+
+    # Only directories with changes below them are rebuilt
+    for name, sub_changes in subdirs.items():
+        kind, child = entries.get(name, (None, None))
+        child = _update(child if kind == TREE else None, sub_changes, encryption_key, compression)
+        if child is None:
+            entries.pop(name, None)
+        else:
+            entries[name] = (TREE, child)
+
+    if not entries:
+        return None
+    return write_tree(entries, encryption_key, compression)
+
+def update_tree(base_hash, changes, encryption_key=None, compression=None):
+    """
+    Apply {path: hash, or None to remove} to the tree base_hash (None for
+    an empty tree) and return the new root hash. Empty directories are
+    dropped.
+    """
+    root = _update(base_hash, changes, encryption_key, compression)
+    if root is None:
+        root = write_tree({}, encryption_key, compression)
+    return root
+
+def flatten(tree_hash, encryption_key=None, prefix=""):
+    """Return {path: blob hash} for every file below tree_hash."""
+    files = {}
+    for name, (kind, object_hash) in read_tree(tree_hash, encryption_key).items():
+        path = prefix + name
+        if kind == TREE:
+            files.update(flatten(object_hash, encryption_key, path + "/"))
+        else:
+            files[path] = object_hash
+    return files
+
+def lookup(tree_hash, path, encryption_key=None):
+    """Return (kind, hash) of the entry at path below tree_hash, or None."""
+    kind, object_hash = TREE, tree_hash
+    for name in path.split("/"):
+        if kind != TREE:
+            return None
+        entry = read_tree(object_hash, encryption_key).get(name)
+        if entry is None:
+            return None
+        kind, object_hash = entry
+    return kind, object_hash
+
+def _side(kind, object_hash, path, encryption_key):
+    if kind is None:
+        return {}
+    if kind == TREE:
+        return flatten(object_hash, encryption_key, path + "/")
+    return {path: object_hash}
+
+def diff_trees(old_hash, new_hash, encryption_key=None, prefix=""):
+    """
+    Yield (path, old blob hash, new blob hash) for every file that differs
+    between two trees; either hash is None for added or removed files.
+    """
+    if old_hash == new_hash:
+        return
+    old = read_tree(old_hash, encryption_key) if old_hash else {}
+    new = read_tree(new_hash, encryption_key) if new_hash else {}
+    for name in sorted(set(old) | set(new)):
+        old_kind, old_child = old.get(name, (None, None))
+        new_kind, new_child = new.get(name, (None, None))
+        if old_kind == new_kind and old_child == new_child:
+            continue
+        path = prefix + name
+        if old_kind == TREE and new_kind == TREE:
+            yield from diff_trees(old_child, new_child, encryption_key, path + "/")
+            continue
+        before = _side(old_kind, old_child, path, encryption_key)
+        after = _side(new_kind, new_child, path, encryption_key)
+        for file_path in sorted(set(before) | set(after)):
+            if before.get(file_path) != after.get(file_path):
+                yield file_path, before.get(file_path), after.get(file_path)
+
+def new_trees(old_hash, new_hash, encryption_key=None):
+    """Return the hashes of trees reachable from new_hash but not shared with old_hash."""
+    found = []
+    if new_hash is None or new_hash == old_hash:
+        return found
+    found.append(new_hash)
+    old = read_tree(old_hash, encryption_key) if old_hash else {}
+    for name, (kind, child) in read_tree(new_hash, encryption_key).items():
+        if kind != TREE:
+            continue
+        old_kind, old_child = old.get(name, (None, None))
+        found.extend(new_trees(old_child if old_kind == TREE else None, child, encryption_key))
+    return found
@@ -0,0 +1,88 @@
+"""
+Resumable uploads of large objects.
+
+Objects of UPLOAD_THRESHOLD bytes or more are not sent inside the push
+stream. Each one gets an upload session on the remote and is sent as
+numbered chunks, in parallel and each checked with its SHA-256, and then
+committed. The remote keeps unfinished sessions, and asking for a session
+for the same object again returns the chunks it already holds, so a push
+that was cut off resends only the chunks that never arrived on the next
+`crpt push`.
+
+Every chunk, including those of a resumed upload, must come from the same
+bytes. A delta-packed object is re-encrypted with a fresh salt each time it
+is opened, so it is first spooled to .crpt/uploads/<hash>, and its size
+and every chunk are read from there; the copy is removed once the upload
+is committed. push streams small deltas from the same copy.
+"""
+
+import io
+import os
+import hashlib
+import shutil
+from . import client, objects
+
+UPLOAD_THRESHOLD = 16 * 1024 * 1024
+CHUNK_SIZE = 8 * 1024 * 1024
+SPOOL_DIR = ".crpt/uploads"
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed: {response.text}")
+    return response.json()
+
+def _spool(object_hash):
+    """Write the object's bytes to SPOOL_DIR once; returns the path of the copy."""
+    path = os.path.join(SPOOL_DIR, object_hash)
+    if not os.path.exists(path):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with objects.open_object(object_hash) as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path)
+    return path
+
+def remove_spool(object_hash):
+    try:
+        os.remove(os.path.join(SPOOL_DIR, object_hash))
+    except FileNotFoundError:
+        pass
+
+def open_source(object_hash):
+    """Open the bytes an upload of the object sends, spooling a delta first."""
+    if objects.is_delta(object_hash):
+        return open(_spool(object_hash), "rb")
+    return objects.open_object(object_hash)
+
+def source_size(object_hash):
+    with open_source(object_hash) as f:
+        return f.seek(0, io.SEEK_END)
+
+def upload_object(repo_name, object_hash):
+    """Upload one object through a resumable session; returns the bytes sent."""
+    size = source_size(object_hash)
+
+    session = _check(client.post("uploads/", json={
+        "repo": repo_name, "hash": object_hash, "size": size, "chunk_size": CHUNK_SIZE
+    }))
+    if session.get("status") == "exists":
+        remove_spool(object_hash)
+        return 0
+    session_path = f"uploads/{session['session']}"
+    chunk_size = session["chunk_size"]
+    received = set(session["received"])
+
+    def send(index):
+        # Each worker reads its own chunk, so at most remote.concurrency are in memory
+        with open_source(object_hash) as f:
+            f.seek(index * chunk_size)
+            data = f.read(chunk_size)
+        _check(client.put(f"{session_path}/{index}/", data=data,
+                          headers={"X-Chunk-SHA256": hashlib.sha256(data).hexdigest(),
+                                   "Content-Type": "application/octet-stream"}))
+        return len(data)
+
+    sent = sum(client.map_parallel(send, [index for index in range(session["chunks"]) if index not in received]))
+    _check(client.post(f"{session_path}/commit/"))
+    remove_spool(object_hash)
+    return sent
@@ -0,0 +1,122 @@
+import os
+import re
+import hashlib
+from . import refs, tree
+
+COMMITS_DIR = ".crpt/commits"
+READ_SIZE = 1024 * 1024
+
+_COMMIT_ID = re.compile(r"^[0-9a-f]{40}$")
+
+def hash_file(file_path):
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class HashingReader:
+    """File wrapper that hashes every byte read through it."""
+
+    def __init__(self, f):
+        self._f = f
+        self._sha = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._sha.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+def normalize_path(file_path):
+    """Repository-relative path with forward slashes, as stored in the index and meta.txt."""
+    return os.path.normpath(file_path).replace(os.sep, "/")
+
+def head_ref():
+    """Return the ref HEAD points at (e.g. refs/heads/main), or None if detached."""
+    return refs.head_ref()
+
+def resolve_head():
+    """Return the commit id HEAD points at, or None before the first commit."""
+    return refs.resolve_head()
+
+def is_commit_id(value):
+    return bool(value and _COMMIT_ID.match(value))
+
+def read_commit_meta(commit_id):
+    """Parse .crpt/commits/<id>/meta.txt into a dict, or return None if missing."""
+    meta_path = f"{COMMITS_DIR}/{commit_id}/meta.txt"
+    if not os.path.exists(meta_path):
+        return None
+
+    meta = {"id": commit_id, "parent": None, "tree": None, "message": "", "time": None, "files": []}
+    with open(meta_path, 'r') as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("Parent:"):
+                parent = line.split(":", 1)[1].strip()
+                # Older commits recorded the HEAD ref instead of a commit id
+                meta["parent"] = parent if is_commit_id(parent) else None
+            elif line.startswith("Tree: "):
+                meta["tree"] = line.split(":", 1)[1].strip()
+            elif line.startswith("Message:"):
+                meta["message"] = line.split(":", 1)[1].strip()
+            elif line.startswith("Time:"):
+                meta["time"] = int(line.split(":", 1)[1].strip())
+            elif ":" in line:
+                path, file_hash = line.rsplit(":", 1)
+                meta["files"].append((path, file_hash))
+    return meta
+
+def list_commits():
+    if not os.path.isdir(COMMITS_DIR):
+        return []
+    return [name for name in os.listdir(COMMITS_DIR) if is_commit_id(name)]
+
+def commit_snapshot(commit_id):
+    """
+    Return {path: hash} for every file as of commit_id.
+
+    Commits with a root tree are complete snapshots. Older commits only list
+    the files staged in them, so for those the snapshot is built by walking
+    Parent: links back to the nearest tree, newer commits overriding older.
+    """
+    chain = []
+    seen = set()
+    base_tree = None
+    while commit_id and commit_id not in seen:
+        seen.add(commit_id)
+        meta = read_commit_meta(commit_id)
+        if meta is None:
+            break
+        if meta["tree"]:
+            base_tree = meta["tree"]
+            break
+        chain.append(meta)
+        commit_id = meta["parent"]
+
+    snapshot = tree.flatten(base_tree) if base_tree else {}
+    for meta in reversed(chain):
+        # Pulled commits list chunk objects with an empty path
+        snapshot.update((path, file_hash) for path, file_hash in meta["files"] if path)
+    return snapshot
+
+def commit_tree(commit_id):
+    """Return the root tree of commit_id, or None for commits made before trees."""
+    meta = read_commit_meta(commit_id) if commit_id else None
+    return meta["tree"] if meta else None
+
+def diff_commits(old_id, new_id):
+    """
+    Return [(path, old hash, new hash)] for files that differ between two
+    commits (either id may be None). Unchanged subtrees are skipped when
+    both commits have trees.
+    """
+    old_tree, new_tree = commit_tree(old_id), commit_tree(new_id)
+    if (old_tree or not old_id) and (new_tree or not new_id):
+        return list(tree.diff_trees(old_tree, new_tree))
+    old = commit_snapshot(old_id) if old_id else {}
+    new = commit_snapshot(new_id) if new_id else {}
+    return [(path, old.get(path), new.get(path)) for path in sorted(set(old) | set(new)) if old.get(path) != new.get(path)]
@@ -0,0 +1,356 @@
+"""
+Optional background watcher that keeps a list of dirty paths.
+
+On Linux, 'crpt watch start' launches a daemon that watches the working
+tree with inotify and appends every changed path to .crpt/watch/dirty.
+'crpt status' records a baseline (the dirty-file offset and the paths it
+reported) after one full scan; later runs only re-check the paths dirtied
+since then plus that baseline, instead of walking the whole tree. If the
+kernel event queue overflows the baseline is dropped and the next status
+falls back to a full scan.
+
+Readers first create a cookie file in .crpt/watch/cookies and wait for the
+daemon to delete it. inotify delivers events in order, so by then every
+change made before the cookie is in the dirty list. Offsets into the dirty
+list are positions in everything the daemon ever wrote: the file starts
+with the offset of its first entry, and once the list grows past
+DIRTY_LIMIT the daemon drops the part a baseline has already folded in.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+
+WATCH_DIR = ".crpt/watch"
+PID_FILE = f"{WATCH_DIR}/pid"
+DIRTY_FILE = f"{WATCH_DIR}/dirty"
+BASELINE_FILE = f"{WATCH_DIR}/baseline"
+COOKIE_DIR = f"{WATCH_DIR}/cookies"
+# Written to the dirty list when events were lost; cannot occur in a path
+OVERFLOW_MARKER = "\0overflow"
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+FLUSH_INTERVAL = 0.05
+# How long a reader waits for the daemon to acknowledge a cookie
+SYNC_TIMEOUT = 1.0
+DIRTY_HEADER = struct.Struct(">Q")  # offset of the file's first entry
+DIRTY_LIMIT = 1024 * 1024
+
+
+def supported():
+    return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+
+def _read_pid():
+    try:
+        with open(PID_FILE, 'r') as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def is_running():
+    pid = _read_pid()
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def start_watcher():
+    if not os.path.exists('.crpt'):
+        print("Repository not initialized.")
+        return
+    if not supported():
+        print("File watching requires inotify (Linux).")
+        return
+    if is_running():
+        print("Watcher already running.")
+        return
+
+    os.makedirs(WATCH_DIR, exist_ok=True)
+    for path in (DIRTY_FILE, BASELINE_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Make the crpt package importable in the child however crpt was launched
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "crpt.core.watch", os.getcwd()],
+        env=env, start_new_session=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    with open(PID_FILE, 'w') as f:
+        f.write(str(process.pid))
+    print(f"Started watcher (pid {process.pid})")
+
+
+def stop_watcher():
+    pid = _read_pid()
+    if pid is None or not is_running():
+        print("Watcher is not running.")
+    else:
+        os.kill(pid, signal.SIGTERM)
+        print(f"Stopped watcher (pid {pid})")
+    for path in (PID_FILE, DIRTY_FILE, BASELINE_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _dirty_start(f):
+    header = f.read(DIRTY_HEADER.size)
+    return DIRTY_HEADER.unpack(header)[0] if len(header) == DIRTY_HEADER.size else 0
+
+
+def dirty_offset():
+    try:
+        with open(DIRTY_FILE, 'rb') as f:
+            start = _dirty_start(f)
+            return start + max(0, os.fstat(f.fileno()).st_size - DIRTY_HEADER.size)
+    except FileNotFoundError:
+        return 0
+
+
+def _read_dirty(offset):
+    """The dirty list from offset on, or None if it was compacted away."""
+    try:
+        with open(DIRTY_FILE, 'rb') as f:
+            start = _dirty_start(f)
+            if offset < start:
+                return None
+            f.seek(DIRTY_HEADER.size + offset - start)
+            return f.read().decode(errors="surrogateescape")
+    except FileNotFoundError:
+        return ""
+
+
+def sync():
+    """Wait until the daemon has recorded every change made so far; False if it did not answer."""
+    os.makedirs(COOKIE_DIR, exist_ok=True)
+    cookie = f"{COOKIE_DIR}/{os.getpid()}-{time.monotonic_ns()}"
+    open(cookie, 'w').close()
+    deadline = time.monotonic() + SYNC_TIMEOUT
+    while os.path.exists(cookie):
+        if time.monotonic() > deadline:
+            os.remove(cookie)
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def save_baseline(offset, paths):
+    tmp_path = BASELINE_FILE + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"offset": offset, "paths": sorted(paths)}, f)
+    os.replace(tmp_path, BASELINE_FILE)
+
+
+def changed_paths():
+    """
+    Return the paths status must re-check, or None if a full scan is needed.
+
+    That is the paths recorded by the last full status plus every path
+    dirtied since it ran, up to and including changes made just before
+    this call.
+    """
+    if not is_running():
+        return None
+    try:
+        with open(BASELINE_FILE, 'r') as f:
+            baseline = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not sync():
+        return None
+
+    paths = set(baseline["paths"])
+    dirty = _read_dirty(baseline["offset"])
+    if dirty is None:
+        return None
+    for line in dirty.split("\n"):
+        if line == OVERFLOW_MARKER:
+            os.remove(BASELINE_FILE)
+            return None
+        if line:
+            paths.add(line)
+    return paths
+
+
+class _Inotify:
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+
+    def add(self, directory, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd >= 0:
+            self.dirs[wd] = directory
+        return wd
+
+    def add_tree(self, root, found=None):
+        """Watch root and every directory below it, collecting files into found."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self.add(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        rel = os.path.relpath(entry.path, ".").replace(os.sep, "/")
+                        if rel == ".crpt" or rel.startswith(".crpt/"):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif found is not None:
+                            found.add(rel)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                pass
+
+    def read_events(self):
+        data = os.read(self.fd, 64 * 1024)
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, name_len = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos + name_len].rstrip(b"\0")
+            pos += name_len
+            yield wd, mask, os.fsdecode(name)
+
+
+def _open_dirty():
+    """Open the dirty list for appending, writing its header if it is new."""
+    dirty = open(DIRTY_FILE, 'ab')
+    if dirty.tell() == 0:
+        dirty.write(DIRTY_HEADER.pack(0))
+        dirty.flush()
+    return dirty
+
+
+def _compact():
+    """Rewrite the dirty list without the entries the baseline has folded in."""
+    with open(DIRTY_FILE, 'rb') as f:
+        start = _dirty_start(f)
+        data = f.read()
+    end = start + len(data)
+    try:
+        with open(BASELINE_FILE, 'r') as f:
+            folded = json.load(f)["offset"]
+    except (FileNotFoundError, ValueError, KeyError):
+        # Without a baseline nothing reads the list
+        folded = end
+    folded = min(max(folded, start), end)
+    if folded == start:
+        return
+    tmp_path = DIRTY_FILE + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(DIRTY_HEADER.pack(folded))
+        f.write(data[folded - start:])
+    os.replace(tmp_path, DIRTY_FILE)
+
+
+def run(root):
+    """Daemon main loop; exits on SIGTERM or when the pid file goes away."""
+    os.chdir(root)
+    running = [True]
+    signal.signal(signal.SIGTERM, lambda *_: running.__setitem__(0, False))
+
+    inotify = _Inotify()
+    inotify.add_tree(".")
+    os.makedirs(COOKIE_DIR, exist_ok=True)
+    cookie_wd = inotify.add(COOKIE_DIR, IN_CREATE)
+    pending = set()
+
+    dirty = _open_dirty()
+    # Compaction is retried only after another DIRTY_LIMIT bytes, in case the
+    # baseline lags behind
+    compact_at = DIRTY_LIMIT
+    try:
+        last_flush = time.monotonic()
+        while running[0] and os.path.exists(PID_FILE):
+            ready, _, _ = select.select([inotify.fd], [], [], FLUSH_INTERVAL if pending else 1.0)
+            cookies = []
+            if ready:
+                for wd, mask, name in inotify.read_events():
+                    if mask & IN_Q_OVERFLOW:
+                        pending.add(OVERFLOW_MARKER)
+                        continue
+                    if wd == cookie_wd:
+                        if name and mask & IN_CREATE:
+                            cookies.append(name)
+                        continue
+                    if mask & IN_IGNORED:
+                        inotify.dirs.pop(wd, None)
+                        continue
+                    directory = inotify.dirs.get(wd)
+                    if directory is None or not name:
+                        continue
+                    path = os.path.normpath(os.path.join(directory, name)).replace(os.sep, "/")
+                    if path == ".crpt" or path.startswith(".crpt/"):
+                        continue
+                    if mask & IN_ISDIR:
+                        # New or moved-in directories: watch them and report their files
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            inotify.add_tree(path, pending)
+                        # A directory moved away takes its files without per-file
+                        # events, so force the next status to rescan
+                        elif mask & IN_MOVED_FROM:
+                            pending.add(OVERFLOW_MARKER)
+                        continue
+                    pending.add(path)
+
+            # A reader waiting on a cookie needs everything before it on disk now
+            if pending and (cookies or time.monotonic() - last_flush >= FLUSH_INTERVAL):
+                dirty.write("".join(p + "\n" for p in sorted(pending)).encode(errors="surrogateescape"))
+                dirty.flush()
+                pending.clear()
+                last_flush = time.monotonic()
+                if dirty.tell() > compact_at:
+                    dirty.close()
+                    _compact()
+                    dirty = _open_dirty()
+                    compact_at = dirty.tell() + DIRTY_LIMIT
+            for name in cookies:
+                try:
+                    os.remove(f"{COOKIE_DIR}/{name}")
+                except FileNotFoundError:
+                    pass
+    finally:
+        dirty.close()
+
+
+if __name__ == "__main__":
+    run(sys.argv[1])
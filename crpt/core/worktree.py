@@ -0,0 +1,125 @@
+"""
+Working tree scanning and updating.
+
+walk_files() lists every file in the working tree with its stat data.
+Each directory is scanned with os.scandir() as its own task on a thread
+pool, so a large tree is read by many concurrent directory reads.
+Directories matched by the ignore rules are pruned, never opened.
+
+materialize() is the reverse: it decrypts objects into working tree files
+on a thread pool, each through a temporary file renamed over the target.
+"""
+
+import os
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import chunking, utils
+
+REPO_DIR = ".crpt"
+
+def default_jobs():
+    # Directory reads block on I/O, so use more threads than cores
+    return min(32, (os.cpu_count() or 1) * 4)
+
+def _scan(directory, ignore=None):
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                path = utils.normalize_path(entry.path)
+                if entry.is_dir(follow_symlinks=False):
+                    if path != REPO_DIR and not (ignore and ignore.match(path, True)):
+                        subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    if not (ignore and ignore.match(path)):
+                        files[path] = entry.stat(follow_symlinks=False)
+    except (PermissionError, FileNotFoundError):
+        pass
+    return files, subdirs
+
+def walk_files(root=".", jobs=None, ignore=None):
+    """
+    Return {path: stat_result} for every file under root, skipping .crpt
+    and, if an ignore matcher is given, ignored files and directories.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+        pending = {pool.submit(_scan, root, ignore)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                results.update(files)
+                pending.update(pool.submit(_scan, subdir, ignore) for subdir in subdirs)
+    return results
+
+def stat_paths(paths):
+    """Return {path: stat_result} for those of paths that are regular files."""
+    results = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if stat.S_ISREG(st.st_mode):
+            results[path] = st
+    return results
+
+def _default_mode():
+    # os.umask() can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def _write_file(path, object_hash, encryption_key, mode):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(prefix=".crpt-", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            chunking.restore_object(object_hash, f, encryption_key)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path, os.stat(path)
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    # Drop directories the removal left empty
+    directory = os.path.dirname(path)
+    if directory:
+        try:
+            os.removedirs(directory)
+        except OSError:
+            pass
+
+def materialize(writes, deletes, encryption_key, jobs=None):
+    """
+    Write {path: object hash} into the working tree and delete the paths in
+    deletes, in parallel. Returns {path: stat_result} for the written files.
+    """
+    # Deletions go first: a file may be replaced by a directory of the same name
+    for path in deletes:
+        _remove_file(path)
+
+    mode = _default_mode()
+    written = {}
+    with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+        futures = [pool.submit(_write_file, path, object_hash, encryption_key, mode)
+                   for path, object_hash in writes.items()]
+        for future in futures:
+            path, st = future.result()
+            written[path] = st
+    return written
@@ -6,7 +6,7 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import modules with proper package qualification
-from crpt.core import repo, index, commit, push, pull, branch, checkout
+from crpt.core import repo, index, commit, push, pull, branch, checkout, repack, status, watch, log, keys
 
 def main():
     parser = argparse.ArgumentParser(prog='crpt', description="Custom version control tool")
@@ -15,42 +15,84 @@ def main():
     # crpt init
     subparsers.add_parser('init')
 
-    # crpt add <file>
+    # crpt add <path>...
     add_parser = subparsers.add_parser('add')
-    add_parser.add_argument('file', help="File to stage")
+    add_parser.add_argument('paths', nargs='+', help="Files, directories or glob patterns to stage ('.' for everything)")
 
     # crpt commit -m "message"
     commit_parser = subparsers.add_parser('commit')
     commit_parser.add_argument('-m', '--message', required=True, help="Commit message")
+    commit_parser.add_argument('-j', '--jobs', type=int, help="Worker processes for hashing and encryption (default: core.jobs or CPU count)")
+
+    log_parser = subparsers.add_parser('log', help='Show commit history')
+    log_parser.add_argument('-n', '--max-count', type=int, help="Show at most this many commits")
+    log_parser.add_argument('--oneline', action='store_true', help="One line per commit")
+    log_parser.add_argument('paths', nargs='*', help="Only commits that changed these paths")
 
     subparsers.add_parser('push')
-    subparsers.add_parser("pull")
+    pull_parser = subparsers.add_parser("pull")
+    pull_parser.add_argument('--partial', action='store_true',
+                             help="Fetch commits and file lists only; file contents are downloaded when needed")
 
     branch_parser = subparsers.add_parser('branch')
     branch_parser.add_argument('name', nargs='?', help='Branch name to create')
+    branch_parser.add_argument('-d', '--delete', action='store_true', help='Delete the named branch')
 
     checkout_parser = subparsers.add_parser('checkout')
     checkout_parser.add_argument('name', help='Branch name to switch to')
+    checkout_parser.add_argument('-j', '--jobs', type=int, help="Threads used to decrypt and write files")
+
+    subparsers.add_parser('repack', help='Pack loose objects into a single pack file')
+
+    status_parser = subparsers.add_parser('status', help='Show working tree changes')
+    status_parser.add_argument('-j', '--jobs', type=int, help="Threads used to scan and hash the working tree")
+
+    watch_parser = subparsers.add_parser('watch', help='Manage the background file watcher (Linux)')
+    watch_parser.add_argument('action', choices=['start', 'stop'])
+
+    key_parser = subparsers.add_parser('key', help='Copy the repository key to another clone')
+    key_parser.add_argument('action', choices=['export', 'import'])
+    key_parser.add_argument('value', nargs='?', help="The line printed by 'crpt key export' (for import)")
 
     args = parser.parse_args()
 
     if args.command == 'init':
         repo.init_repo()
     elif args.command == 'add':
-        index.stage_file(args.file)
+        index.stage_paths(args.paths)
     elif args.command == 'commit':
-        commit.create_commit(args.message)
+        commit.create_commit(args.message, jobs=args.jobs)
+    elif args.command == 'log':
+        log.show_log(args.max_count, args.oneline, args.paths)
     elif args.command == 'push':
-        push.push_to_remote()
+        push.push()
     elif args.command == 'pull':
-        pull.pull_from_remote()
+        pull.pull(partial=args.partial)
     elif args.command == 'branch':
-        if args.name:
+        if args.name and args.delete:
+            branch.delete_branch(args.name)
+        elif args.name:
             branch.create_branch(args.name)
         else:
             branch.list_branches()
     elif args.command == 'checkout':
-        checkout.checkout_branch(args.name)
+        checkout.checkout_branch(args.name, jobs=args.jobs)
+    elif args.command == 'repack':
+        repack.repack()
+    elif args.command == 'status':
+        status.status(jobs=args.jobs)
+    elif args.command == 'watch':
+        if args.action == 'start':
+            watch.start_watcher()
+        else:
+            watch.stop_watcher()
+    elif args.command == 'key':
+        if args.action == 'export':
+            keys.export_key()
+        elif args.value:
+            keys.import_key(args.value)
+        else:
+            key_parser.error("import needs the exported key")
     else:
         parser.print_help()
 
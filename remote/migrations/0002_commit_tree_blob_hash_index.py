@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commit',
+            name='tree',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AlterField(
+            model_name='blob',
+            name='hash',
+            field=models.CharField(db_index=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote', '0002_commit_tree_blob_hash_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='content',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote', '0003_blob_content_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=32, unique=True)),
+                ('hash', models.CharField(max_length=40)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='remote.repository')),
+            ],
+        ),
+    ]
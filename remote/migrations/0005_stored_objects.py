@@ -0,0 +1,82 @@
+import os
+import django.db.models.deletion
+from django.db import migrations, models
+from remote import storage
+
+
+def move_objects(apps, schema_editor):
+    """
+    Move blob contents, and the objects under uploads/<repo>/objects/, into
+    the shared store, keeping one copy of each.
+    """
+    Repository = apps.get_model('remote', 'Repository')
+    Blob = apps.get_model('remote', 'Blob')
+    StoredObject = apps.get_model('remote', 'StoredObject')
+    RepoObject = apps.get_model('remote', 'RepoObject')
+    moved = set()
+
+    def add(repo_id, object_hash, chunks):
+        digest, size = storage.save(chunks)
+        stored, created = StoredObject.objects.get_or_create(digest=digest, defaults={'size': size})
+        RepoObject.objects.get_or_create(repo_id=repo_id, hash=object_hash, defaults={'stored': stored})
+        moved.add((repo_id, object_hash))
+
+    # Contents are loaded one at a time, and only once per repository and hash
+    rows = Blob.objects.filter(content__isnull=False).values_list('id', 'commit__repo_id', 'hash')
+    for blob_id, repo_id, object_hash in rows.iterator(chunk_size=2000):
+        if (repo_id, object_hash) not in moved:
+            content = Blob.objects.filter(id=blob_id).values_list('content', flat=True).get()
+            add(repo_id, object_hash, [bytes(content)])
+
+    if not os.path.isdir(storage.UPLOAD_DIR):
+        return
+    for repo_name in os.listdir(storage.UPLOAD_DIR):
+        objects_dir = os.path.join(storage.UPLOAD_DIR, repo_name, 'objects')
+        if repo_name == os.path.basename(storage.STORE_DIR) or not os.path.isdir(objects_dir):
+            continue
+        repo = Repository.objects.filter(name=repo_name).first() or Repository.objects.create(name=repo_name)
+        for name in os.listdir(objects_dir):
+            object_path = os.path.join(objects_dir, name)
+            if len(name) == 40 and (repo.id, name) not in moved:
+                with open(object_path, 'rb') as f:
+                    add(repo.id, name, iter(lambda: f.read(1024 * 1024), b''))
+            if len(name) == 40 or name.startswith('.tmp-'):
+                os.remove(object_path)
+        if not os.listdir(objects_dir):
+            os.rmdir(objects_dir)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote', '0004_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RepoObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=40)),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='remote.repository')),
+                ('stored', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='remote.storedobject')),
+            ],
+            options={
+                'unique_together': {('repo', 'hash')},
+            },
+        ),
+        migrations.RunPython(move_objects, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='blob',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remote', '0005_stored_objects'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commit',
+            name='commit_id',
+            field=models.CharField(db_index=True, max_length=40),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commit',
+            unique_together={('repo', 'commit_id')},
+        ),
+    ]
@@ -1,18 +1,54 @@
 from django.db import models
+from django.utils import timezone
 
 class Repository(models.Model):
     name = models.CharField(max_length=100)
 
 class Commit(models.Model):
     repo = models.ForeignKey(Repository, on_delete=models.CASCADE)
-    commit_id = models.CharField(max_length=40, unique=True)
+    commit_id = models.CharField(max_length=40, db_index=True)
     message = models.TextField()
     branch = models.CharField(max_length=100)
     parent = models.CharField(max_length=40, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    tree = models.CharField(max_length=40, null=True, blank=True)   # root tree object, if the client sent one
+    timestamp = models.DateTimeField(default=timezone.now)   # when the commit was made
+
+    class Meta:
+        # The same history can be pushed to several repositories
+        unique_together = ('repo', 'commit_id')
 
 class Blob(models.Model):
+    """An object a commit recorded; the bytes are found through RepoObject."""
     commit = models.ForeignKey(Commit, on_delete=models.CASCADE, related_name='blobs')
     path = models.CharField(max_length=255)   # e.g. README.md
+    hash = models.CharField(max_length=40, db_index=True)
+
+class StoredObject(models.Model):
+    """Bytes kept once in the shared store (see storage.py), named by their SHA-256."""
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+class RepoObject(models.Model):
+    """
+    An object hash a repository holds, and the stored bytes for it.
+
+    Hashes are per repository: two repositories with different keys can use
+    the same hash for different ciphertexts, and one must not learn what the
+    other holds. Identical ciphertexts still share one StoredObject.
+    """
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE)
+    hash = models.CharField(max_length=40)
+    stored = models.ForeignKey(StoredObject, on_delete=models.PROTECT)
+
+    class Meta:
+        unique_together = ('repo', 'hash')
+
+class UploadSession(models.Model):
+    """A resumable upload of one large object, sent as numbered chunks."""
+    session_id = models.CharField(max_length=32, unique=True)
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE)
     hash = models.CharField(max_length=40)
-    content = models.BinaryField()
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True)
@@ -4,14 +4,14 @@ from .models import Repository, Commit, Blob
 class BlobSerializer(serializers.ModelSerializer):
     class Meta:
         model = Blob
-        fields = ['path', 'hash', 'content']
+        fields = ['path', 'hash']
 
 class CommitSerializer(serializers.ModelSerializer):
     blobs = BlobSerializer(many=True, read_only=True)
     
     class Meta:
         model = Commit
-        fields = ['commit_id', 'message', 'branch', 'parent', 'timestamp', 'blobs']
+        fields = ['commit_id', 'message', 'branch', 'parent', 'tree', 'timestamp', 'blobs']
 
 class RepositorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,55 @@
+"""
+Content-addressed object storage shared by every repository.
+
+Objects are kept once, on disk, under the SHA-256 of their stored bytes:
+uploads/.store/<first two hex digits>/<digest>. The database only records
+which repository holds which object hash (RepoObject) and where its bytes
+are (StoredObject), so an object pushed in many commits, or to several
+repositories, takes its space once.
+"""
+
+import os
+import hashlib
+import tempfile
+
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+STORE_DIR = os.path.join(UPLOAD_DIR, ".store")
+
+def path(digest):
+    return os.path.join(STORE_DIR, digest[:2], digest)
+
+def open_stored(digest):
+    """Open stored bytes for reading; None if they are missing on disk."""
+    try:
+        return open(path(digest), "rb")
+    except FileNotFoundError:
+        return None
+
+def save(chunks):
+    """
+    Write chunks to the store and return (digest, size).
+
+    Bytes that are already stored are not written again.
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=STORE_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+        target = path(digest)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        return digest, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,95 @@
+"""
+Server side of the crpt binary stream (see crpt/core/transport.py).
+
+A stream is MAGIC followed by frames of a one-byte type, a four-byte
+big-endian length and the payload: one JSON header (H), then for each
+object its 20-byte hash (O) and its bytes in data frames (D), then an
+end frame (E).
+"""
+
+import json
+import struct
+
+MAGIC = b"CRPS\x01"
+CONTENT_TYPE = "application/x-crpt-stream"
+FRAME_SIZE = 1024 * 1024
+
+HEADER = b"H"
+OBJECT = b"O"
+DATA = b"D"
+END = b"E"
+
+_FRAME = struct.Struct(">cI")
+
+class StreamError(ValueError):
+    pass
+
+def _frame(frame_type, payload=b""):
+    return _FRAME.pack(frame_type, len(payload)) + payload
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise StreamError("Stream ended early")
+        data += chunk
+    return data
+
+def read_header(stream):
+    """Check the magic and return the decoded header frame."""
+    if _read_exact(stream, len(MAGIC)) != MAGIC:
+        raise StreamError("Not a crpt stream")
+    frame_type, length = _FRAME.unpack(_read_exact(stream, _FRAME.size))
+    if frame_type != HEADER or length > FRAME_SIZE:
+        raise StreamError("Stream does not start with a header")
+    return json.loads(_read_exact(stream, length))
+
+def iter_objects(stream):
+    """
+    Yield (hash, chunks) for each object after the header, where chunks
+    yields its data frames. Each chunks iterator must be consumed before
+    asking for the next object.
+    """
+    pending = None
+    while True:
+        if pending is None:
+            frame_type, length = _FRAME.unpack(_read_exact(stream, _FRAME.size))
+        else:
+            frame_type, length = pending
+            pending = None
+        if length > FRAME_SIZE:
+            raise StreamError(f"Frame of {length} bytes exceeds the limit")
+        payload = _read_exact(stream, length)
+        if frame_type == END:
+            return
+        if frame_type != OBJECT or length != 20:
+            raise StreamError(f"Unexpected frame {frame_type!r}")
+
+        def chunks():
+            nonlocal pending
+            while True:
+                next_type, next_length = _FRAME.unpack(_read_exact(stream, _FRAME.size))
+                if next_type != DATA:
+                    pending = (next_type, next_length)
+                    return
+                if next_length > FRAME_SIZE:
+                    raise StreamError(f"Frame of {next_length} bytes exceeds the limit")
+                yield _read_exact(stream, next_length)
+
+        yield payload.hex(), chunks()
+        if pending is None:
+            raise StreamError("Object data was not consumed")
+
+def encode(header, objects):
+    """Yield a stream for header and (hash, open file) pairs, frame by frame."""
+    yield MAGIC + _frame(HEADER, json.dumps(header).encode())
+    for object_hash, f in objects:
+        yield _frame(OBJECT, bytes.fromhex(object_hash))
+        with f:
+            while True:
+                data = f.read(FRAME_SIZE)
+                if not data:
+                    break
+                yield _frame(DATA, data)
+    yield _frame(END)
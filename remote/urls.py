@@ -4,6 +4,15 @@ from . import views
 urlpatterns = [
     path('', views.upload_page),  # ← serves upload.html
     path('push/', views.push),
+    path('push/stream/', views.push_stream),
     path('pull/', views.pull),
+    path('pull/stream/', views.pull_stream),
+    path('objects/', views.objects),
+    path('objects/stream/', views.objects_stream),
+    path('negotiate/', views.negotiate),
+    path('uploads/', views.create_upload),
+    path('uploads/<str:session_id>/', views.upload_session),
+    path('uploads/<str:session_id>/<int:index>/', views.upload_chunk),
+    path('uploads/<str:session_id>/commit/', views.commit_upload),
     path('branches/<str:repo_name>/', views.branches),
 ]
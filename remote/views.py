@@ -3,15 +3,156 @@ from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .serializers import RepositorySerializer, CommitSerializer, BlobSerializer
-from .models import Repository, Commit, Blob
+from .models import Repository, Commit, Blob, StoredObject, RepoObject, UploadSession
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.db import transaction
+from . import stream, storage
 import os
 import json
 import base64
+import uuid
+import shutil
+import hashlib
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+UPLOAD_DIR = storage.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Most objects one /objects/ request may ask for
+MAX_OBJECTS_PER_REQUEST = 1000
+# Most hashes one /negotiate/ request may ask about
+MAX_HASHES_PER_NEGOTIATION = 10000
+# Most commits an incremental pull walks back from the branch tip
+MAX_COMMITS_PER_PULL = 1000
+# Most hashes looked up in one query
+LOOKUP_BATCH_SIZE = 1000
+
+# Chunk sizes an upload session accepts, and how long an unfinished one is kept
+MIN_UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+UPLOAD_SESSION_MAX_AGE = timedelta(days=7)
+
+def _is_object_hash(value):
+    return isinstance(value, str) and len(value) == 40 and all(c in "0123456789abcdef" for c in value)
+
+def _valid_name(name, nested):
+    """
+    True if a repository name, or with nested a branch name (which may
+    contain "/"), is safe to use as a path below UPLOAD_DIR.
+    """
+    if not isinstance(name, str) or not name or not name.isprintable() or name.startswith("-"):
+        return False
+    if any(c.isspace() or c in "~^:?*[\\" for c in name):
+        return False
+    parts = name.split("/")
+    if len(parts) > 1 and not nested:
+        return False
+    return all(part and not part.startswith(".") and not part.endswith(".lock") for part in parts)
+
+def _name_error(repo_name, branch=None):
+    """Return why a client's repository or branch name cannot be used, or None."""
+    if not _valid_name(repo_name, nested=False):
+        return f"Invalid repository name {repo_name!r}"
+    if branch is not None and not _valid_name(branch, nested=True):
+        return f"Invalid branch name {branch!r}"
+    return None
+
+def _ref_path(repo_name, branch):
+    return os.path.join(UPLOAD_DIR, repo_name, "refs", "heads", *branch.split("/"))
+
+def _ref_conflict(repo_name, branch):
+    """True if branch cannot be stored next to an existing one, as with a/b and a."""
+    path = _ref_path(repo_name, branch)
+    if os.path.isdir(path):
+        return True
+    heads = os.path.join(UPLOAD_DIR, repo_name, "refs", "heads")
+    parent = os.path.dirname(path)
+    while parent != heads:
+        if os.path.isfile(parent):
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+def _write_ref(repo_name, branch, commit_id):
+    """Point a branch at commit_id with an atomic replace."""
+    path = _ref_path(repo_name, branch)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(commit_id)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _fs_branches(repo_name):
+    """Return the branch names with a ref file, nested names included."""
+    heads = os.path.join(UPLOAD_DIR, repo_name, "refs", "heads")
+    names = []
+    for directory, _, files in os.walk(heads):
+        for file_name in files:
+            if not file_name.startswith("."):
+                names.append(os.path.relpath(os.path.join(directory, file_name), heads).replace(os.sep, "/"))
+    return sorted(names)
+
+def _stored_digests(repo_name, hashes):
+    """Map each of hashes that the repository holds to the digest of its stored bytes."""
+    hashes = [h for h in hashes if _is_object_hash(h)]
+    digests = {}
+    for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        digests.update(RepoObject.objects.filter(repo__name=repo_name, hash__in=hashes[start:start + LOOKUP_BATCH_SIZE])
+                       .values_list("hash", "stored__digest"))
+    return digests
+
+def _open_objects(repo_name, hashes):
+    """Yield (hash, open file) for each of hashes that the repository holds, in order."""
+    digests = _stored_digests(repo_name, hashes)
+    for object_hash in hashes:
+        f = storage.open_stored(digests[object_hash]) if object_hash in digests else None
+        if f is not None:
+            yield object_hash, f
+
+def _store_object(repo_name, object_hash, chunks):
+    """
+    Store an object for a repository unless it already holds it.
+
+    The bytes go to the shared store, where identical bytes pushed to any
+    repository are kept once.
+    """
+    if not _is_object_hash(object_hash):
+        raise ValueError(f"Invalid object hash {object_hash!r}")
+    repo, created = Repository.objects.get_or_create(name=repo_name)
+    if RepoObject.objects.filter(repo=repo, hash=object_hash).exists():
+        for chunk in chunks:
+            pass
+        return
+    digest, size = storage.save(chunks)
+    stored, created = StoredObject.objects.get_or_create(digest=digest, defaults={"size": size})
+    RepoObject.objects.get_or_create(repo=repo, hash=object_hash, defaults={"stored": stored})
+
+def _missing_objects(repo_name, hashes):
+    """Return the hashes that the repository does not hold yet."""
+    stored = _stored_digests(repo_name, hashes)
+    return [h for h in hashes if h not in stored]
+
+def _missing_commits(repo_name, commit_ids):
+    """
+    Return the commit ids that were never pushed to the repository.
+
+    Only database rows count: a commit's files are written before its row,
+    so files alone may be left by a push that failed.
+    """
+    known = set()
+    for start in range(0, len(commit_ids), LOOKUP_BATCH_SIZE):
+        batch = commit_ids[start:start + LOOKUP_BATCH_SIZE]
+        known.update(Commit.objects.filter(repo__name=repo_name, commit_id__in=batch)
+                     .values_list("commit_id", flat=True))
+    return [c for c in commit_ids if c not in known]
+
 def upload_page(request):
     return render(request, 'remote/upload.html')
 
@@ -35,60 +176,253 @@ def push(request):
         
         if not commit_data:
             return Response({"error": "No commit data provided"}, status=400)
-            
+        error = _name_error(repo_name, commit_data.get("branch"))
+        if error:
+            return Response({"error": error}, status=400)
+
+        received = set()
+        for blob_data in commit_data.get("blobs", []):
+            if blob_data.get("content") is not None:
+                _store_object(repo_name, blob_data["hash"], [base64.b64decode(blob_data["content"])])
+                received.add(blob_data["hash"])
+
+        body, status = _save_commit(repo_name, commit_data, received)
+        return Response(body, status=status)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+def _save_commit(repo_name, commit_data, received):
+    """
+    Record a pushed commit whose new objects (received) are already stored.
+
+    Blobs that were not received refer to objects negotiated as already on
+    the server. The commit's files are written first and the branch ref is
+    moved last, inside the transaction that adds the database rows, so a
+    failed ref write leaves no rows behind. Returns (response body, status).
+    """
+    branch = commit_data.get("branch")
+    error = _name_error(repo_name, branch)
+    if error:
+        return {"error": error}, 400
+    if not _is_object_hash(commit_data.get("id")):
+        return {"error": "Invalid commit id"}, 400
+    if _ref_conflict(repo_name, branch):
+        return {"error": f"Branch {branch} conflicts with an existing branch"}, 409
+    commit_time = commit_data.get("time")
+    if commit_time is not None and (not isinstance(commit_time, int) or isinstance(commit_time, bool)):
+        return {"error": "Invalid commit time"}, 400
+
+    blobs = commit_data.get("blobs", [])
+    missing = _missing_objects(repo_name, [b["hash"] for b in blobs if b["hash"] not in received])
+    if missing:
+        return {"error": "Objects are missing on the server", "missing": missing}, 409
+
+    # Also save to file system for compatibility with old approach
+    commit_dir = os.path.join(UPLOAD_DIR, repo_name, "commits", commit_data["id"])
+    os.makedirs(commit_dir, exist_ok=True)
+
+    # Save commit message
+    with open(os.path.join(commit_dir, "message.txt"), 'w') as f:
+        f.write(commit_data["message"])
+
+    # Save commit metadata
+    with open(os.path.join(commit_dir, "meta.txt"), 'w') as f:
+        if commit_data.get("parent"):
+            f.write(f"Parent: {commit_data['parent']}\n")
+        if commit_data.get("tree"):
+            f.write(f"Tree: {commit_data['tree']}\n")
+        f.write(f"Message: {commit_data['message']}\n")
+        if commit_time is not None:
+            f.write(f"Time: {commit_time}\n")
+        for blob_data in blobs:
+            f.write(f"{blob_data['path']}:{blob_data['hash']}\n")
+
+    with transaction.atomic():
         # Get or create repository
         repo, created = Repository.objects.get_or_create(name=repo_name)
-        
-        # Create commit
-        commit = Commit(
-            repo=repo,
-            commit_id=commit_data["id"],
-            message=commit_data["message"],
-            branch=commit_data["branch"],
-            parent=commit_data.get("parent")
-        )
-        commit.save()
-        
-        # Save blobs
-        for blob_data in commit_data.get("blobs", []):
-            blob = Blob(
-                commit=commit,
-                path=blob_data["path"],
-                hash=blob_data["hash"],
-                content=base64.b64decode(blob_data["content"])
+
+        # A commit pushed again (e.g. after the response was lost) only moves the branch
+        if not Commit.objects.filter(repo=repo, commit_id=commit_data["id"]).exists():
+            commit = Commit.objects.create(
+                repo=repo,
+                commit_id=commit_data["id"],
+                message=commit_data["message"],
+                branch=branch,
+                parent=commit_data.get("parent"),
+                tree=commit_data.get("tree"),
+                # When the commit was made; commits from older clients get the push time
+                timestamp=(datetime.fromtimestamp(commit_time, dt_timezone.utc)
+                           if commit_time is not None else timezone.now())
             )
-            blob.save()
+
+            # Record which objects the commit refers to; their bytes are stored once, by _store_object
+            Blob.objects.bulk_create([
+                Blob(commit=commit, path=blob_data["path"], hash=blob_data["hash"])
+                for blob_data in blobs
+            ])
+
+        _write_ref(repo_name, branch, commit_data["id"])
+
+    return {"status": "ok", "commit_id": commit_data["id"]}, 200
+
+def _request_body(request):
+    """
+    A file-like view of the raw request body.
+
+    Django caps reads at Content-Length, which a chunked request does not
+    have, so those are read from the WSGI input the server de-chunks.
+    """
+    if request.META.get("CONTENT_LENGTH"):
+        return request
+    return request.META["wsgi.input"]
+
+@csrf_exempt
+def push_stream(request):
+    """
+    Receive a push in the binary stream format, storing each object as it arrives.
+
+    The header is {"repo": name, "commits": [{..., "blobs": [{"path", "hash"}]}]},
+    the pushed commits oldest first; "commit" alone is accepted for a single one.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        body = _request_body(request)
+        header = stream.read_header(body)
+        repo_name = header.get("repo", "default")
+        commits = header.get("commits") or [header.get("commit")]
+        if not all(commits):
+            return JsonResponse({"error": "No commit data provided"}, status=400)
+        for commit_data in commits:
+            error = _name_error(repo_name, commit_data.get("branch"))
+            if error:
+                return JsonResponse({"error": error}, status=400)
+
+        received = set()
+        for object_hash, chunks in stream.iter_objects(body):
+            _store_object(repo_name, object_hash, chunks)
+            received.add(object_hash)
+
+        # Each commit moves the branch in turn, so it ends at the newest
+        for commit_data in commits:
+            response, status = _save_commit(repo_name, commit_data, received)
+            if status != 200:
+                break
+        return JsonResponse(response, status=status)
+    except stream.StreamError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+def _branch_tip(repo_name, branch):
+    """
+    Return the id of the commit the branch points at, or None.
+
+    The ref file is the source of truth: a push that only moves the branch,
+    e.g. back to an older commit, adds no database row. Branches pushed
+    before refs were written fall back to their newest database row.
+    """
+    branch_file = _ref_path(repo_name, branch)
+    if os.path.isfile(branch_file):
+        with open(branch_file, 'r') as f:
+            return f.read().strip() or None
+
+    return (Commit.objects.filter(repo__name=repo_name, branch=branch).order_by('-timestamp')
+            .values_list("commit_id", flat=True).first())
+
+def _load_commit(repo_name, commit_id, branch):
+    """Return a commit with its blob paths and hashes, or None if it was never pushed."""
+    commit = Commit.objects.filter(repo__name=repo_name, commit_id=commit_id).first()
+    if commit:
+        return {
+            "id": commit.commit_id,
+            "commit_id": commit.commit_id,
+            "message": commit.message,
+            "parent": commit.parent,
+            "tree": commit.tree,
+            "branch": commit.branch,
+            "timestamp": commit.timestamp.isoformat(),
+            "time": int(commit.timestamp.timestamp()),
+            "blobs": [{"path": path, "hash": blob_hash}
+                      for path, blob_hash in commit.blobs.values_list("path", "hash")]
+        }
         
-        # Also save to file system for compatibility with old approach
-        repo_dir = os.path.join(UPLOAD_DIR, repo_name)
-        os.makedirs(repo_dir, exist_ok=True)
-        os.makedirs(os.path.join(repo_dir, "refs", "heads"), exist_ok=True)
-        os.makedirs(os.path.join(repo_dir, "commits", commit_data["id"]), exist_ok=True)
-        os.makedirs(os.path.join(repo_dir, "objects"), exist_ok=True)
+    # Read commit data
+    if not _is_object_hash(commit_id):
+        return None
+    commit_dir = os.path.join(UPLOAD_DIR, repo_name, f"commits/{commit_id}")
+    if not os.path.exists(commit_dir):
+        return None
         
-        # Save branch reference
-        with open(os.path.join(repo_dir, "refs", "heads", commit_data["branch"]), 'w') as f:
-            f.write(commit_data["id"])
-            
-        # Save commit message
-        with open(os.path.join(repo_dir, "commits", commit_data["id"], "message.txt"), 'w') as f:
-            f.write(commit_data["message"])
-            
-        # Save commit metadata
-        with open(os.path.join(repo_dir, "commits", commit_data["id"], "meta.txt"), 'w') as f:
-            if commit_data.get("parent"):
-                f.write(f"Parent: {commit_data['parent']}\n")
-            f.write(f"Message: {commit_data['message']}\n")
-            for blob_data in commit_data.get("blobs", []):
-                f.write(f"{blob_data['path']}:{blob_data['hash']}\n")
-                
-                # Save blob content
-                with open(os.path.join(repo_dir, "objects", blob_data["hash"]), 'wb') as bf:
-                    bf.write(base64.b64decode(blob_data["content"]))
-            
-        return Response({"status": "ok", "commit_id": commit_data["id"]})
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+    # Read message
+    with open(os.path.join(commit_dir, "message.txt"), 'r') as f:
+        message = f.read().strip()
+        
+    # Read metadata
+    parent_id = None
+    tree_id = None
+    commit_time = None
+    blobs = []
+    with open(os.path.join(commit_dir, "meta.txt"), 'r') as f:
+        for line in f:
+            if line.startswith("Parent:"):
+                parent_id = line.split(":", 1)[1].strip()
+            elif line.startswith("Tree: "):
+                tree_id = line.split(":", 1)[1].strip()
+            elif line.startswith("Time: "):
+                commit_time = int(line.split(":", 1)[1].strip())
+            elif ":" in line and not line.startswith("Message"):
+                path, blob_hash = line.strip().rsplit(":", 1)
+                blobs.append({"path": path, "hash": blob_hash})
+    
+    return {
+        "id": commit_id,
+        "commit_id": commit_id,  # For serializer compatibility
+        "message": message,
+        "parent": parent_id,
+        "tree": tree_id,
+        "branch": branch,
+        "time": commit_time,
+        "blobs": blobs
+    }
+
+def _find_commit(repo_name, branch):
+    """Return the branch's latest commit with its blob paths and hashes, or None."""
+    commit_id = _branch_tip(repo_name, branch)
+    return _load_commit(repo_name, commit_id, branch) if commit_id else None
+
+def _commit_parent(repo_name, commit_id):
+    parent = (Commit.objects.filter(repo__name=repo_name, commit_id=commit_id)
+              .values_list("parent", flat=True).first())
+    if parent is None:
+        commit = _load_commit(repo_name, commit_id, None)
+        parent = commit and commit["parent"]
+    return parent
+
+def _commits_since(repo_name, branch, tip, have):
+    """
+    Return (the commits after have, or all of them for a new clone, up to
+    tip, oldest first; whether have is an ancestor of tip).
+
+    If have is not among tip's last MAX_COMMITS_PER_PULL ancestors (a client
+    whose history diverged or is ahead, or a history too long to send) only
+    tip is returned, and the client takes it as a full snapshot.
+    """
+    chain = []
+    commit_id = tip
+    while commit_id and commit_id != have and len(chain) < MAX_COMMITS_PER_PULL:
+        commit = _load_commit(repo_name, commit_id, branch)
+        if commit is None:
+            break
+        chain.append(commit)
+        commit_id = commit["parent"]
+    if commit_id != have:
+        # Only the parents are needed to tell a long history from a diverged one
+        while commit_id and commit_id != have:
+            commit_id = _commit_parent(repo_name, commit_id)
+        return [_load_commit(repo_name, tip, branch)], commit_id == have
+    chain.reverse()
+    return chain, True
 
 @csrf_exempt
 @api_view(['GET', 'POST'])
@@ -129,77 +463,329 @@ def pull(request):
             data = request.data
             repo_name = data.get("repo", "default")
             branch = data.get("branch", "main")
+            # Partial clones get paths and hashes only and fetch contents from /objects/
+            partial = bool(data.get("partial", False))
+            error = _name_error(repo_name, branch)
+            if error:
+                return Response({"error": error}, status=400)
             
-            try:
-                # First try to get from database
-                repo = Repository.objects.get(name=repo_name)
-                commit = Commit.objects.filter(repo=repo, branch=branch).order_by('-timestamp').first()
-                
-                if commit:
-                    serializer = CommitSerializer(commit)
-                    return Response({"commit": serializer.data})
-            except (Repository.DoesNotExist, Commit.DoesNotExist):
-                pass
-                
-            # If not in database, try to get from file system (backward compatibility)
-            repo_dir = os.path.join(UPLOAD_DIR, repo_name)
-            branch_file = os.path.join(repo_dir, f"refs/heads/{branch}")
-            
-            if not os.path.exists(branch_file):
+            commit = _find_commit(repo_name, branch)
+            if commit is None:
                 return Response({"error": f"Branch {branch} not found"}, status=404)
-                
-            with open(branch_file, 'r') as f:
-                commit_id = f.read().strip()
-                
-            # Read commit data
-            commit_dir = os.path.join(repo_dir, f"commits/{commit_id}")
-            if not os.path.exists(commit_dir):
-                return Response({"error": f"Commit {commit_id} not found"}, status=404)
-                
-            # Read message
-            with open(os.path.join(commit_dir, "message.txt"), 'r') as f:
-                message = f.read().strip()
-                
-            # Read metadata
-            parent_id = None
-            blobs = []
-            with open(os.path.join(commit_dir, "meta.txt"), 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if line.startswith("Parent:"):
-                        parent_id = line.split(":", 1)[1].strip()
-                    elif ":" in line and not line.startswith("Message"):
-                        path, blob_hash = line.strip().split(":")
-                        blob_path = os.path.join(repo_dir, f"objects/{blob_hash}")
-                        
-                        # Read and encode blob content
-                        with open(blob_path, "rb") as bf:
-                            encoded = base64.b64encode(bf.read()).decode()
-                            
-                        blobs.append({
-                            "path": path,
-                            "hash": blob_hash,
-                            "content": encoded
-                        })
-            
-            response_data = {
-                "commit": {
-                    "id": commit_id,
-                    "commit_id": commit_id,  # For serializer compatibility
-                    "message": message,
-                    "parent": parent_id,
-                    "branch": branch,
-                    "blobs": blobs
-                }
-            }
+
+            if not partial:
+                contents = {}
+                for object_hash, f in _open_objects(repo_name, [blob["hash"] for blob in commit["blobs"]]):
+                    with f:
+                        contents[object_hash] = base64.b64encode(f.read()).decode()
+                for blob in commit["blobs"]:
+                    # Objects left out are fetched by the client from /objects/ if it needs them
+                    blob["content"] = contents.get(blob["hash"])
             
-            return Response(response_data)
+            return Response({"commit": commit})
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+@csrf_exempt
+def pull_stream(request):
+    """
+    Send a branch's new commits in the binary stream format.
+
+    Takes {"repo": name, "branch": name, "partial": bool, "have": commit id}
+    as JSON, where have is the client's current tip. Answers 304 when the
+    branch is still at have. Otherwise the header carries the commits after
+    have, oldest first, and, unless partial, the objects those commits
+    introduced follow it. The server cannot read the encrypted trees, so
+    objects reachable from have are excluded by sending only what the newer
+    commits recorded, which a push limits to objects new since the parent.
+    The header's fast_forward is false when have is not an ancestor of the
+    tip, so the client can refuse to move its branch backwards.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        data = json.loads(request.body or b"{}")
+        repo_name = data.get("repo", "default")
+        branch = data.get("branch", "main")
+        partial = bool(data.get("partial", False))
+        have = data.get("have")
+        error = _name_error(repo_name, branch)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+
+        tip = _branch_tip(repo_name, branch)
+        if tip is None:
+            return JsonResponse({"error": f"Branch {branch} not found"}, status=404)
+        if have == tip:
+            return HttpResponse(status=304)
+
+        commits, fast_forward = _commits_since(repo_name, branch, tip, have)
+        if commits[-1] is None:
+            return JsonResponse({"error": f"Commit {tip} not found"}, status=404)
+        hashes = [] if partial else list(dict.fromkeys(blob["hash"] for commit in commits for blob in commit["blobs"]))
+
+        # Objects the server lacks are fetched from /objects/stream/ by the client if needed
+        header = {"commit": commits[-1], "commits": commits, "fast_forward": fast_forward}
+        return StreamingHttpResponse(stream.encode(header, _open_objects(repo_name, hashes)),
+                                     content_type=stream.CONTENT_TYPE)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+@api_view(['POST'])
+def objects(request):
+    """
+    Return stored objects by hash, for partial clones.
+
+    Takes {"repo": name, "hashes": [...]} and answers with
+    {"objects": {hash: base64 content}, "missing": [...]}.
+    """
+    try:
+        data = request.data
+        repo_name = data.get("repo", "default")
+        hashes = list(dict.fromkeys(data.get("hashes", [])))
+        error = _name_error(repo_name)
+        if error:
+            return Response({"error": error}, status=400)
+        if len(hashes) > MAX_OBJECTS_PER_REQUEST:
+            return Response({"error": f"At most {MAX_OBJECTS_PER_REQUEST} objects per request"}, status=400)
+
+        found = {}
+        for object_hash, f in _open_objects(repo_name, hashes):
+            with f:
+                found[object_hash] = base64.b64encode(f.read()).decode()
+
+        return Response({
+            "objects": found,
+            "missing": [h for h in hashes if h not in found]
+        })
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+@csrf_exempt
+def objects_stream(request):
+    """
+    Send stored objects by hash in the binary stream format, for partial clones.
+
+    Takes {"repo": name, "hashes": [...]} as JSON. The header is
+    {"repo": name}; the objects the repository holds follow it, and the
+    client treats the ones that did not arrive as missing.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        data = json.loads(request.body or b"{}")
+        repo_name = data.get("repo", "default")
+        hashes = list(dict.fromkeys(data.get("hashes", [])))
+        error = _name_error(repo_name)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+        if len(hashes) > MAX_OBJECTS_PER_REQUEST:
+            return JsonResponse({"error": f"At most {MAX_OBJECTS_PER_REQUEST} objects per request"}, status=400)
+
+        return StreamingHttpResponse(stream.encode({"repo": repo_name}, _open_objects(repo_name, hashes)),
+                                     content_type=stream.CONTENT_TYPE)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+@api_view(['POST'])
+def negotiate(request):
+    """
+    Tell a pushing client which objects it still has to upload.
+
+    Takes {"repo": name, "hashes": [...], "commits": [...]} and answers with
+    {"missing": [...], "missing_commits": [...]}: the objects, and the
+    commits, the repository does not hold yet.
+    """
+    try:
+        data = request.data
+        repo_name = data.get("repo", "default")
+        hashes = list(dict.fromkeys(data.get("hashes", [])))
+        commit_ids = list(dict.fromkeys(data.get("commits", [])))
+        error = _name_error(repo_name)
+        if error:
+            return Response({"error": error}, status=400)
+        if len(hashes) + len(commit_ids) > MAX_HASHES_PER_NEGOTIATION:
+            return Response({"error": f"At most {MAX_HASHES_PER_NEGOTIATION} hashes per request"}, status=400)
+        return Response({
+            "missing": _missing_objects(repo_name, hashes),
+            "missing_commits": _missing_commits(repo_name, commit_ids)
+        })
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+def _session_dir(session):
+    return os.path.join(UPLOAD_DIR, session.repo.name, "sessions", session.session_id)
+
+def _received_chunks(session):
+    try:
+        return sorted(int(name) for name in os.listdir(_session_dir(session)) if name.isdigit())
+    except FileNotFoundError:
+        return []
+
+def _chunk_count(session):
+    return max(1, -(-session.size // session.chunk_size))
+
+def _session_state(session):
+    return {
+        "session": session.session_id,
+        "hash": session.hash,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "chunks": _chunk_count(session),
+        "received": _received_chunks(session)
+    }
+
+def _delete_session(session):
+    shutil.rmtree(_session_dir(session), ignore_errors=True)
+    session.delete()
+
+def _get_session(session_id):
+    return UploadSession.objects.select_related("repo").filter(session_id=session_id).first()
+
+@csrf_exempt
+def create_upload(request):
+    """
+    Start, or resume, a chunked upload of one large object.
+
+    Takes {"repo": name, "hash": object hash, "size": bytes, "chunk_size": bytes}
+    as JSON. An unfinished session for the same object is returned as is, with
+    the chunks it already holds, so an interrupted client picks up from there.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        data = json.loads(request.body or b"{}")
+        repo_name = data.get("repo", "default")
+        object_hash = data.get("hash")
+        size = int(data.get("size", -1))
+        error = _name_error(repo_name)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+        if not _is_object_hash(object_hash) or size < 0:
+            return JsonResponse({"error": "A valid hash and size are required"}, status=400)
+        if not _missing_objects(repo_name, [object_hash]):
+            return JsonResponse({"status": "exists"})
+
+        repo, created = Repository.objects.get_or_create(name=repo_name)
+        for stale in UploadSession.objects.filter(repo=repo, created__lt=timezone.now() - UPLOAD_SESSION_MAX_AGE):
+            _delete_session(stale)
+
+        session = UploadSession.objects.filter(repo=repo, hash=object_hash, size=size).order_by("-created").first()
+        if session is None:
+            chunk_size = int(data.get("chunk_size", MIN_UPLOAD_CHUNK_SIZE))
+            session = UploadSession.objects.create(
+                session_id=uuid.uuid4().hex,
+                repo=repo,
+                hash=object_hash,
+                size=size,
+                chunk_size=min(max(chunk_size, MIN_UPLOAD_CHUNK_SIZE), MAX_UPLOAD_CHUNK_SIZE)
+            )
+        return JsonResponse(_session_state(session))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+def upload_session(request, session_id):
+    """Report which chunks of an upload have arrived."""
+    if request.method != "GET":
+        return JsonResponse({"error": "GET required"}, status=405)
+    session = _get_session(session_id)
+    if session is None:
+        return JsonResponse({"error": "Unknown upload session"}, status=404)
+    return JsonResponse(_session_state(session))
+
+@csrf_exempt
+def upload_chunk(request, session_id, index):
+    """
+    Store chunk number index of an upload.
+
+    The body is the raw chunk; the X-Chunk-SHA256 header must hold its
+    SHA-256 hex digest. Sending a chunk again replaces it.
+    """
+    if request.method != "PUT":
+        return JsonResponse({"error": "PUT required"}, status=405)
+    try:
+        session = _get_session(session_id)
+        if session is None:
+            return JsonResponse({"error": "Unknown upload session"}, status=404)
+        count = _chunk_count(session)
+        if not 0 <= index < count:
+            return JsonResponse({"error": f"Chunk index must be below {count}"}, status=400)
+
+        expected = session.chunk_size if index < count - 1 else session.size - session.chunk_size * (count - 1)
+        if int(request.META.get("CONTENT_LENGTH") or 0) != expected:
+            return JsonResponse({"error": f"Chunk {index} must be {expected} bytes"}, status=400)
+
+        # Read in pieces rather than through request.body, which Django caps
+        # at DATA_UPLOAD_MAX_MEMORY_SIZE
+        session_dir = _session_dir(session)
+        os.makedirs(session_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=session_dir)
+        digest = hashlib.sha256()
+        length = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    data = request.read(stream.FRAME_SIZE)
+                    if not data:
+                        break
+                    digest.update(data)
+                    f.write(data)
+                    length += len(data)
+            if length != expected:
+                os.remove(tmp_path)
+                return JsonResponse({"error": f"Chunk {index} ended after {length} of {expected} bytes"}, status=400)
+            if digest.hexdigest() != request.META.get("HTTP_X_CHUNK_SHA256", "").lower():
+                os.remove(tmp_path)
+                return JsonResponse({"error": f"Checksum mismatch for chunk {index}"}, status=400)
+            os.replace(tmp_path, os.path.join(session_dir, str(index)))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return JsonResponse({"status": "ok", "index": index})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@csrf_exempt
+def commit_upload(request, session_id):
+    """Join the chunks of a complete upload into the stored object and end the session."""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        session = _get_session(session_id)
+        if session is None:
+            return JsonResponse({"error": "Unknown upload session"}, status=404)
+        received = set(_received_chunks(session))
+        missing = [index for index in range(_chunk_count(session)) if index not in received]
+        if missing:
+            return JsonResponse({"error": "Upload is incomplete", "missing": missing}, status=409)
+
+        session_dir = _session_dir(session)
+
+        def chunks():
+            for index in range(_chunk_count(session)):
+                with open(os.path.join(session_dir, str(index)), "rb") as f:
+                    while True:
+                        data = f.read(stream.FRAME_SIZE)
+                        if not data:
+                            break
+                        yield data
+
+        _store_object(session.repo.name, session.hash, chunks())
+        _delete_session(session)
+        return JsonResponse({"status": "ok", "hash": session.hash})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 @csrf_exempt
 @api_view(['GET'])
 def branches(request, repo_name):
+    error = _name_error(repo_name)
+    if error:
+        return Response({"error": error}, status=400)
     try:
         # Try getting branches from database
         repo = Repository.objects.get(name=repo_name)
@@ -207,29 +793,20 @@ def branches(request, repo_name):
         branch_names = [b['branch'] for b in branches]
         
         # Also check filesystem for backward compatibility
-        repo_dir = os.path.join(UPLOAD_DIR, repo_name)
-        refs_dir = os.path.join(repo_dir, "refs", "heads")
-        if os.path.exists(refs_dir):
-            try:
-                fs_branches = os.listdir(refs_dir)
-                for branch in fs_branches:
-                    if branch not in branch_names:
-                        branch_names.append(branch)
-            except:
-                pass
+        for branch in _fs_branches(repo_name):
+            if branch not in branch_names:
+                branch_names.append(branch)
                 
         return Response({"branches": branch_names})
     except Repository.DoesNotExist:
         # If repo doesn't exist in DB, check filesystem
-        repo_dir = os.path.join(UPLOAD_DIR, repo_name)
-        refs_dir = os.path.join(repo_dir, "refs", "heads")
+        refs_dir = os.path.join(UPLOAD_DIR, repo_name, "refs", "heads")
         
         if not os.path.exists(refs_dir):
             return Response({"error": f"Repository {repo_name} not found"}, status=404)
             
         try:
-            branch_names = os.listdir(refs_dir)
-            return Response({"branches": branch_names})
+            return Response({"branches": _fs_branches(repo_name)})
         except Exception as e:
             return Response({"error": str(e)}, status=500)
     except Exception as e:
@@ -17,11 +17,13 @@ CREATE TABLE IF NOT EXISTS remote_repository (
 CREATE TABLE IF NOT EXISTS remote_commit (
     id INT AUTO_INCREMENT PRIMARY KEY,
     repo_id INT NOT NULL,
-    commit_id VARCHAR(40) NOT NULL UNIQUE,
+    commit_id VARCHAR(40) NOT NULL,
     message TEXT NOT NULL,
     branch VARCHAR(100) NOT NULL,
     parent VARCHAR(40) NULL,
+    tree VARCHAR(40) NULL,
     timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (repo_id, commit_id),
     FOREIGN KEY (repo_id) REFERENCES remote_repository(id) ON DELETE CASCADE
 );
 
@@ -29,20 +31,51 @@ CREATE TABLE IF NOT EXISTS remote_commit (
 CREATE INDEX idx_commit_repo ON remote_commit(repo_id);
 CREATE INDEX idx_commit_hash ON remote_commit(commit_id);
 
--- Blob table (file contents)
+-- Blob table (the objects each commit refers to; contents are in the object store)
 CREATE TABLE IF NOT EXISTS remote_blob (
     id INT AUTO_INCREMENT PRIMARY KEY,
     commit_id INT NOT NULL,
     path VARCHAR(255) NOT NULL,
     hash VARCHAR(40) NOT NULL,
-    content LONGBLOB NOT NULL,
     FOREIGN KEY (commit_id) REFERENCES remote_commit(id) ON DELETE CASCADE
 );
 
 -- Create index for faster lookups
 CREATE INDEX idx_blob_commit ON remote_blob(commit_id);
+CREATE INDEX idx_blob_hash ON remote_blob(hash);
+
+-- Stored object table (one row per distinct content, kept on disk under uploads/.store/)
+CREATE TABLE IF NOT EXISTS remote_storedobject (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    digest VARCHAR(64) NOT NULL UNIQUE,  -- SHA-256 of the stored bytes
+    size BIGINT NOT NULL,
+    created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Repository object table (which object hashes a repository holds)
+CREATE TABLE IF NOT EXISTS remote_repoobject (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    repo_id INT NOT NULL,
+    hash VARCHAR(40) NOT NULL,
+    stored_id BIGINT NOT NULL,
+    UNIQUE (repo_id, hash),
+    FOREIGN KEY (repo_id) REFERENCES remote_repository(id) ON DELETE CASCADE,
+    FOREIGN KEY (stored_id) REFERENCES remote_storedobject(id)
+);
+
+-- Upload session table (resumable uploads of large objects; chunks are kept on disk)
+CREATE TABLE IF NOT EXISTS remote_uploadsession (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    session_id VARCHAR(32) NOT NULL UNIQUE,
+    repo_id INT NOT NULL,
+    hash VARCHAR(40) NOT NULL,
+    size BIGINT NOT NULL,
+    chunk_size INT NOT NULL,
+    created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (repo_id) REFERENCES remote_repository(id) ON DELETE CASCADE
+);
 
 -- Add sample data (optional, for testing)
 -- INSERT INTO remote_repository (name) VALUES ('sample-repo');
 -- INSERT INTO remote_commit (repo_id, commit_id, message, branch) VALUES (1, 'abcdef1234567890', 'Initial commit', 'main');
--- INSERT INTO remote_blob (commit_id, path, hash, content) VALUES (1, 'README.md', 'abc123', 'IyBSZWFkbWUK');
\ No newline at end of file
+-- INSERT INTO remote_blob (commit_id, path, hash) VALUES (1, 'README.md', 'abc123');
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+The commit-graph cache: building, appending, rebuilding when stale, and
+the ancestry queries pull relies on.
+"""
+
+import os
+import tempfile
+import unittest
+
+from crpt.core import commit_graph, utils
+
+
+def commit_id(n):
+    return f"{n:040x}"
+
+
+class CommitGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs(".crpt")
+        commit_graph.reload_graph()
+
+    def tearDown(self):
+        commit_graph.reload_graph()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def make_commit(self, n, parent=None):
+        commit_dir = f"{utils.COMMITS_DIR}/{commit_id(n)}"
+        os.makedirs(commit_dir)
+        with open(f"{commit_dir}/meta.txt", "w") as f:
+            if parent is not None:
+                f.write(f"Parent: {commit_id(parent)}\n")
+            f.write(f"Message: commit {n}\nTime: {1700000000 + n}\n")
+        return commit_id(n)
+
+    def make_history(self):
+        # 1 - 2 - ... - 40 with a branch 20 - 101 - 102 - 103
+        for n in range(1, 41):
+            self.make_commit(n, n - 1 if n > 1 else None)
+        self.make_commit(101, 20)
+        self.make_commit(102, 101)
+        self.make_commit(103, 102)
+
+    def check_queries(self):
+        self.assertTrue(commit_graph.is_ancestor(commit_id(1), commit_id(40)))
+        self.assertTrue(commit_graph.is_ancestor(commit_id(20), commit_id(103)))
+        self.assertTrue(commit_graph.is_ancestor(commit_id(40), commit_id(40)))
+        self.assertFalse(commit_graph.is_ancestor(commit_id(40), commit_id(1)))
+        self.assertFalse(commit_graph.is_ancestor(commit_id(21), commit_id(103)))
+        self.assertFalse(commit_graph.is_ancestor(commit_id(999), commit_id(40)))
+        self.assertEqual(commit_graph.merge_base(commit_id(40), commit_id(103)), commit_id(20))
+        self.assertEqual(commit_graph.merge_base(commit_id(103), commit_id(102)), commit_id(102))
+        self.assertEqual(list(commit_graph.iter_history(commit_id(3))), [commit_id(3), commit_id(2), commit_id(1)])
+
+    def test_built_graph(self):
+        self.make_history()
+        commit_graph.write_graph()
+        graph = commit_graph.load_graph()
+        self.assertEqual(len(graph), 43)
+        sha, parent, timestamp, generation = graph.entry(graph.position(commit_id(103)))
+        self.assertEqual((sha, timestamp, generation), (commit_id(103), 1700000103, 23))
+        self.assertEqual(graph.entry(parent)[0], commit_id(102))
+        self.check_queries()
+
+    def test_appended_graph_matches_a_rebuilt_one(self):
+        self.make_commit(1)
+        commit_graph.write_graph()
+        for n in range(2, 41):
+            self.make_commit(n, n - 1)
+            commit_graph.append_commit(commit_id(n), commit_id(n - 1), 1700000000 + n)
+        for n, parent in ((101, 20), (102, 101), (103, 102)):
+            self.make_commit(n, parent)
+            commit_graph.append_commit(commit_id(n), commit_id(parent), 1700000000 + n)
+        self.check_queries()
+
+        graph = commit_graph.load_graph()
+        appended = {graph.entry(pos)[0]: graph.generation(pos) for pos in range(len(graph))}
+        commit_graph.write_graph()
+        graph = commit_graph.load_graph()
+        rebuilt = {graph.entry(pos)[0]: graph.generation(pos) for pos in range(len(graph))}
+        self.assertEqual(appended, rebuilt)
+
+    def test_stale_graph_is_rebuilt(self):
+        self.make_history()
+        commit_graph.write_graph()
+        # A pulled commit whose parent was never added to the graph
+        self.make_commit(41, 40)
+        self.make_commit(42, 41)
+        commit_graph.append_commit(commit_id(42), commit_id(41), 0)
+        self.assertTrue(commit_graph.is_ancestor(commit_id(41), commit_id(42)))
+        self.assertEqual(len(commit_graph.load_graph()), 45)
+
+    def test_unsupported_graph_file(self):
+        with open(commit_graph.GRAPH_FILE, "wb") as f:
+            f.write(commit_graph.HEADER.pack(b"XXXX", commit_graph.GRAPH_VERSION, 0))
+        with self.assertRaises(ValueError):
+            commit_graph.load_graph()
+
+
+if __name__ == "__main__":
+    unittest.main()
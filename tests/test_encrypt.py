@@ -0,0 +1,137 @@
+"""
+The segmented v2 object format: round trips, header flags, ranges, and
+the errors a corrupted object or the wrong key must raise.
+"""
+
+import io
+import os
+import unittest
+
+from cryptography.exceptions import InvalidTag
+
+from crpt.core import encrypt
+from crpt.core.compress import CODEC_NONE, CODEC_ZLIB
+
+OBJECT_ID = "12" * 20
+KEY = b"k" * encrypt.KEY_SIZE
+SEGMENT = 1024
+
+
+def seal(content, password=OBJECT_ID, **kwargs):
+    out = io.BytesIO()
+    encrypt.encrypt_stream(io.BytesIO(content), out, password, KEY, **kwargs)
+    return out.getvalue()
+
+
+def unseal(stored, password=OBJECT_ID, key=KEY):
+    out = io.BytesIO()
+    size = encrypt.decrypt_stream(io.BytesIO(stored), out, password, key)
+    return out.getvalue(), size
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_sizes_around_segment_boundaries(self):
+        for size in (0, 1, SEGMENT - 1, SEGMENT, SEGMENT + 1, 3 * SEGMENT, 5 * SEGMENT + 7):
+            content = os.urandom(size)
+            stored = seal(content, segment_size=SEGMENT)
+            self.assertEqual(encrypt.object_format(stored), encrypt.FORMAT_V2)
+            segments = max(1, -(-size // SEGMENT))
+            self.assertEqual(len(stored), encrypt.V2_HEADER_SIZE + size + segments * encrypt.TAG_SIZE)
+            self.assertEqual(unseal(stored), (content, size))
+
+    def test_compressed_round_trip(self):
+        content = b"line of text\n" * 20000
+        stored = seal(content, compression="zlib")
+        self.assertEqual(encrypt.object_codec(stored), CODEC_ZLIB)
+        self.assertLess(len(stored), len(content))
+        self.assertEqual(unseal(stored), (content, len(content)))
+
+    def test_incompressible_content_is_stored_raw(self):
+        content = os.urandom(3 * SEGMENT)
+        stored = seal(content, segment_size=SEGMENT, compression="zlib")
+        self.assertEqual(encrypt.object_codec(stored), CODEC_NONE)
+        self.assertEqual(unseal(stored)[0], content)
+
+    def test_file_content_helpers(self):
+        content = b"hello world\n" * 100
+        stored = encrypt.encrypt_file_content(content, OBJECT_ID, KEY, "zlib")
+        self.assertEqual(encrypt.decrypt_file_content(stored, OBJECT_ID, KEY), content)
+
+
+class FlagsTest(unittest.TestCase):
+    def test_manifest_flag_is_kept_beside_the_codec(self):
+        stored = seal(b"manifest\n" * 5000, flags=encrypt.FLAG_MANIFEST, compression="zlib")
+        self.assertEqual(encrypt.object_flags(stored), encrypt.FLAG_MANIFEST)
+        self.assertEqual(encrypt.object_codec(stored), CODEC_ZLIB)
+        self.assertEqual(unseal(stored)[0], b"manifest\n" * 5000)
+
+    def test_late_bound_object_authenticates_its_hash(self):
+        content = os.urandom(2 * SEGMENT + 5)
+        stored = seal(content, password=None, segment_size=SEGMENT, object_id=lambda: OBJECT_ID)
+        self.assertEqual(encrypt.object_flags(stored), encrypt.FLAG_LATE_BOUND)
+        self.assertEqual(unseal(stored)[0], content)
+        with self.assertRaises(InvalidTag):
+            unseal(stored, password="34" * 20)
+
+    def test_older_formats_report_no_flags(self):
+        self.assertEqual(encrypt.object_flags(os.urandom(64)), 0)
+        self.assertEqual(encrypt.object_codec(os.urandom(64)), CODEC_NONE)
+
+
+class RangeTest(unittest.TestCase):
+    def test_ranges_across_segments(self):
+        content = os.urandom(4 * SEGMENT + 100)
+        stored = io.BytesIO(seal(content, segment_size=SEGMENT))
+        for offset, length in ((0, 10), (SEGMENT - 3, 6), (SEGMENT, SEGMENT), (4 * SEGMENT + 90, 50), (len(content), 5)):
+            got = encrypt.decrypt_range(stored, offset, length, OBJECT_ID, KEY)
+            self.assertEqual(got, content[offset:offset + length])
+
+    def test_range_of_compressed_object(self):
+        content = b"0123456789" * 30000
+        stored = io.BytesIO(seal(content, compression="zlib"))
+        got = encrypt.decrypt_range(stored, 123456, 1000, OBJECT_ID, KEY)
+        self.assertEqual(got, content[123456:124456])
+
+
+class CorruptionTest(unittest.TestCase):
+    def setUp(self):
+        self.content = os.urandom(3 * SEGMENT + 10)
+        self.stored = seal(self.content, segment_size=SEGMENT)
+
+    def test_wrong_master_key(self):
+        with self.assertRaises(InvalidTag):
+            unseal(self.stored, key=b"x" * encrypt.KEY_SIZE)
+
+    def test_wrong_object_hash(self):
+        with self.assertRaises(InvalidTag):
+            unseal(self.stored, password="34" * 20)
+
+    def test_flipped_byte_in_body_or_header(self):
+        for position in (encrypt.V2_HEADER_SIZE + SEGMENT + 3, encrypt.HEADER_SIZE + 1, len(self.stored) - 1):
+            damaged = bytearray(self.stored)
+            damaged[position] ^= 0x01
+            with self.assertRaises(InvalidTag):
+                unseal(bytes(damaged))
+
+    def test_dropped_final_segment(self):
+        record = SEGMENT + encrypt.TAG_SIZE
+        truncated = self.stored[:encrypt.V2_HEADER_SIZE + 3 * record]
+        # The last remaining segment was not sealed as the final one
+        with self.assertRaises(InvalidTag):
+            unseal(truncated)
+
+    def test_reordered_segments(self):
+        record = SEGMENT + encrypt.TAG_SIZE
+        start = encrypt.V2_HEADER_SIZE
+        first, second = self.stored[start:start + record], self.stored[start + record:start + 2 * record]
+        swapped = self.stored[:start] + second + first + self.stored[start + 2 * record:]
+        with self.assertRaises(InvalidTag):
+            unseal(swapped)
+
+    def test_truncated_header(self):
+        with self.assertRaises(ValueError):
+            unseal(self.stored[:encrypt.V2_HEADER_SIZE - 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
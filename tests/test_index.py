@@ -0,0 +1,91 @@
+"""
+The binary staging index: round trips, the stat cache, and damaged files.
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+
+from crpt.core import index
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs(".crpt")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def write_file(self, path, content):
+        with open(path, "wb") as f:
+            f.write(content)
+        return os.stat(path)
+
+    def test_round_trip_keeps_every_field(self):
+        st = self.write_file("a.txt", b"hello")
+        entries = {
+            "a.txt": index.make_entry("a.txt", st, "ab" * 20, index.FLAG_STAGED),
+            "dir/ünï.txt": index.IndexEntry("dir/ünï.txt", 7, 123, 456, "cd" * 20, 0),
+            "gone.txt": index.make_removal("gone.txt"),
+        }
+        index.write_index(entries)
+
+        loaded = index.read_index()
+        self.assertEqual(dict(loaded), entries)
+        self.assertEqual([entry.path for entry in loaded.staged()], ["a.txt", "gone.txt"])
+        self.assertTrue(loaded["gone.txt"].flags & index.FLAG_REMOVED)
+        self.assertEqual(loaded["gone.txt"].hash, "")
+
+    def test_stat_cache(self):
+        st = self.write_file("a.txt", b"hello")
+        os.utime("a.txt", ns=(st.st_atime_ns, st.st_mtime_ns - 10**9))
+        st = os.stat("a.txt")
+        index.write_index({"a.txt": index.make_entry("a.txt", st, "ab" * 20)})
+        loaded = index.read_index()
+        self.assertEqual(loaded.cached_hash("a.txt", st), "ab" * 20)
+
+        st = self.write_file("a.txt", b"hello, world")
+        self.assertIsNone(loaded.cached_hash("a.txt", st))
+        self.assertIsNone(loaded.cached_hash("other.txt", st))
+
+    def test_entry_written_in_the_same_tick_is_not_trusted(self):
+        st = self.write_file("a.txt", b"hello")
+        index.write_index({"a.txt": index.make_entry("a.txt", st, "ab" * 20)})
+        loaded = index.read_index()
+        loaded.mtime_ns = st.st_mtime_ns
+        self.assertIsNone(loaded.cached_hash("a.txt", st))
+
+    def test_legacy_index_is_read_as_staged_paths(self):
+        with open(index.INDEX_FILE, "w") as f:
+            f.write("a.txt\nb.txt\na.txt\n")
+        loaded = index.read_index()
+        self.assertEqual(sorted(loaded), ["a.txt", "b.txt"])
+        self.assertTrue(all(entry.flags == index.FLAG_STAGED for entry in loaded.values()))
+
+    def test_missing_index(self):
+        self.assertIsNone(index.read_index())
+
+    def test_unsupported_version(self):
+        with open(index.INDEX_FILE, "wb") as f:
+            f.write(index.HEADER.pack(index.INDEX_MAGIC, index.INDEX_VERSION + 1, 0))
+        with self.assertRaises(ValueError):
+            index.read_index()
+
+    def test_truncated_index(self):
+        st = self.write_file("a.txt", b"hello")
+        index.write_index({"a.txt": index.make_entry("a.txt", st, "ab" * 20)})
+        with open(index.INDEX_FILE, "rb") as f:
+            data = f.read()
+        with open(index.INDEX_FILE, "wb") as f:
+            f.write(data[:index.HEADER.size + index.ENTRY.size - 4])
+        with self.assertRaises(struct.error):
+            index.read_index()
+
+
+if __name__ == "__main__":
+    unittest.main()
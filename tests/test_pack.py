@@ -0,0 +1,124 @@
+"""
+Pack files, their index, and the deltas stored in them.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+
+from crpt.core import delta, encrypt, objects, pack
+
+
+def object_id(n):
+    return f"{n:02x}" * 20
+
+
+class DeltaTest(unittest.TestCase):
+    def test_round_trip(self):
+        base = b"".join(b"line %d\n" % i for i in range(200))
+        target = base.replace(b"line 50\n", b"changed\n") + b"appended\n"
+        encoded = delta.create_delta(base, target)
+        self.assertLess(len(encoded), len(target))
+        self.assertEqual(delta.apply_delta(base, encoded), target)
+
+    def test_empty_and_unrelated_contents(self):
+        for base, target in ((b"", b"new\n"), (b"old\n", b""), (b"a\nb\n", b"c\nd\n")):
+            self.assertEqual(delta.apply_delta(base, delta.create_delta(base, target)), target)
+
+    def test_unknown_instruction(self):
+        encoded = delta.create_delta(b"a\nb\n", b"a\nc\n")
+        damaged = encoded[:delta.DELTA_HEADER.size] + b"X" + encoded[delta.DELTA_HEADER.size + 1:]
+        with self.assertRaises(ValueError):
+            delta.apply_delta(b"a\nb\n", damaged)
+
+    def test_wrong_base(self):
+        encoded = delta.create_delta(b"one\ntwo\n", b"one\nthree\n")
+        with self.assertRaises(ValueError):
+            delta.apply_delta(b"", encoded)
+
+
+class PackTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs(".crpt")
+        objects.reload_packs()
+
+    def tearDown(self):
+        objects.reload_packs()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_full_entries_round_trip(self):
+        stored = {object_id(n): os.urandom(100 + n) for n in (0x00, 0x7f, 0x80, 0xff, 0x10)}
+        name, count, size = pack.write_pack(
+            ((h, io.BytesIO(data), None) for h, data in stored.items()), objects.PACK_DIR)
+        self.assertEqual(count, len(stored))
+        self.assertEqual(size, os.path.getsize(f"{objects.PACK_DIR}/{name}.pack"))
+
+        p, = pack.load_packs(objects.PACK_DIR)
+        try:
+            self.assertEqual(sorted(p), sorted(stored))
+            for object_hash, data in stored.items():
+                self.assertEqual(p.open(object_hash).read(), data)
+            self.assertNotIn(object_id(0x42), p)
+            self.assertIsNone(p.open(object_id(0x42)))
+        finally:
+            p.close()
+
+    def test_section_reader_seeks_within_its_entry(self):
+        pack.write_pack([(object_id(1), io.BytesIO(b"0123456789"), None)], objects.PACK_DIR)
+        p, = pack.load_packs(objects.PACK_DIR)
+        try:
+            reader = p.open(object_id(1))
+            self.assertEqual(reader.seek(0, io.SEEK_END), 10)
+            reader.seek(4)
+            self.assertEqual(reader.read(3), b"456")
+            self.assertEqual(reader.read(), b"789")
+        finally:
+            p.close()
+
+    def test_delta_entry_resolves_through_the_object_store(self):
+        key = encrypt.get_or_create_encryption_key()
+        base_id, target_id = object_id(1), object_id(2)
+        base = b"".join(b"line %d\n" % i for i in range(500))
+        target = base.replace(b"line 7\n", b"line seven\n")
+        encrypted_base = encrypt.encrypt_file_content(base, base_id, key)
+        encrypted_delta = encrypt.encrypt_file_content(delta.create_delta(base, target), target_id, key)
+        pack.write_pack([
+            (base_id, io.BytesIO(encrypted_base), None),
+            (target_id, io.BytesIO(encrypted_delta), base_id),
+        ], objects.PACK_DIR)
+
+        self.assertTrue(objects.is_delta(target_id))
+        self.assertFalse(objects.is_delta(base_id))
+        self.assertEqual(objects.read_plaintext(target_id), target)
+        # A delta is served as a complete object of its own
+        self.assertEqual(encrypt.decrypt_file_content(objects.read_object(target_id), target_id, key), target)
+        p, = objects.packs()
+        with self.assertRaises(ValueError):
+            p.open(target_id)
+
+    def test_index_is_required(self):
+        name, _, _ = pack.write_pack([(object_id(1), io.BytesIO(b"data"), None)], objects.PACK_DIR)
+        os.remove(f"{objects.PACK_DIR}/{name}.idx")
+        self.assertEqual(pack.load_packs(objects.PACK_DIR), [])
+
+    def test_bad_magic(self):
+        name, _, _ = pack.write_pack([(object_id(1), io.BytesIO(b"data"), None)], objects.PACK_DIR)
+        for suffix in (".pack", ".idx"):
+            path = f"{objects.PACK_DIR}/{name}{suffix}"
+            with open(path, "r+b") as f:
+                magic = f.read(4)
+                f.seek(0)
+                f.write(b"XXXX")
+            with self.assertRaises(ValueError):
+                pack.load_packs(objects.PACK_DIR)
+            with open(path, "r+b") as f:
+                f.write(magic)
+
+
+if __name__ == "__main__":
+    unittest.main()
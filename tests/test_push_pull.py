@@ -0,0 +1,222 @@
+"""
+Push and pull between two clones through the Django remote, run in process.
+
+Every client request is routed to the remote's views with Django's test
+client; the remote keeps its database and object store in a temporary
+directory. Skipped when Django and Django REST framework are not installed.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from importlib.util import find_spec
+from unittest import mock
+
+from crpt import crpt as cli
+from crpt.core import client, commit_graph, objects, refs, tree
+
+REPO = "shared"
+
+
+class ClientResponse:
+    """The parts of requests.Response the crpt client uses, over a Django response."""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        if response.streaming:
+            self._content = b"".join(response.streaming_content)
+        else:
+            self._content = response.content
+        self.text = self._content.decode(errors="replace")
+
+    def json(self):
+        return json.loads(self._content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self._content), chunk_size):
+            yield self._content[start:start + chunk_size]
+
+
+def setUpModule():
+    if not (find_spec("django") and find_spec("rest_framework")):
+        raise unittest.SkipTest("Django and Django REST framework are required")
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    global server_dir
+    server_dir = tempfile.TemporaryDirectory()
+    if not settings.configured:
+        settings.configure(
+            SECRET_KEY="test",
+            ALLOWED_HOSTS=["testserver"],
+            INSTALLED_APPS=["django.contrib.contenttypes", "django.contrib.auth", "rest_framework", "remote"],
+            ROOT_URLCONF="remote.urls",
+            DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3",
+                                   "NAME": os.path.join(server_dir.name, "db.sqlite3")}},
+            DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+            USE_TZ=True,
+        )
+        django.setup()
+    call_command("migrate", verbosity=0)
+
+
+def tearDownModule():
+    server_dir.cleanup()
+
+
+class TwoClonesTest(unittest.TestCase):
+    def setUp(self):
+        from django.test import Client
+        from remote import storage, views
+
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        upload_dir = os.path.join(self.tmp.name, "uploads")
+        self.server = Client()
+        patches = [
+            mock.patch.object(storage, "UPLOAD_DIR", upload_dir),
+            mock.patch.object(storage, "STORE_DIR", os.path.join(upload_dir, ".store")),
+            mock.patch.object(views, "UPLOAD_DIR", upload_dir),
+            mock.patch.object(client, "request", side_effect=self.route),
+            mock.patch.object(client, "map_parallel", side_effect=lambda f, items: [f(i) for i in items]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store_dir = os.path.join(upload_dir, ".store")
+
+        self.first = self.clone("first")
+        self.second = self.clone("second")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.reset_caches()
+        self.tmp.cleanup()
+
+    def route(self, method, path, retry=True, data=None, headers=None, **kwargs):
+        headers = dict(headers or {})
+        content_type = headers.pop("Content-Type", "application/octet-stream")
+        if kwargs.get("json") is not None:
+            data, content_type = json.dumps(kwargs["json"]).encode(), "application/json"
+        elif data is not None and not isinstance(data, bytes):
+            data = b"".join(data)
+        response = self.server.generic(method, "/" + path, data or b"", content_type=content_type, headers=headers)
+        return ClientResponse(response)
+
+    def reset_caches(self):
+        # Commands normally run one per process, and these caches belong to one repository
+        refs._head = refs._MISSING
+        refs._packed = None
+        refs._loose.clear()
+        objects._layout_checked = False
+        objects.reload_packs()
+        objects.take_published()
+        commit_graph.reload_graph()
+        tree._trees.clear()
+
+    def crpt(self, repo_dir, *args):
+        """Run one crpt command in repo_dir and return what it printed."""
+        os.chdir(repo_dir)
+        self.reset_caches()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), mock.patch.object(sys, "argv", ["crpt", *args]):
+            cli.main()
+        return out.getvalue()
+
+    def clone(self, name):
+        repo_dir = os.path.join(self.tmp.name, name)
+        os.makedirs(repo_dir)
+        self.crpt(repo_dir, "init")
+        with open(os.path.join(repo_dir, ".crpt", "config"), "a") as f:
+            f.write(f"\n[remote]\nrepo = {REPO}\n")
+        return repo_dir
+
+    def write(self, repo_dir, path, content):
+        path = os.path.join(repo_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def read(self, repo_dir, path):
+        with open(os.path.join(repo_dir, path)) as f:
+            return f.read()
+
+    def commit(self, repo_dir, message):
+        self.crpt(repo_dir, "add", ".")
+        self.assertIn("✅", self.crpt(repo_dir, "commit", "-m", message, "-j", "1"))
+
+    def head(self, repo_dir):
+        os.chdir(repo_dir)
+        self.reset_caches()
+        return refs.read_ref("refs/heads/main")
+
+    def share_key(self):
+        exported = self.crpt(self.first, "key", "export").strip()
+        self.assertIn("✅ Imported", self.crpt(self.second, "key", "import", exported))
+
+    def test_second_clone_needs_the_key(self):
+        secret = "top secret line\n" * 50
+        self.write(self.first, "notes.txt", secret)
+        self.commit(self.first, "first")
+        self.assertIn("✅ Push successful", self.crpt(self.first, "push"))
+
+        # The remote only ever holds ciphertext
+        for root, _, files in os.walk(self.store_dir):
+            for name in files:
+                with open(os.path.join(root, name), "rb") as f:
+                    self.assertNotIn(b"top secret", f.read())
+
+        output = self.crpt(self.second, "pull")
+        self.assertIn("❌ Could not decrypt", output)
+        self.assertIsNone(self.head(self.second))
+        self.assertFalse(os.path.exists(os.path.join(self.second, "notes.txt")))
+
+        self.share_key()
+        self.assertIn("✅ Pulled latest commit", self.crpt(self.second, "pull"))
+        self.assertEqual(self.read(self.second, "notes.txt"), secret)
+        self.assertEqual(self.head(self.second), self.head(self.first))
+
+    def test_fast_forward_ahead_and_diverged(self):
+        self.share_key()
+        self.write(self.first, "a.txt", "one\n")
+        self.write(self.first, "dir/b.txt", "two\n")
+        self.commit(self.first, "first")
+        self.crpt(self.first, "push")
+        self.crpt(self.second, "pull")
+        self.assertEqual(self.read(self.second, "dir/b.txt"), "two\n")
+
+        # Several remote commits at once are a fast-forward
+        self.write(self.first, "a.txt", "one, changed\n")
+        self.commit(self.first, "second")
+        os.remove(os.path.join(self.first, "dir/b.txt"))
+        self.commit(self.first, "third")
+        self.assertIn("✅ Push successful (2 commits", self.crpt(self.first, "push"))
+        self.assertIn("✅ Pulled latest commit", self.crpt(self.second, "pull"))
+        self.assertEqual(self.read(self.second, "a.txt"), "one, changed\n")
+        self.assertFalse(os.path.exists(os.path.join(self.second, "dir/b.txt")))
+        self.assertEqual(self.head(self.second), self.head(self.first))
+        self.assertIn("Already up to date.", self.crpt(self.second, "pull"))
+
+        # A local commit the remote lacks is never undone by a pull
+        self.write(self.second, "local.txt", "local\n")
+        self.commit(self.second, "local")
+        local = self.head(self.second)
+        self.assertIn("ahead of the remote", self.crpt(self.second, "pull"))
+        self.assertEqual(self.head(self.second), local)
+
+        # Nor is it when the remote has moved on too
+        self.write(self.first, "a.txt", "remote change\n")
+        self.commit(self.first, "remote")
+        self.crpt(self.first, "push")
+        self.assertIn("have diverged", self.crpt(self.second, "pull"))
+        self.assertEqual(self.head(self.second), local)
+        self.assertEqual(self.read(self.second, "a.txt"), "one, changed\n")
+        self.assertEqual(self.read(self.second, "local.txt"), "local\n")
+
+if __name__ == "__main__":
+    unittest.main()
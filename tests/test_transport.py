@@ -0,0 +1,158 @@
+"""
+The binary push/pull stream between the client (crpt/core/transport.py)
+and the server (remote/stream.py), and the /negotiate/ exchanges of push.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from crpt.core import objects, push, transport
+from remote import stream
+
+
+def object_id(n):
+    return f"{n:02x}" * 20
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs(".crpt")
+        objects.reload_packs()
+        self.stored = {
+            object_id(1): b"",
+            object_id(2): b"small object",
+            object_id(3): os.urandom(2 * transport.FRAME_SIZE + 17),
+        }
+        self.header = {"repo": "default", "commit": {"id": "c" * 40, "message": "ünïcode"}}
+
+    def tearDown(self):
+        objects.reload_packs()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def encoded(self):
+        return b"".join(transport.encode(self.header, list(self.stored),
+                                         lambda h: io.BytesIO(self.stored[h])))
+
+    def test_client_round_trip(self):
+        header, received = transport.receive(iter([self.encoded()]))
+        self.assertEqual(header, self.header)
+        self.assertEqual(received, list(self.stored))
+        for object_hash, data in self.stored.items():
+            self.assertEqual(objects.read_object(object_hash), data)
+
+    def test_chunk_boundaries_do_not_matter(self):
+        data = self.encoded()
+        chunks = (data[i:i + 7] for i in range(0, len(data), 7))
+        header, received = transport.receive(chunks)
+        self.assertEqual(received, list(self.stored))
+        self.assertEqual(objects.read_object(object_id(3)), self.stored[object_id(3)])
+
+    def test_client_to_server(self):
+        body = io.BytesIO(self.encoded())
+        self.assertEqual(stream.read_header(body), self.header)
+        received = {object_hash: b"".join(chunks) for object_hash, chunks in stream.iter_objects(body)}
+        self.assertEqual(received, self.stored)
+
+    def test_server_to_client(self):
+        pairs = [(h, io.BytesIO(data)) for h, data in self.stored.items()]
+        header, received = transport.receive(stream.encode(self.header, pairs))
+        self.assertEqual(header, self.header)
+        self.assertEqual(received, list(self.stored))
+
+    def test_malformed_streams_are_rejected_by_the_client(self):
+        data = self.encoded()
+        oversized = transport.MAGIC + transport._FRAME.pack(transport.DATA, transport.FRAME_SIZE + 1)
+        for bad in (b"XXXX" + data[4:], data[:len(data) // 2], oversized, transport.MAGIC + transport._frame(transport.END)):
+            with self.assertRaises(ValueError):
+                transport.receive(iter([bad]))
+        # A cut-off object is never published
+        self.assertFalse(objects.has_object(object_id(3)))
+        self.assertEqual([name for name in os.listdir(objects.OBJECTS_DIR) if name.startswith(".tmp-")], [])
+
+    def test_malformed_streams_are_rejected_by_the_server(self):
+        data = self.encoded()
+        with self.assertRaises(stream.StreamError):
+            stream.read_header(io.BytesIO(b"XXXX" + data[4:]))
+        with self.assertRaises(stream.StreamError):
+            stream.read_header(io.BytesIO(transport.MAGIC + transport._frame(transport.DATA, b"x")))
+
+        body = io.BytesIO(data[:len(data) // 2])
+        stream.read_header(body)
+        with self.assertRaises(stream.StreamError):
+            for _, chunks in stream.iter_objects(body):
+                for _ in chunks:
+                    pass
+
+        body = io.BytesIO(data)
+        stream.read_header(body)
+        with self.assertRaises(stream.StreamError):
+            # Skipping an object's data is a protocol error on the server
+            for _ in stream.iter_objects(body):
+                pass
+
+
+class NegotiateTest(unittest.TestCase):
+    def test_missing_objects_are_asked_in_batches(self):
+        hashes = [f"{n:040x}" for n in range(25)]
+        remote_has = set(hashes[::2])
+        batches = []
+
+        def post(path, json=None, **kwargs):
+            batches.append(json["hashes"])
+            return FakeResponse({"missing": [h for h in json["hashes"] if h not in remote_has]})
+
+        with mock.patch.object(push, "NEGOTIATE_BATCH_SIZE", 10), \
+             mock.patch.object(push.client, "post", side_effect=post), \
+             mock.patch.object(push.client, "map_parallel", side_effect=lambda f, items: [f(i) for i in items]):
+            missing = push.missing_on_remote("default", hashes + hashes[:5])
+
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(missing, set(hashes) - remote_has)
+
+    def test_failed_negotiation(self):
+        with mock.patch.object(push.client, "post", return_value=FakeResponse({"error": "boom"}, status_code=500)), \
+             mock.patch.object(push.client, "map_parallel", side_effect=lambda f, items: [f(i) for i in items]):
+            with self.assertRaises(RuntimeError):
+                push.missing_on_remote("default", ["ab" * 20])
+
+    def test_unpushed_commits_stop_at_the_remote_tip(self):
+        history = [f"{n:040x}" for n in range(1, 601)]
+        metas = {c: {"parent": history[i - 1] if i else None} for i, c in enumerate(history)}
+        remote_has = set(history[:300])
+        asked = []
+
+        def post(path, json=None, **kwargs):
+            asked.append(len(json["commits"]))
+            return FakeResponse({"missing_commits": [c for c in json["commits"] if c not in remote_has]})
+
+        with mock.patch.object(push.utils, "read_commit_meta", side_effect=metas.get), \
+             mock.patch.object(push.client, "post", side_effect=post):
+            unpushed = push.unpushed_commits("default", history[-1])
+            self.assertEqual([c for c, _ in unpushed], history[300:])
+            self.assertEqual(asked, [push.COMMIT_BATCH_SIZE, push.COMMIT_BATCH_SIZE])
+
+            asked.clear()
+            remote_has.update(history)
+            self.assertEqual(push.unpushed_commits("default", history[-1]), [])
+            self.assertEqual(asked, [push.COMMIT_BATCH_SIZE])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Resumable uploads against an in-memory remote that loses one chunk.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from crpt.core import upload
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeRemote:
+    """The /uploads/ endpoints, keeping chunks in memory; drops the first PUT of drop_index."""
+
+    def __init__(self, drop_index):
+        self.drop_index = drop_index
+        self.sessions = {}
+        self.stored = {}
+        self.puts = []
+
+    def post(self, path, json=None, **kwargs):
+        if path == "uploads/":
+            if json["hash"] in self.stored:
+                return FakeResponse({"status": "exists"})
+            session = self.sessions.setdefault(json["hash"], {
+                "size": json["size"], "chunk_size": json["chunk_size"], "chunks": {}
+            })
+            return FakeResponse({
+                "session": json["hash"],
+                "chunk_size": session["chunk_size"],
+                "chunks": max(1, -(-session["size"] // session["chunk_size"])),
+                "received": sorted(session["chunks"])
+            })
+        object_hash = path.split("/")[1]
+        session = self.sessions.pop(object_hash)
+        self.stored[object_hash] = b"".join(session["chunks"][i] for i in sorted(session["chunks"]))
+        return FakeResponse({"status": "ok"})
+
+    def put(self, path, data=None, headers=None, **kwargs):
+        _, object_hash, index, _ = path.split("/")
+        index = int(index)
+        self.puts.append(index)
+        if index == self.drop_index:
+            self.drop_index = None
+            raise requests.ConnectionError("connection dropped")
+        if hashlib.sha256(data).hexdigest() != headers["X-Chunk-SHA256"]:
+            return FakeResponse({"error": "Checksum mismatch"}, status_code=400)
+        self.sessions[object_hash]["chunks"][index] = data
+        return FakeResponse({"status": "ok"})
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs(".crpt")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_dropped_chunk_of_delta_object_is_resent_from_the_same_bytes(self):
+        object_hash = "ab" * 20
+        opened = []
+
+        def open_object(_):
+            # Like a delta, every open yields different bytes of the same length
+            opened.append(os.urandom(10))
+            return io.BytesIO(opened[-1])
+
+        remote = FakeRemote(drop_index=1)
+        with mock.patch.object(upload, "CHUNK_SIZE", 4), \
+             mock.patch.object(upload.objects, "is_delta", return_value=True), \
+             mock.patch.object(upload.objects, "open_object", side_effect=open_object), \
+             mock.patch.object(upload.client, "post", side_effect=remote.post), \
+             mock.patch.object(upload.client, "put", side_effect=remote.put), \
+             mock.patch.object(upload.client, "map_parallel", side_effect=lambda f, items: [f(i) for i in items]):
+            with self.assertRaises(requests.ConnectionError):
+                upload.upload_object("default", object_hash)
+            self.assertTrue(os.path.exists(os.path.join(upload.SPOOL_DIR, object_hash)))
+
+            sent = upload.upload_object("default", object_hash)
+
+        self.assertEqual(remote.puts, [0, 1, 1, 2])
+        self.assertEqual(sent, 6)
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(remote.stored[object_hash], opened[0])
+        self.assertFalse(os.path.exists(os.path.join(upload.SPOOL_DIR, object_hash)))
+
+
+if __name__ == "__main__":
+    unittest.main()